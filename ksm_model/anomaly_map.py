@@ -0,0 +1,79 @@
+"""
+Anomaly Maps
+The PatchCore heatmap starts as a small grid (heatmap_size x heatmap_size) of
+mean k-NN distances. This module renders it into the colormapped full-size
+heatmap and the leaf overlay (on first fetch, from a stored recipe), or
+encodes the raw grid compactly (base64 uint8/float16, or a small grayscale
+PNG) so the app can colorize and overlay it on the client.
+"""
+
+import base64
+
+import cv2
+import numpy as np
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+# off: rendered heatmap/overlay images, uint8/float16: inline base64 array, png: one small PNG
+ANOMALY_MAP_ENCODINGS = ('off', 'uint8', 'float16', 'png')
+
+# PNG artifact options for the grayscale map (lossless; tiny, so favour speed)
+ANOMALY_MAP_PNG_OPTIONS = {'format': 'png', 'quality': 100, 'max_dim': None}
+
+
+def normalize_anomaly_map(anomaly_map):
+    """Min-max scale a distance grid to uint8 0-255"""
+    lo, hi = float(anomaly_map.min()), float(anomaly_map.max())
+    return ((anomaly_map - lo) / (hi - lo + 1e-8) * 255).astype(np.uint8)
+
+
+def render_heatmap(anomaly_map, size):
+    """Colormapped (JET) BGR heatmap of a distance grid, upscaled to size (height, width)"""
+    heatmap = cv2.resize(normalize_anomaly_map(anomaly_map), (size[1], size[0]))
+    return cv2.applyColorMap(heatmap, cv2.COLORMAP_JET)
+
+
+def render_overlay(leaf_img_bgr, anomaly_map):
+    """Leaf blended with its heatmap (60/40)"""
+    return cv2.addWeighted(leaf_img_bgr, 0.6, render_heatmap(anomaly_map, leaf_img_bgr.shape[:2]), 0.4, 0)
+
+
+def pack_anomaly_map(anomaly_map):
+    """JSON-safe copy of a distance grid, for render recipes"""
+    return {
+        'shape': list(anomaly_map.shape),
+        'data': base64.b64encode(anomaly_map.astype('<f4').tobytes()).decode('ascii')
+    }
+
+
+def unpack_anomaly_map(packed):
+    """Inverse of pack_anomaly_map"""
+    return np.frombuffer(base64.b64decode(packed['data']), dtype='<f4').reshape(packed['shape'])
+
+
+def anomaly_map_png(anomaly_map):
+    """Grayscale uint8 image of the grid, for storing as a PNG artifact"""
+    return normalize_anomaly_map(anomaly_map)
+
+
+def describe_anomaly_map(anomaly_map, encoding, leaf_size):
+    """
+    JSON block for a raw anomaly map
+    uint8 values (and the PNG) map back to distances as min + value / 255 * (max - min);
+    float16 carries the distances themselves. scale is leaf pixels per grid cell (y, x).
+    Arrays are row-major, little-endian, base64-encoded.
+    """
+    rows, cols = anomaly_map.shape
+    block = {
+        'encoding': encoding,
+        'shape': [int(rows), int(cols)],
+        'scale': [round(leaf_size[0] / float(rows), 3), round(leaf_size[1] / float(cols), 3)],
+        'min': float(anomaly_map.min()),
+        'max': float(anomaly_map.max())
+    }
+    if encoding == 'uint8':
+        block['data'] = base64.b64encode(normalize_anomaly_map(anomaly_map).tobytes()).decode('ascii')
+    elif encoding == 'float16':
+        block['data'] = base64.b64encode(anomaly_map.astype('<f2').tobytes()).decode('ascii')
+    return block
@@ -9,12 +9,18 @@ import os
 import sys
 import json
 import time
+import base64
+import binascii
 import socket
 import threading
 import requests
 import tempfile
+import argparse
+import mimetypes
 import cv2
+import numpy as np
 from datetime import datetime
+from email.utils import formatdate
 from urllib.parse import urlparse, parse_qs
 from pathlib import Path
 
@@ -22,15 +28,6 @@ from pathlib import Path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(current_dir)
 
-# Import disease detection modules
-try:
-    from disease_pipeline import GrapeLeafPipeline
-    print("✅ Disease detection pipeline loaded")
-except ImportError as e:
-    print(f"❌ Failed to import disease pipeline: {e}")
-    print("   Make sure disease_pipeline.py is in the same directory")
-    sys.exit(1)
-
 # Import disease characteristics database
 try:
     from disease_characteristics import (
@@ -49,6 +46,84 @@ except ImportError as e:
     get_disease_treatment = lambda x: "Consult with agricultural specialist"
     get_disease_severity = lambda x: "unknown"
 
+from job_queue import JobQueue, MAX_JOB_ATTEMPTS, CALLBACK_ATTEMPTS
+from artifact_encoder import ArtifactEncoder, parse_artifact_options, ENCODER_WORKERS
+from artifact_store import ArtifactStore, content_key, DEFAULT_MAX_BYTES, DEFAULT_TTL
+from anomaly_map import (
+    describe_anomaly_map, anomaly_map_png, pack_anomaly_map, unpack_anomaly_map,
+    render_heatmap, render_overlay, ANOMALY_MAP_PNG_OPTIONS
+)
+from metrics import MetricsRegistry, MultiprocessMetrics, COUNT_BUCKETS, process_rss_bytes, process_pss_bytes, process_start_time
+from prefork import PreforkServer, fork_supported
+from replica_pool import ReplicaPool, LANES, INTERACTIVE_SHARE, BULK_AGING_SECONDS
+from resource_config import ThreadBudget, load_config_file
+from deadline import Deadline, DeadlineExceeded, parse_deadline_ms
+from static_ranges import parse_byte_range, is_not_modified
+from single_flight import SingleFlight, file_digest
+from quality_gate import QualityGate, ImageRejected, parse_gate_thresholds
+from request_profiler import RequestProfiler, is_admin
+from leaf_tracking import SAMPLE_FPS, FRAME_BATCH, LeafTracker, iter_frames
+from quality_profiles import (
+    QUALITY_PROFILES, DEFAULT_PROFILE, RESIDENT_PROFILES,
+    parse_profile_list, resolve_profile, required_sam_models, required_knn_backends
+)
+
+# HTTP request limits
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 32 * 1024 * 1024
+BODY_RECV_BYTES = 256 * 1024
+
+
+class PayloadTooLarge(ValueError):
+    """The announced request body exceeds MAX_BODY_BYTES (answered with 413)"""
+
+    def __init__(self, path, content_length):
+        super().__init__(f"Request body of {content_length} bytes exceeds the {MAX_BODY_BYTES} byte limit")
+        self.path = path
+
+HTTP_REASONS = {
+    200: 'OK',
+    202: 'Accepted',
+    206: 'Partial Content',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    413: 'Payload Too Large',
+    416: 'Range Not Satisfiable',
+    422: 'Unprocessable Entity',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+    504: 'Gateway Timeout'
+}
+
+# Static artifacts are content-addressed, so clients may cache them for a day
+STATIC_CACHE_CONTROL = 'public, max-age=86400'
+
+mimetypes.add_type('image/webp', '.webp')
+
+LISTEN_BACKLOG = 128
+
+# /readyz reports 503 while more async jobs than this are waiting
+READY_MAX_QUEUE_DEPTH = 50
+
+# Completion webhook delivery (attempts and backoff are kept by the job queue)
+CALLBACK_TIMEOUT = 10
+CALLBACK_POLL_INTERVAL = 1.0
+
+# Leaf crops accepted by one POST /api/classify-leaves (the body is capped by MAX_BODY_BYTES too)
+MAX_CLASSIFY_LEAVES = 32
+
+# POST /api/process-video: video bodies by Content-Type, or a JSON burst of at most MAX_BURST_FRAMES frames
+VIDEO_CONTENT_TYPES = {
+    'video/mp4': '.mp4',
+    'video/quicktime': '.mov',
+    'video/webm': '.webm',
+    'video/x-matroska': '.mkv',
+    'video/x-msvideo': '.avi'
+}
+MAX_BURST_FRAMES = 60
+MAX_SAMPLE_FPS = 30.0
 
 def normalize_disease_name(name):
     """
@@ -102,44 +177,145 @@ def normalize_disease_name(name):
     # Return original if no match found
     return name
 
+
+def decode_base64_image(data, flags=cv2.IMREAD_COLOR):
+    """
+    Decode a base64-encoded image file (JPEG, PNG, WebP); data: URI prefixes are allowed
+    Raises ValueError if it is not base64 or not an image
+    """
+    if not isinstance(data, str):
+        raise ValueError("expected a base64-encoded image")
+    if data.startswith('data:'):
+        data = data.split(',', 1)[-1]
+    try:
+        raw = base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("invalid base64")
+    image = cv2.imdecode(np.frombuffer(raw, dtype=np.uint8), flags)
+    if image is None:
+        raise ValueError("not a decodable image")
+    return image
+
 class DiseaseDetectionAPI:
     """API server for grape leaf disease detection"""
     
-    def __init__(self, host='0.0.0.0', port=8888):
+    def __init__(self, host='0.0.0.0', port=8888, job_workers=1, jobs_db=None,
+                 encoder_workers=ENCODER_WORKERS, static_max_bytes=DEFAULT_MAX_BYTES,
+                 static_ttl=DEFAULT_TTL, replicas=1, replica_devices=None,
+                 thread_budget=None, warmup_sizes=None, ready_max_queue_depth=READY_MAX_QUEUE_DEPTH,
+                 profile=DEFAULT_PROFILE, resident_profiles=RESIDENT_PROFILES, default_deadline_ms=None,
+                 interactive_share=INTERACTIVE_SHARE, bulk_aging_seconds=BULK_AGING_SECONDS,
+                 speculation='auto', gate_thresholds=None, profile_sample_rate=0.0):
         self.host = host
         self.port = port
         self.server_socket = None
         self.running = False
         
+        # Persistent queue for asynchronous jobs
+        self.job_workers = job_workers
+        self.job_queue = JobQueue(jobs_db or os.path.join(current_dir, 'jobs.sqlite3'))
+        self.job_threads = []
+        
         # Static files directory
         self.static_dir = os.path.join(current_dir, 'static')
         os.makedirs(self.static_dir, exist_ok=True)
         
-        # Counter for unique filenames
-        self.image_counter = 0
-        self.counter_lock = threading.Lock()
+        # Bounded, content-addressed store for leaf/heatmap/overlay images
+        self.artifact_store = ArtifactStore(self.static_dir, max_bytes=static_max_bytes, ttl=static_ttl)
+        self.artifact_encoder = ArtifactEncoder(self.artifact_store, workers=encoder_workers)
+        
+        # Per-thread state of the request being handled (response status, profiling)
+        self.request_local = threading.local()
+        
+        # cProfile + torch profiler captures: ?debug_profile=1 with X-Admin-Token, or sampled
+        self.request_profiler = RequestProfiler(self.artifact_store, sample_rate=profile_sample_rate)
+        
+        # Identical images in flight (same URL or same bytes) are processed once
+        self.single_flight = SingleFlight()
+        
+        # Rejects blurry, badly exposed and non-leaf photos before any model runs (None = off)
+        self.quality_gate = QualityGate(gate_thresholds) if gate_thresholds is not None else None
+        # Moving average of pipeline seconds per image, credited to the gate per rejection
+        self.pipeline_seconds = None
+        
+        # Budget for /api/process requests that don't send X-Deadline-Ms or ?deadline_ms=
+        self.default_deadline_ms = default_deadline_ms
+        
+        # Quality profiles whose models stay loaded; the default is always one of them
+        self.default_profile = profile
+        self.resident_profiles = list(resident_profiles)
+        if profile not in self.resident_profiles:
+            self.resident_profiles.append(profile)
+        
+        # CPU thread budget for torch, OpenCV, BLAS and k-NN queries
+        self.thread_budget = thread_budget or ThreadBudget(replicas=replicas)
+        
+        # Readiness: set once warmup has run through every replica
+        self.ready = False
+        self.warmup_seconds = None
+        self.ready_max_queue_depth = ready_max_queue_depth
+        
+        # Cold start is measured from process start to the first successful /api/process
+        self.process_started_at = process_start_time()
+        self.cold_start_seconds = None
+        self.cold_start_lock = threading.Lock()
         
         # Initialize disease detection pipeline
         try:
+            # Imported here rather than at module load, so torch and friends only
+            # start once the thread budget has exported its environment variables
+            from disease_pipeline import GrapeLeafPipeline, PATCHCORE_SNAPSHOT, WARMUP_SIZES
+            print("✅ Disease detection pipeline loaded")
+            self.warmup_sizes = WARMUP_SIZES if warmup_sizes is None else warmup_sizes
+            
             # Model file paths (all in current directory)
             models = {
                 'yolo_leaf': os.path.join(current_dir, 'yolo_leaf_detection.pt'),
-                # 'sam': os.path.join(current_dir, 'sam2.1_l.pt'),
-                'sam': os.path.join(current_dir, 'mobile_sam.pt'),
+                # SAM variants used by the resident profiles (mobile_sam.pt, sam2.1_l.pt)
+                'sam': [os.path.join(current_dir, name) for name in required_sam_models(self.resident_profiles)],
                 'patchcore': os.path.join(current_dir, 'patchcore_anomaly.pth'),
                 'yolo_disease': os.path.join(current_dir, 'yolo_disease_detection.pt')
             }
             
+            # Prefer the prebuilt snapshot (build_snapshot.py): one mmap read, no index fit
+            snapshot_path = os.path.join(current_dir, PATCHCORE_SNAPSHOT)
+            if os.path.exists(snapshot_path):
+                models['patchcore'] = snapshot_path
+            else:
+                print(f"⚠️ {PATCHCORE_SNAPSHOT} not found; loading the training checkpoint (run build_snapshot.py for faster starts)")
+            
             print(f"📂 Model directory: {current_dir}")
+            print(f"🎚️ Quality profiles: {', '.join(self.resident_profiles)} (default: {self.default_profile})")
             print("📦 Initializing AI models...")
             
-            self.detector = GrapeLeafPipeline(
-                models['yolo_leaf'],
-                models['sam'],
-                models['patchcore'],
-                models['yolo_disease']
+            # Independent pipeline replicas; each request checks one out
+            self.replica_pool = ReplicaPool(
+                lambda index, device: GrapeLeafPipeline(
+                    models['yolo_leaf'],
+                    models['sam'],
+                    models['patchcore'],
+                    models['yolo_disease'],
+                    device=device,
+                    knn_jobs=self.thread_budget.knn_jobs,
+                    knn_backends=required_knn_backends(self.resident_profiles),
+                    speculation=speculation
+                ),
+                size=replicas,
+                devices=replica_devices,
+                interactive_share=interactive_share,
+                aging_seconds=bulk_aging_seconds
             )
-            print("✅ All models loaded successfully")
+            self.detector = self.replica_pool.primary
+            
+            # Applied after model loading, since importing ultralytics resets OpenCV threads
+            self.thread_budget.apply_runtime()
+            print(f"✅ All models loaded successfully ({time.time() - self.process_started_at:.1f}s after process start)")
+            
+            self.setup_metrics()
+        except ImportError as e:
+            print(f"❌ Failed to import disease pipeline: {e}")
+            print("   Make sure disease_pipeline.py is in the same directory")
+            sys.exit(1)
         except FileNotFoundError as e:
             print(f"❌ Model file not found: {e}")
             print("   Please ensure all .pt and .pth files are in the directory")
@@ -148,82 +324,361 @@ class DiseaseDetectionAPI:
             print(f"❌ Failed to initialize detection pipeline: {e}")
             sys.exit(1)
     
+    def setup_metrics(self):
+        """Register the metrics exported on /metrics"""
+        self.metrics = MetricsRegistry()
+        self.worker_metrics = None
+        m = self.metrics
+        
+        self.requests_total = m.counter('http_requests_total', 'HTTP requests by endpoint and status code')
+        self.request_latency = m.histogram('http_request_duration_seconds', 'HTTP request latency by endpoint')
+        self.in_flight = m.gauge('http_requests_in_flight', 'HTTP requests currently being handled')
+        self.stage_latency = m.histogram('stage_duration_seconds', 'Time spent in each processing stage')
+        self.leaves_per_image = m.histogram('leaves_per_image', 'Leaves detected per processed image', COUNT_BUCKETS)
+        self.images_total = m.counter('images_processed_total', 'Images processed by outcome')
+        self.errors_total = m.counter('errors_total', 'Errors by type')
+        self.artifact_cache = m.counter('artifact_cache_total', 'Artifact store lookups (hit = reused an existing file, deferred = render on first fetch)')
+        self.artifact_renders = m.counter('artifact_renders_total', 'Deferred heatmaps and overlays rendered on fetch')
+        self.profile_images = m.counter('profile_images_total', 'Images processed by quality profile')
+        self.deadline_outcomes = m.counter('deadline_outcomes_total', 'Requests with a deadline by outcome (met, degraded, exceeded, cancelled)')
+        self.coalesced_total = m.counter('coalesced_requests_total', 'Images that reused an identical in-flight computation, by match (url, content)')
+        self.classify_batch = m.histogram('classify_leaves_per_request', 'Leaf crops per /api/classify-leaves request', COUNT_BUCKETS)
+        self.tracks_per_video = m.histogram('leaf_tracks_per_video', 'Leaves tracked per /api/process-video request', COUNT_BUCKETS)
+        self.video_realtime = m.histogram('video_realtime_factor', 'Seconds of video processed per second of pipeline time',
+                                          (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0))
+        self.profiled_total = m.counter('profiled_requests_total', 'Requests run under the profiler, by trigger (admin, sampled)')
+        self.profiler_export = m.histogram('profiler_export_seconds', 'Time spent writing profile and trace files after a profiled request')
+        self.profiler_slowdown = m.histogram('profiler_slowdown_ratio', 'Pipeline time of profiled images relative to the unprofiled moving average',
+                                             (1.0, 1.1, 1.25, 1.5, 2.0, 3.0, 5.0, 10.0))
+        m.gauge('single_flight_in_flight', 'Distinct image computations currently in flight', self.single_flight.in_flight)
+        
+        m.gauge('job_queue_depth', 'Jobs waiting in the async job queue', self.job_queue.depth)
+        m.gauge('artifact_encoder_pending', 'Artifacts queued or being encoded', self.artifact_encoder.pending_count)
+        m.gauge('artifact_store_bytes', 'Bytes held by the static artifact store', self.artifact_store.total_bytes)
+        m.gauge('process_resident_memory_bytes', 'Resident set size of the server process', process_rss_bytes)
+        m.gauge('process_proportional_memory_bytes', 'Proportional set size (shared pages split between workers)', process_pss_bytes)
+        m.gauge('worker_pid', 'PID of the server process (per worker in pre-fork mode)', os.getpid)
+        m.gauge('ready', 'Whether this process reports ready on /readyz', lambda: int(self.ready))
+        m.gauge('warmup_seconds', 'Duration of the startup warmup',
+                lambda: [] if self.warmup_seconds is None else [({}, self.warmup_seconds)])
+        m.gauge('cold_start_seconds', 'Process start to first successful /api/process',
+                lambda: [] if self.cold_start_seconds is None else [({}, self.cold_start_seconds)])
+        m.gauge('torch_num_threads', 'Torch thread pool sizes (intra-op and inter-op)', self.torch_thread_settings)
+        m.gauge('opencv_num_threads', 'OpenCV thread pool size', cv2.getNumThreads)
+        m.gauge('thread_budget', 'Configured CPU thread budget by setting',
+                lambda: [({'setting': k}, v) for k, v in self.thread_budget.as_dict().items()])
+        
+        self.replica_wait = m.histogram('replica_wait_seconds', 'Time requests waited to check out a model replica, by lane')
+        self.image_latency = m.histogram('image_duration_seconds', 'Download to result time of one image, by priority lane')
+        m.gauge('replica_waiters', 'Checkouts waiting for a model replica, by lane', self.replica_pool.waiting_counts)
+        self.gate_total = m.counter('quality_gate_total', 'Quality gate verdicts (passed, blurry, underexposed, overexposed, no_vegetation, unreadable)')
+        self.gate_saved = m.counter('quality_gate_saved_seconds_total', 'Estimated pipeline seconds not spent on rejected images')
+        m.gauge('speculative_disease_runs', 'Speculative disease YOLO runs by result (used, cancelled, discarded)', self.speculation_counts)
+        m.gauge('replicas_total', 'Model replicas loaded in this process', lambda: len(self.replica_pool))
+        m.gauge('replicas_busy', 'Model replicas currently checked out', self.replica_pool.busy_count)
+        
+        self.replica_pool.wait_observer = self.replica_wait.observe
+        for replica in self.replica_pool:
+            replica.stage_observer = lambda stage, seconds: self.stage_latency.observe(seconds, stage=stage)
+    
+    def speculation_counts(self):
+        """Speculative disease runs summed over replicas, as labelled gauge samples"""
+        totals = {}
+        for replica in self.replica_pool:
+            for result, count in replica.speculation_stats.items():
+                totals[result] = totals.get(result, 0) + count
+        return [({'result': result}, count) for result, count in totals.items()]
+    
+    def torch_thread_settings(self):
+        """Torch intra-/inter-op thread counts as labelled gauge samples"""
+        torch = sys.modules.get('torch')
+        if torch is None:
+            return []
+        return [
+            ({'pool': 'intra_op'}, torch.get_num_threads()),
+            ({'pool': 'inter_op'}, torch.get_num_interop_threads())
+        ]
+    
+    def endpoint_label(self, path):
+        """Collapse request paths into a bounded set of metric labels"""
+        path = path.split('?', 1)[0]
+        for prefix in ('/api/process-video', '/api/process', '/api/classify-leaves', '/api/jobs', '/api/debug', '/static/', '/metrics',
+                       '/healthz', '/readyz'):
+            if path.startswith(prefix):
+                return prefix.rstrip('/')
+        return '/' if path == '/' else 'other'
+    
     def start_server(self):
         """Start the API server"""
         try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(10)
-            self.running = True
-            
-            print(f"🌐 Disease Detection API Server started")
-            print(f"📡 Listening on {self.host}:{self.port}")
-            print(f"🔗 API Endpoint: http://{self.get_local_ip()}:{self.port}/api/process?url=<url>")
-            print(f"🔗 Bulk Endpoint: http://{self.get_local_ip()}:{self.port}/api/process?urls=<url1,url2,url3>")
-            print(f"📱 Accessible from other devices on local network")
-            print("-" * 60)
-            
-            while self.running:
-                try:
-                    client_socket, addr = self.server_socket.accept()
-                    print(f"📱 Request from {addr[0]}")
-                    
-                    # Handle client in separate thread
-                    client_thread = threading.Thread(
-                        target=self.handle_request,
-                        args=(client_socket, addr)
-                    )
-                    client_thread.daemon = True
-                    client_thread.start()
-                    
-                except Exception as e:
-                    if self.running:
-                        print(f"❌ Server error: {e}")
-                        
+            self.open_socket()
+            self.print_banner()
+            self.serve_forever()
         except Exception as e:
             print(f"❌ Failed to start server: {e}")
         finally:
             self.cleanup()
     
+    def open_socket(self):
+        """Create, bind and listen on the server socket"""
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((self.host, self.port))
+        self.server_socket.listen(LISTEN_BACKLOG)
+    
+    def print_banner(self):
+        """Print the endpoints the server is reachable on"""
+        print(f"🌐 Disease Detection API Server started")
+        print(f"📡 Listening on {self.host}:{self.port}")
+        print(f"🔗 API Endpoint: http://{self.get_local_ip()}:{self.port}/api/process?url=<url>")
+        print(f"🔗 Bulk Endpoint: http://{self.get_local_ip()}:{self.port}/api/process?urls=<url1,url2,url3>")
+        print(f"🔗 Leaf Crops Endpoint: http://{self.get_local_ip()}:{self.port}/api/classify-leaves (POST)")
+        print(f"🔗 Video Endpoint: http://{self.get_local_ip()}:{self.port}/api/process-video (POST)")
+        print(f"🔗 Jobs Endpoint: http://{self.get_local_ip()}:{self.port}/api/jobs")
+        print(f"📈 Metrics: http://{self.get_local_ip()}:{self.port}/metrics")
+        print(f"💓 Health: http://{self.get_local_ip()}:{self.port}/healthz, /readyz")
+        print(f"📱 Accessible from other devices on local network")
+        print("-" * 60)
+    
+    def serve_forever(self, recover_jobs=True, warmup_sizes=None):
+        """Accept connections on the (possibly inherited) listening socket"""
+        self.running = True
+        self.start_job_workers(recover=recover_jobs)
+        
+        if not self.ready:
+            # Warm up in the background; /readyz answers 503 until it finishes
+            threading.Thread(target=self.run_warmup, args=(warmup_sizes,), name='warmup', daemon=True).start()
+        
+        while self.running:
+            try:
+                client_socket, addr = self.server_socket.accept()
+                print(f"📱 Request from {addr[0]}")
+                
+                # Handle client in separate thread
+                client_thread = threading.Thread(
+                    target=self.handle_request,
+                    args=(client_socket, addr)
+                )
+                client_thread.daemon = True
+                client_thread.start()
+                
+            except Exception as e:
+                if self.running:
+                    print(f"❌ Server error: {e}")
+    
+    def run_warmup(self, sizes=None):
+        """Warm up every replica in parallel, then mark this process ready"""
+        sizes = self.warmup_sizes if sizes is None else sizes
+        start = time.perf_counter()
+        if sizes:
+            print(f"🔥 Warming up {len(self.replica_pool)} replica(s) with {len(sizes)} synthetic frame size(s)...")
+            threads = [
+                threading.Thread(target=self.warmup_replica, args=(sizes,), name=f"warmup-{i}")
+                for i in range(len(self.replica_pool))
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        
+        self.warmup_seconds = time.perf_counter() - start
+        self.ready = True
+        print(f"✅ Ready (warmup took {self.warmup_seconds:.1f}s)")
+    
+    def warmup_replica(self, sizes):
+        """Warm one replica; each caller holds its replica until done, so none is warmed twice"""
+        try:
+            with self.replica_pool.checkout() as detector:
+                detector.warmup(sizes, [QUALITY_PROFILES[name]['inference'] for name in self.resident_profiles])
+        except Exception as e:
+            # The models loaded fine; a failed synthetic pass should not keep the server unready
+            print(f"⚠️ Warmup failed: {e}")
+            self.errors_total.inc(type='warmup')
+    
     def handle_request(self, client_socket, addr):
         """Handle HTTP requests"""
+        endpoint = None
+        start_time = time.perf_counter()
+        self.request_local.status = None
+        self.request_local.profiling = False
+        self.in_flight.inc()
         try:
             # Receive HTTP request
-            request = client_socket.recv(4096).decode('utf-8')
+            request = self.read_request(client_socket)
             
             if not request:
                 return
             
-            # Parse HTTP request
-            lines = request.split('\n')
-            if not lines:
-                return
-                
-            request_line = lines[0].strip()
-            method, path, _ = request_line.split(' ', 2)
+            method, path, headers, body = request
+            endpoint = self.endpoint_label(path)
             
             print(f"📝 {method} {path}")
             
             # Handle different endpoints
-            if method == 'GET' and path == '/':
+            if method == 'GET' and path.split('?', 1)[0] == '/metrics':
+                self.handle_metrics(client_socket)
+            elif method == 'GET' and path.split('?', 1)[0] == '/healthz':
+                self.handle_liveness(client_socket)
+            elif method == 'GET' and path.split('?', 1)[0] == '/readyz':
+                self.handle_readiness(client_socket)
+            elif method == 'GET' and path == '/':
                 self.handle_home_page(client_socket)
+            elif method == 'POST' and path.split('?', 1)[0] == '/api/process-video':
+                self.handle_process_video(client_socket, path, headers, body)
             elif method == 'GET' and path.startswith('/api/process'):
-                self.handle_disease_detection(client_socket, path)
-            elif method == 'GET' and path.startswith('/static/'):
-                self.handle_static_file(client_socket, path)
+                self.handle_disease_detection(client_socket, path, headers)
+            elif method == 'POST' and path.split('?', 1)[0] == '/api/classify-leaves':
+                self.handle_classify_leaves(client_socket, path, headers, body)
+            elif method == 'POST' and path.split('?', 1)[0] == '/api/jobs':
+                self.handle_job_submit(client_socket, path, body)
+            elif method == 'GET' and path.startswith('/api/jobs/'):
+                self.handle_job_status(client_socket, path)
+            elif method == 'GET' and path.split('?', 1)[0] == '/api/debug/profiles':
+                self.handle_profile_list(client_socket, headers)
+            elif method in ('GET', 'HEAD') and path.startswith('/static/'):
+                self.handle_static_file(client_socket, path, headers, head_only=(method == 'HEAD'))
             elif method == 'OPTIONS':
                 self.send_cors_response(client_socket)
             else:
                 self.send_error_response(client_socket, 404, "Endpoint not found")
                 
+        except PayloadTooLarge as e:
+            print(f"🚫 {e}")
+            endpoint = self.endpoint_label(e.path)
+            self.send_error_response(client_socket, 413, str(e))
         except Exception as e:
             print(f"❌ Request handling error: {e}")
+            self.errors_total.inc(type='request')
             self.send_error_response(client_socket, 500, str(e))
         finally:
             client_socket.close()
+            self.in_flight.dec()
+            if endpoint is not None:
+                self.request_latency.observe(time.perf_counter() - start_time, endpoint=endpoint)
+                self.requests_total.inc(endpoint=endpoint, status=str(self.request_local.status or 0))
+                if endpoint == '/api/process' and self.request_local.status == 200:
+                    self.record_cold_start()
     
-    def handle_disease_detection(self, client_socket, path):
+    def record_cold_start(self):
+        """Report the time from process start to the first successful /api/process"""
+        if self.cold_start_seconds is not None:
+            return
+        with self.cold_start_lock:
+            if self.cold_start_seconds is None:
+                self.cold_start_seconds = time.time() - self.process_started_at
+                print(f"🥶 Cold start: {self.cold_start_seconds:.2f}s from process start to first successful /api/process")
+    
+    def read_request(self, client_socket):
+        """Read an HTTP request and return (method, path, headers, body)"""
+        data = b''
+        while b'\r\n\r\n' not in data:
+            chunk = client_socket.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+            if len(data) > MAX_HEADER_BYTES:
+                raise ValueError("Request headers too large")
+        
+        if not data:
+            return None
+        
+        head, _, body = data.partition(b'\r\n\r\n')
+        lines = head.decode('utf-8', errors='replace').split('\r\n')
+        method, path, _ = lines[0].strip().split(' ', 2)
+        
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        
+        # Read the rest of the body if a Content-Length was announced
+        content_length = int(headers.get('content-length', 0) or 0)
+        if content_length > MAX_BODY_BYTES:
+            raise PayloadTooLarge(path, content_length)
+        if len(body) < content_length:
+            # Receive straight into one buffer; appending to bytes copies the whole body per chunk
+            buffer = bytearray(content_length)
+            buffer[:len(body)] = body
+            view = memoryview(buffer)
+            received = len(body)
+            while received < content_length:
+                count = client_socket.recv_into(view[received:], min(BODY_RECV_BYTES, content_length - received))
+                if count == 0:
+                    break
+                received += count
+            view.release()
+            del buffer[received:]
+            body = buffer
+        
+        return method, path, headers, body
+    
+    def enable_worker_metrics(self, directory, worker):
+        """Pre-fork worker: share metrics through directory so /metrics covers all workers"""
+        self.worker_metrics = MultiprocessMetrics(directory, self.metrics, worker)
+        self.worker_metrics.start()
+    
+    def handle_metrics(self, client_socket):
+        """Expose counters, gauges and histograms in Prometheus text format"""
+        if self.worker_metrics is not None:
+            body = self.worker_metrics.render().encode('utf-8')
+        else:
+            body = self.metrics.render().encode('utf-8')
+        response = f"""HTTP/1.1 200 OK\r
+Content-Type: text/plain; version=0.0.4; charset=utf-8\r
+Content-Length: {len(body)}\r
+Cache-Control: no-cache\r
+\r
+"""
+        self.request_local.status = 200
+        client_socket.sendall(response.encode('utf-8') + body)
+    
+    def handle_liveness(self, client_socket):
+        """Handle GET /healthz: the process is up and answering requests"""
+        self.send_json_response(client_socket, {
+            'status': 'alive',
+            'pid': os.getpid(),
+            'uptime_seconds': round(time.time() - self.process_started_at, 3)
+        })
+    
+    def handle_readiness(self, client_socket):
+        """Handle GET /readyz: warmup finished and the job queue is not backed up"""
+        queue_depth = self.job_queue.depth()
+        if not self.ready:
+            status = 'warming_up'
+        elif queue_depth > self.ready_max_queue_depth:
+            status = 'overloaded'
+        else:
+            status = 'ready'
+        
+        self.send_json_response(client_socket, {
+            'status': status,
+            'ready': status == 'ready',
+            'pid': os.getpid(),
+            'warmup_seconds': self.warmup_seconds,
+            'queue_depth': queue_depth,
+            'max_queue_depth': self.ready_max_queue_depth,
+            'replicas_busy': self.replica_pool.busy_count(),
+            'replicas_total': len(self.replica_pool)
+        }, 200 if status == 'ready' else 503)
+    
+    def disconnect_probe(self, client_socket):
+        """Callable reporting whether the client closed its connection, or None if unsupported"""
+        flags = socket.MSG_PEEK | getattr(socket, 'MSG_DONTWAIT', 0)
+        if not hasattr(socket, 'MSG_DONTWAIT'):
+            return None
+        
+        def probe():
+            try:
+                # An orderly shutdown reads as b''; pending bytes or EAGAIN mean it is still open
+                return client_socket.recv(1, flags) == b''
+            except (BlockingIOError, InterruptedError, socket.timeout):
+                return False
+            except OSError:
+                return True
+        return probe
+    
+    def handle_disease_detection(self, client_socket, path, headers=None):
         """Handle disease detection API request"""
         try:
             # Parse query parameters
@@ -234,6 +689,24 @@ class DiseaseDetectionAPI:
             query_string = path.split('?', 1)[1]
             params = parse_qs(query_string)
             
+            try:
+                profile = resolve_profile(params, self.default_profile, self.resident_profiles)
+                artifact_options = parse_artifact_options(params, QUALITY_PROFILES[profile]['artifacts'])
+                deadline_ms = parse_deadline_ms(headers, params, self.default_deadline_ms)
+                lane = params.get('priority', ['interactive'])[0]
+                if lane not in LANES:
+                    raise ValueError(f"priority must be one of: {', '.join(LANES)}")
+                profile_trigger = self.request_profiler.trigger(headers, params)
+            except ValueError as e:
+                self.send_error_response(client_socket, 400, str(e))
+                return
+            except PermissionError as e:
+                self.send_error_response(client_socket, 403, str(e))
+                return
+            
+            # Without a budget the deadline still cancels work for disconnected clients
+            deadline = Deadline(deadline_ms, self.disconnect_probe(client_socket))
+            
             # Check for bulk processing (urls parameter)
             if 'urls' in params:
                 urls_param = params['urls'][0]
@@ -244,29 +717,23 @@ class DiseaseDetectionAPI:
                     return
                 
                 print(f"🖼️ Processing {len(image_urls)} images in bulk")
-                results = self.process_bulk_images(image_urls)
+                results = self.process_bulk_images(image_urls, artifact_options, profile, deadline, lane='bulk')
                 
             # Check for single processing (url parameter)
             elif 'url' in params:
                 image_url = params['url'][0]
                 print(f"🖼️ Processing single image: {image_url}")
                 
-                # Download image
-                temp_image_path = self.download_image(image_url)
-                if not temp_image_path:
+                # Download and detect diseases (under the profiler for admin and sampled requests)
+                results, capture = self.profiled(
+                    profile_trigger,
+                    lambda: self.process_image_url(image_url, artifact_options, profile, deadline, lane)
+                )
+                if capture is not None and capture['trigger'] == 'admin' and results is not None:
+                    results['debug_profile'] = capture
+                if results is None:
                     self.send_error_response(client_socket, 400, "Failed to download image")
                     return
-                
-                # Detect diseases
-                results = self.detect_diseases(temp_image_path)
-                
-                # Clean up temp file (only if it's a downloaded temp file, not a local file)
-                try:
-                    parsed = urlparse(image_url)
-                    if parsed.scheme != 'file' and temp_image_path.startswith(tempfile.gettempdir()):
-                        os.remove(temp_image_path)
-                except:
-                    pass
                     
             else:
                 self.send_error_response(client_socket, 400, "Missing url or urls parameter")
@@ -274,6 +741,8 @@ class DiseaseDetectionAPI:
             
             # Send JSON response
             self.send_json_response(client_socket, results)
+            if deadline.budget_ms is not None:
+                self.deadline_outcomes.inc(outcome='degraded' if deadline.skipped else 'met')
             
             if isinstance(results, list):
                 print(f"✅ Bulk processed {len(results)} images successfully")
@@ -281,6 +750,19 @@ class DiseaseDetectionAPI:
                 leaf_count = len(results.get('leafs', []))
                 print(f"✅ Processed successfully - Found {leaf_count} leaf/leaves")
             
+        except ImageRejected as e:
+            print(f"🚫 Rejected by quality gate ({e.reason}): {e}")
+            self.send_json_response(client_socket, self.rejection_response(e), 422)
+        except DeadlineExceeded as e:
+            if e.cancelled:
+                # Nobody is listening; 499 (client closed request) is only recorded in metrics
+                print(f"🚫 Cancelled: {e}")
+                self.request_local.status = 499
+                self.deadline_outcomes.inc(outcome='cancelled')
+            else:
+                print(f"⏰ {e}")
+                self.deadline_outcomes.inc(outcome='exceeded')
+                self.send_error_response(client_socket, 504, str(e))
         except ValueError as e:
             # No leaves detected - return 404
             print(f"⚠️ No leaves detected: {e}")
@@ -289,6 +771,554 @@ class DiseaseDetectionAPI:
             print(f"❌ Disease detection error: {e}")
             self.send_error_response(client_socket, 500, str(e))
     
+    def handle_classify_leaves(self, client_socket, path, headers, body):
+        """Classify pre-segmented leaf crops: PatchCore and disease stages only, no extraction"""
+        try:
+            try:
+                payload = json.loads(body.decode('utf-8')) if body else None
+            except ValueError:
+                payload = None
+            if not isinstance(payload, dict):
+                self.send_error_response(client_socket, 400, "Request body must be a JSON object with a leaves list")
+                return
+            
+            # Options come from the body or, as for /api/jobs, the query string
+            params = parse_qs(path.split('?', 1)[1]) if '?' in path else {}
+            for key in ('profile', 'format', 'quality', 'max_dim', 'artifacts', 'anomaly_map', 'deadline_ms', 'priority'):
+                if payload.get(key) is not None and key not in params:
+                    params[key] = [str(payload[key])]
+            
+            try:
+                profile = resolve_profile(params, self.default_profile, self.resident_profiles)
+                artifact_options = parse_artifact_options(params, QUALITY_PROFILES[profile]['artifacts'])
+                deadline_ms = parse_deadline_ms(headers, params, self.default_deadline_ms)
+                lane = params.get('priority', ['interactive'])[0]
+                if lane not in LANES:
+                    raise ValueError(f"priority must be one of: {', '.join(LANES)}")
+                images, masks = self.parse_leaf_crops(payload.get('leaves'))
+            except ValueError as e:
+                self.send_error_response(client_socket, 400, str(e))
+                return
+            
+            deadline = Deadline(deadline_ms, self.disconnect_probe(client_socket))
+            print(f"🍃 Classifying {len(images)} pre-segmented leaves")
+            results = self.classify_leaves(images, masks, artifact_options, profile, deadline, lane)
+            
+            self.send_json_response(client_socket, results)
+            if deadline.budget_ms is not None:
+                self.deadline_outcomes.inc(outcome='degraded' if deadline.skipped else 'met')
+            print(f"✅ Classified {len(results['leafs'])} leaf/leaves")
+            
+        except DeadlineExceeded as e:
+            if e.cancelled:
+                print(f"🚫 Cancelled: {e}")
+                self.request_local.status = 499
+                self.deadline_outcomes.inc(outcome='cancelled')
+            else:
+                print(f"⏰ {e}")
+                self.deadline_outcomes.inc(outcome='exceeded')
+                self.send_error_response(client_socket, 504, str(e))
+        except Exception as e:
+            print(f"❌ Leaf classification error: {e}")
+            self.errors_total.inc(type='classify')
+            self.send_error_response(client_socket, 500, str(e))
+    
+    def parse_leaf_crops(self, leaves):
+        """
+        Decode the leaves list of /api/classify-leaves into (images, masks)
+        Each entry is {"image": <base64>, "mask": <base64, optional>} or a bare base64 string
+        Raises ValueError with a client-facing message on invalid input
+        """
+        if not isinstance(leaves, list) or not leaves:
+            raise ValueError("leaves must be a non-empty list of leaf crops")
+        if len(leaves) > MAX_CLASSIFY_LEAVES:
+            raise ValueError(f"At most {MAX_CLASSIFY_LEAVES} leaves per request")
+        
+        images, masks = [], []
+        for i, leaf in enumerate(leaves):
+            if not isinstance(leaf, dict):
+                leaf = {'image': leaf}
+            try:
+                image = decode_base64_image(leaf.get('image'))
+            except ValueError as e:
+                raise ValueError(f"leaves[{i}].image: {e}")
+            mask = None
+            if leaf.get('mask') is not None:
+                try:
+                    mask = decode_base64_image(leaf['mask'], cv2.IMREAD_GRAYSCALE)
+                except ValueError as e:
+                    raise ValueError(f"leaves[{i}].mask: {e}")
+                if mask.shape[:2] != image.shape[:2]:
+                    raise ValueError(f"leaves[{i}].mask must be {image.shape[1]}x{image.shape[0]} like its image")
+            images.append(image)
+            masks.append(mask)
+        return images, masks
+    
+    def classify_leaves(self, images, masks, artifact_options=None, profile=None, deadline=None, lane='interactive'):
+        """Run pre-segmented leaves through one replica and format them like detect_diseases"""
+        profile = profile or self.default_profile
+        artifact_options = artifact_options or QUALITY_PROFILES[profile]['artifacts']
+        base_url = f"http://{self.get_local_ip()}:{self.port}"
+        
+        self.classify_batch.observe(len(images))
+        skipped_before = dict(deadline.skipped) if deadline is not None else None
+        wait_limit = None
+        if deadline is not None and deadline.budget_ms is not None:
+            wait_limit = deadline.remaining()
+        settings = {**QUALITY_PROFILES[profile]['inference'], 'heatmap_render': False}
+        try:
+            with self.replica_pool.checkout(timeout=wait_limit, lane=lane) as detector:
+                leaf_results = detector.classify_leaves(
+                    images,
+                    masks,
+                    settings=settings,
+                    deadline=deadline,
+                    keep_arrays=('leaf_image',) if artifact_options['artifacts'] != 'none' else ()
+                )
+        except TimeoutError:
+            raise DeadlineExceeded(f"Deadline of {deadline.budget_ms} ms exceeded waiting for a model replica")
+        
+        response_start = time.perf_counter()
+        leafs = []
+        for leaf_result in leaf_results:
+            leafs.append(self.build_leaf_entry(leaf_result, artifact_options, base_url))
+            leaf_result.release()
+        total_diseased = sum(1 for leaf in leafs if leaf['is_diseased'])
+        
+        result = {
+            "leafs": leafs,
+            "summary": {
+                "total_leafs": int(len(leafs)),
+                "diseased_leafs": int(total_diseased),
+                "healthy_leafs": int(len(leafs) - total_diseased)
+            },
+            "profile": profile,
+            "timestamp": datetime.now().isoformat()
+        }
+        if deadline is not None and (deadline.budget_ms is not None or deadline.skipped):
+            result["deadline"] = deadline.summary(since=skipped_before)
+        self.stage_latency.observe(time.perf_counter() - response_start, stage='response_build')
+        return result
+    
+    def handle_process_video(self, client_socket, path, headers, body):
+        """Process a video (raw body) or burst (JSON frames), analysing each tracked leaf once"""
+        video_path = None
+        try:
+            params = parse_qs(path.split('?', 1)[1]) if '?' in path else {}
+            content_type = headers.get('content-type', '').split(';', 1)[0].strip().lower()
+            frames = None
+            try:
+                if content_type == 'application/json':
+                    try:
+                        payload = json.loads(body.decode('utf-8')) if body else None
+                    except ValueError:
+                        payload = None
+                    if not isinstance(payload, dict):
+                        raise ValueError("Request body must be a JSON object with a frames list")
+                    # Options come from the body or the query string, as for /api/classify-leaves
+                    for key in ('profile', 'format', 'quality', 'max_dim', 'artifacts', 'anomaly_map', 'deadline_ms',
+                                'priority', 'sample_fps'):
+                        if payload.get(key) is not None and key not in params:
+                            params[key] = [str(payload[key])]
+                    frames = self.parse_burst_frames(payload.get('frames'))
+                elif content_type not in VIDEO_CONTENT_TYPES:
+                    raise ValueError(f"Content-Type must be application/json or one of: {', '.join(VIDEO_CONTENT_TYPES)}")
+                elif not body:
+                    raise ValueError("Empty video body")
+                
+                profile = resolve_profile(params, self.default_profile, self.resident_profiles)
+                artifact_options = parse_artifact_options(params, QUALITY_PROFILES[profile]['artifacts'])
+                deadline_ms = parse_deadline_ms(headers, params, self.default_deadline_ms)
+                # A video holds replicas for many frame batches, so it queues as bulk work by default
+                lane = params.get('priority', ['bulk'])[0]
+                if lane not in LANES:
+                    raise ValueError(f"priority must be one of: {', '.join(LANES)}")
+                sample_fps = self.parse_sample_fps(params)
+            except ValueError as e:
+                self.send_error_response(client_socket, 400, str(e))
+                return
+            
+            if frames is None:
+                # OpenCV only decodes video from a path
+                fd, video_path = tempfile.mkstemp(suffix=VIDEO_CONTENT_TYPES[content_type])
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(body)
+                print(f"🎞️ Processing video ({len(body) / 1e6:.1f} MB, sampled at {sample_fps:g} fps)")
+            else:
+                print(f"🎞️ Processing burst of {len(frames)} frames")
+            
+            deadline = Deadline(deadline_ms, self.disconnect_probe(client_socket))
+            try:
+                results = self.process_video(video_path or frames, artifact_options, profile, deadline, lane, sample_fps)
+            except ValueError as e:
+                self.send_error_response(client_socket, 400, str(e))
+                return
+            
+            self.send_json_response(client_socket, results)
+            if deadline.budget_ms is not None:
+                self.deadline_outcomes.inc(outcome='degraded' if deadline.skipped else 'met')
+            print(f"✅ Tracked {len(results['leafs'])} leaf/leaves over {results['summary']['frames_sampled']} frames")
+            
+        except DeadlineExceeded as e:
+            if e.cancelled:
+                print(f"🚫 Cancelled: {e}")
+                self.request_local.status = 499
+                self.deadline_outcomes.inc(outcome='cancelled')
+            else:
+                print(f"⏰ {e}")
+                self.deadline_outcomes.inc(outcome='exceeded')
+                self.send_error_response(client_socket, 504, str(e))
+        except Exception as e:
+            print(f"❌ Video processing error: {e}")
+            self.errors_total.inc(type='video')
+            self.send_error_response(client_socket, 500, str(e))
+        finally:
+            if video_path is not None:
+                os.unlink(video_path)
+    
+    def parse_burst_frames(self, frames):
+        """
+        Decode the frames list of a burst (base64 images, in capture order)
+        Raises ValueError with a client-facing message on invalid input
+        """
+        if not isinstance(frames, list) or not frames:
+            raise ValueError("frames must be a non-empty list of base64 images")
+        if len(frames) > MAX_BURST_FRAMES:
+            raise ValueError(f"At most {MAX_BURST_FRAMES} frames per burst")
+        
+        decoded = []
+        for i, frame in enumerate(frames):
+            try:
+                decoded.append(decode_base64_image(frame))
+            except ValueError as e:
+                raise ValueError(f"frames[{i}]: {e}")
+            if decoded[-1].shape != decoded[0].shape:
+                raise ValueError(f"frames[{i}] must be {decoded[0].shape[1]}x{decoded[0].shape[0]} like frames[0]")
+        return decoded
+    
+    def parse_sample_fps(self, params):
+        """?sample_fps= for videos, SAMPLE_FPS by default"""
+        value = params.get('sample_fps', [None])[0]
+        if value in (None, ''):
+            return SAMPLE_FPS
+        try:
+            sample_fps = float(value)
+        except ValueError:
+            raise ValueError("sample_fps must be a number")
+        if not 0 < sample_fps <= MAX_SAMPLE_FPS:
+            raise ValueError(f"sample_fps must be above 0 and at most {MAX_SAMPLE_FPS:g}")
+        return sample_fps
+    
+    def process_video(self, source, artifact_options=None, profile=None, deadline=None, lane='bulk',
+                      sample_fps=SAMPLE_FPS):
+        """
+        Run a video path or burst of frames through the replicas; one leaf entry per track
+        A replica is checked out per FRAME_BATCH sampled frames and once more for the
+        analysis, so a long video yields to other requests between batches. Videos run
+        in the bulk lane unless the client asks otherwise.
+        """
+        profile = profile or self.default_profile
+        artifact_options = artifact_options or QUALITY_PROFILES[profile]['artifacts']
+        base_url = f"http://{self.get_local_ip()}:{self.port}"
+        
+        skipped_before = dict(deadline.skipped) if deadline is not None else None
+        settings = {**QUALITY_PROFILES[profile]['inference'], 'heatmap_render': False}
+        tracker = LeafTracker()
+        frames = iter_frames(source, sample_fps)
+        pipeline_seconds = 0.0
+        
+        def wait_limit():
+            if deadline is not None and deadline.budget_ms is not None:
+                return deadline.remaining()
+            return None
+        
+        try:
+            more = True
+            while more:
+                with self.replica_pool.checkout(timeout=wait_limit(), lane=lane) as detector:
+                    pipeline_start = time.perf_counter()
+                    more = detector.track_frames(frames, tracker, settings, deadline, FRAME_BATCH)
+                    pipeline_seconds += time.perf_counter() - pipeline_start
+            with self.replica_pool.checkout(timeout=wait_limit(), lane=lane) as detector:
+                pipeline_start = time.perf_counter()
+                tracks = detector.classify_tracks(
+                    tracker,
+                    settings=settings,
+                    deadline=deadline,
+                    keep_arrays=('leaf_image',) if artifact_options['artifacts'] != 'none' else ()
+                )
+                pipeline_seconds += time.perf_counter() - pipeline_start
+        except TimeoutError:
+            raise DeadlineExceeded(f"Deadline of {deadline.budget_ms} ms exceeded waiting for a model replica")
+        finally:
+            frames.close()
+        # Time spent waiting for replicas between batches is not processing time
+        report = tracker.report(pipeline_seconds)
+        
+        self.tracks_per_video.observe(len(tracks))
+        if report['realtime_factor'] is not None:
+            self.video_realtime.observe(report['realtime_factor'])
+        
+        response_start = time.perf_counter()
+        leafs = []
+        for track in tracks:
+            entry = self.build_leaf_entry(track.leaf, artifact_options, base_url)
+            entry['track'] = {
+                'id': track.track_id,
+                'first_frame': track.first_frame,
+                'last_frame': track.last_frame,
+                'best_frame': track.best_frame,
+                'frames_seen': track.hits
+            }
+            leafs.append(entry)
+            track.leaf.release()
+        total_diseased = sum(1 for leaf in leafs if leaf['is_diseased'])
+        
+        realtime_factor = report['realtime_factor']
+        result = {
+            "leafs": leafs,
+            "summary": {
+                "total_leafs": int(len(leafs)),
+                "diseased_leafs": int(total_diseased),
+                "healthy_leafs": int(len(leafs) - total_diseased),
+                "frames_sampled": int(report['frames_sampled']),
+                "sam_calls": int(report['sam_calls']),
+                "video_seconds": None if report['video_seconds'] is None else round(report['video_seconds'], 2),
+                "processing_seconds": round(report['seconds'], 2),
+                "realtime_factor": None if realtime_factor is None else round(realtime_factor, 2)
+            },
+            "profile": profile,
+            "timestamp": datetime.now().isoformat()
+        }
+        if deadline is not None and (deadline.budget_ms is not None or deadline.skipped):
+            result["deadline"] = deadline.summary(since=skipped_before)
+        self.stage_latency.observe(time.perf_counter() - response_start, stage='response_build')
+        return result
+    
+    def profiled(self, trigger, work):
+        """
+        Run work() under cProfile and the torch profiler when trigger is set
+        Returns (result, capture description or None); files are stored even if work() fails
+        """
+        capture = self.request_profiler.start(trigger) if trigger else None
+        if capture is None:
+            return work(), None
+        
+        self.profiled_total.inc(trigger=trigger)
+        self.request_local.profiling = True
+        try:
+            result = work()
+        finally:
+            self.request_local.profiling = False
+            description = self.request_profiler.stop(capture, f"http://{self.get_local_ip()}:{self.port}")
+            self.profiler_export.observe(description['export_seconds'])
+            print(f"🔬 Profiled request ({trigger}, {description['seconds']:.2f}s): {description['files']['cprofile']}")
+        return result, description
+    
+    def handle_profile_list(self, client_socket, headers):
+        """List recent sampled profiles (admin only)"""
+        if not is_admin(headers):
+            self.send_error_response(client_socket, 403, "X-Admin-Token required")
+            return
+        self.send_json_response(client_socket, {
+            "sample_rate": self.request_profiler.sample_rate,
+            "profiles": self.request_profiler.recent_captures()
+        })
+    
+    def handle_job_submit(self, client_socket, path, body):
+        """Queue an asynchronous detection job and return its id immediately"""
+        try:
+            payload = {}
+            if body:
+                try:
+                    payload = json.loads(body.decode('utf-8'))
+                except ValueError:
+                    self.send_error_response(client_socket, 400, "Request body must be valid JSON")
+                    return
+                if not isinstance(payload, dict):
+                    self.send_error_response(client_socket, 400, "Request body must be a JSON object")
+                    return
+            
+            # Query parameters are accepted as well, mirroring /api/process
+            if '?' in path:
+                params = parse_qs(path.split('?', 1)[1])
+                for key in ('url', 'urls', 'callback_url', 'profile', 'format', 'quality', 'max_dim', 'artifacts',
+                            'anomaly_map'):
+                    if key in params and key not in payload:
+                        payload[key] = params[key][0]
+            
+            job_payload = {}
+            if payload.get('urls'):
+                urls = payload['urls']
+                if isinstance(urls, str):
+                    urls = urls.split(',')
+                job_payload['urls'] = [str(url).strip() for url in urls if str(url).strip()]
+                if not job_payload['urls']:
+                    self.send_error_response(client_socket, 400, "No valid URLs provided in urls parameter")
+                    return
+            elif payload.get('url'):
+                job_payload['url'] = str(payload['url']).strip()
+            else:
+                self.send_error_response(client_socket, 400, "Missing url or urls parameter")
+                return
+            
+            try:
+                options = {key: str(value) for key, value in payload.items() if value is not None}
+                job_payload['profile'] = resolve_profile(options, self.default_profile, self.resident_profiles)
+                job_payload['artifact_options'] = parse_artifact_options(
+                    options, QUALITY_PROFILES[job_payload['profile']]['artifacts']
+                )
+            except ValueError as e:
+                self.send_error_response(client_socket, 400, str(e))
+                return
+            
+            callback_url = payload.get('callback_url')
+            if callback_url:
+                parsed = urlparse(callback_url)
+                if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+                    self.send_error_response(client_socket, 400, "Invalid callback_url")
+                    return
+            
+            job = self.job_queue.submit(job_payload, callback_url=callback_url)
+            print(f"🗂️ Queued job {job['id']}")
+            
+            self.send_json_response(client_socket, {
+                "job_id": job['id'],
+                "status": job['status'],
+                "status_url": f"/api/jobs/{job['id']}",
+                "queue_depth": self.job_queue.depth(),
+                "timestamp": datetime.now().isoformat()
+            }, status_code=202)
+            
+        except Exception as e:
+            print(f"❌ Job submit error: {e}")
+            self.send_error_response(client_socket, 500, str(e))
+    
+    def handle_job_status(self, client_socket, path):
+        """Return the status, and result when finished, of a queued job"""
+        job_id = path.split('?', 1)[0][len('/api/jobs/'):].strip('/')
+        job = self.job_queue.get(job_id) if job_id else None
+        
+        if job is None:
+            self.send_error_response(client_socket, 404, "Job not found")
+            return
+        
+        self.send_json_response(client_socket, self.format_job(job))
+    
+    def format_job(self, job):
+        """Build the public representation of a job record"""
+        def iso(ts):
+            return datetime.fromtimestamp(ts).isoformat() if ts else None
+        
+        return {
+            "job_id": job['id'],
+            "status": job['status'],
+            "request": job['payload'],
+            "result": job['result'],
+            "error": job['error'],
+            "attempts": job['attempts'],
+            "callback_url": job['callback_url'],
+            "callback_status": job['callback_status'],
+            "created_at": iso(job['created_at']),
+            "started_at": iso(job['started_at']),
+            "finished_at": iso(job['finished_at'])
+        }
+    
+    def start_job_workers(self, recover=True):
+        """Start background threads that drain the persistent job queue"""
+        # In pre-fork mode the supervisor recovers once, not every worker
+        if recover:
+            self.recover_jobs()
+        
+        for i in range(self.job_workers):
+            worker = threading.Thread(target=self.job_worker_loop, name=f"job-worker-{i}")
+            worker.daemon = True
+            worker.start()
+            self.job_threads.append(worker)
+        
+        # Webhooks are sent from their own thread so a slow callback URL never holds up the queue
+        sender = threading.Thread(target=self.callback_loop, name="callback-sender")
+        sender.daemon = True
+        sender.start()
+        self.job_threads.append(sender)
+        
+        if self.job_workers:
+            print(f"🗂️ Job workers: {self.job_workers} (queued: {self.job_queue.depth()})")
+    
+    def recover_jobs(self):
+        """Requeue jobs interrupted by a restart and purge old finished ones"""
+        recovered, failed = self.job_queue.recover()
+        if recovered:
+            print(f"♻️ Requeued {recovered} interrupted job(s)")
+        if failed:
+            print(f"⚠️ Failed {failed} job(s) interrupted {MAX_JOB_ATTEMPTS} times")
+        self.job_queue.purge()
+    
+    def job_worker_loop(self):
+        """Claim queued jobs and run them through the pipeline"""
+        while self.running:
+            try:
+                job = self.job_queue.claim(timeout=1.0)
+            except Exception as e:
+                print(f"❌ Job queue error: {e}")
+                time.sleep(1.0)
+                continue
+            
+            if job is None:
+                continue
+            
+            print(f"🗂️ Running job {job['id']}")
+            try:
+                result = self.run_job(job['payload'])
+                self.job_queue.complete(job['id'], result)
+                print(f"✅ Job {job['id']} completed")
+            except Exception as e:
+                self.job_queue.fail(job['id'], e)
+                print(f"⚠️ Job {job['id']} failed: {e}")
+    
+    def callback_loop(self):
+        """Deliver the completion webhooks that the job queue reports as due"""
+        while self.running:
+            try:
+                job = self.job_queue.claim_callback()
+            except Exception as e:
+                print(f"❌ Job queue error: {e}")
+                job = None
+            
+            if job is None:
+                time.sleep(CALLBACK_POLL_INTERVAL)
+                continue
+            self.notify_callback(job)
+    
+    def run_job(self, payload):
+        """Execute a job payload and return its result"""
+        artifact_options = payload.get('artifact_options')
+        # The server may have restarted with other profiles since the job was queued
+        try:
+            profile = resolve_profile(payload, self.default_profile, self.resident_profiles)
+        except ValueError as e:
+            raise ValueError(f"Job cannot run on this server: {e}") from None
+        if 'urls' in payload:
+            return self.process_bulk_images(payload['urls'], artifact_options, profile, lane='bulk')
+        
+        # Jobs are background work, so they yield to interactive requests
+        result = self.process_image_url(payload['url'], artifact_options, profile, lane='bulk')
+        if result is None:
+            raise Exception("Failed to download image")
+        return result
+    
+    def notify_callback(self, job):
+        """POST the finished job to its callback URL once; the job queue schedules any retry"""
+        try:
+            response = requests.post(job['callback_url'], json=self.format_job(job), timeout=CALLBACK_TIMEOUT)
+            response.raise_for_status()
+        except Exception as e:
+            print(f"⚠️ Callback attempt {job['callback_attempts']}/{CALLBACK_ATTEMPTS} failed for job {job['id']}: {e}")
+            self.job_queue.finish_callback(job['id'])
+            return
+        self.job_queue.finish_callback(job['id'], f"delivered ({response.status_code})")
+        print(f"📨 Callback delivered for job {job['id']}")
+    
     def handle_home_page(self, client_socket):
         """Serve the HTML home page"""
         try:
@@ -307,55 +1337,177 @@ Content-Length: {len(html_content.encode('utf-8'))}\r
 Access-Control-Allow-Origin: *\r
 \r
 """
-            client_socket.send(response.encode('utf-8'))
-            client_socket.send(html_content.encode('utf-8'))
+            self.request_local.status = 200
+            client_socket.sendall(response.encode('utf-8'))
+            client_socket.sendall(html_content.encode('utf-8'))
             
         except Exception as e:
             print(f"❌ Home page error: {e}")
             self.send_error_response(client_socket, 500, str(e))
     
-    def handle_static_file(self, client_socket, path):
-        """Serve static files (images)"""
+    def handle_static_file(self, client_socket, path, headers=None, head_only=False):
+        """Serve static files (images) with validators, ranges and zero-copy sends"""
+        headers = headers or {}
         try:
             # Extract filename from path
-            filename = path.split('/static/', 1)[1]
-            file_path = os.path.join(self.static_dir, filename)
+            filename = path.split('/static/', 1)[1].split('?', 1)[0]
+            file_path = self.artifact_store.path(filename)
+            if file_path is None:
+                self.send_error_response(client_socket, 404, "File not found")
+                return
             
-            # Check if file exists
-            if not os.path.exists(file_path):
+            # The URL may have been handed out before the encoder finished writing it
+            self.artifact_encoder.wait(filename)
+            
+            # Check if file exists; heatmaps and overlays are rendered on first fetch
+            if not os.path.isfile(file_path) and not self.render_deferred(filename):
                 self.send_error_response(client_socket, 404, "File not found")
                 return
             
-            # Read file
-            with open(file_path, 'rb') as f:
-                file_data = f.read()
+            self.artifact_store.touch(filename)
+            
+            stat = os.stat(file_path)
+            file_size = stat.st_size
+            etag = f'"{stat.st_mtime_ns:x}-{file_size:x}"'
+            last_modified = formatdate(stat.st_mtime, usegmt=True)
+            content_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
             
-            # Determine content type
-            content_type = 'image/jpeg'
-            if filename.endswith('.png'):
-                content_type = 'image/png'
-            elif filename.endswith('.gif'):
-                content_type = 'image/gif'
-            elif filename.endswith('.bmp'):
-                content_type = 'image/bmp'
+            common_headers = (
+                f"ETag: {etag}\r\n"
+                f"Last-Modified: {last_modified}\r\n"
+                f"Cache-Control: {STATIC_CACHE_CONTROL}\r\n"
+                f"Access-Control-Allow-Origin: *\r\n"
+            )
+            
+            # Conditional requests: answer 304 when the client copy is current
+            if is_not_modified(headers, etag, stat.st_mtime):
+                self.request_local.status = 304
+                response = f"HTTP/1.1 304 Not Modified\r\n{common_headers}\r\n"
+                client_socket.sendall(response.encode())
+                return
+            
+            # Range requests (ignored when If-Range no longer matches)
+            byte_range = None
+            if_range = headers.get('if-range')
+            if if_range is None or if_range == etag:
+                try:
+                    byte_range = parse_byte_range(headers.get('range'), file_size)
+                except ValueError:
+                    self.request_local.status = 416
+                    response = (
+                        f"HTTP/1.1 416 Range Not Satisfiable\r\n"
+                        f"Content-Range: bytes */{file_size}\r\n"
+                        f"Content-Length: 0\r\n"
+                        f"{common_headers}\r\n"
+                    )
+                    client_socket.sendall(response.encode())
+                    return
+            
+            if byte_range:
+                start, end = byte_range
+                status_line = "HTTP/1.1 206 Partial Content"
+                range_header = f"Content-Range: bytes {start}-{end}/{file_size}\r\n"
+            else:
+                start, end = 0, file_size - 1
+                status_line = "HTTP/1.1 200 OK"
+                range_header = ""
+            length = end - start + 1
+            self.request_local.status = 206 if byte_range else 200
             
             # Send response
-            response = f"""HTTP/1.1 200 OK\r
-Content-Type: {content_type}\r
-Content-Length: {len(file_data)}\r
-Access-Control-Allow-Origin: *\r
-Cache-Control: public, max-age=3600\r
-\r
-"""
-            client_socket.send(response.encode())
-            client_socket.send(file_data)
+            response = (
+                f"{status_line}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {length}\r\n"
+                f"Accept-Ranges: bytes\r\n"
+                f"{range_header}"
+                f"{common_headers}\r\n"
+            )
+            client_socket.sendall(response.encode())
+            
+            if not head_only and length > 0:
+                # socket.sendfile uses os.sendfile where available (kernel-level copy)
+                with open(file_path, 'rb') as f:
+                    client_socket.sendfile(f, offset=start, count=length)
             
         except Exception as e:
             print(f"❌ Static file error: {e}")
             self.send_error_response(client_socket, 500, str(e))
     
-    def download_image(self, image_url):
+    def process_image_url(self, image_url, artifact_options=None, profile=None, deadline=None, lane='interactive'):
+        """
+        Download and analyse one image, sharing the work with identical requests in flight
+        Requests coalesce by URL before the download and by image content after it
+        lane ('interactive' or 'bulk') sets the priority of the replica checkout
+        Returns None if the image could not be downloaded
+        """
+        profile = profile or self.default_profile
+        artifact_options = artifact_options or QUALITY_PROFILES[profile]['artifacts']
+        # The lane is part of the key: an interactive request must not wait on a bulk
+        # leader's low-priority checkout
+        options_key = (profile, lane, tuple(sorted(artifact_options.items())))
+        
+        def download_and_detect():
+            temp_image_path = self.download_image(image_url, deadline)
+            if not temp_image_path:
+                return None
+            try:
+                return self.coalesce(
+                    ('content', file_digest(temp_image_path)) + options_key,
+                    lambda: self.detect_diseases(temp_image_path, artifact_options, profile, deadline, lane),
+                    deadline
+                )
+            finally:
+                self.cleanup_temp_image(image_url, temp_image_path)
+        
+        with self.image_latency.time(lane=lane):
+            return self.coalesce(('url', image_url) + options_key, download_and_detect, deadline)
+    
+    def coalesce(self, key, work, deadline=None):
+        """Run work() through single-flight under key = (match, ...), counting shared results"""
+        timeout = None
+        if deadline is not None and deadline.budget_ms is not None:
+            timeout = deadline.remaining()
+        
+        def retry(error):
+            # A leader that timed out or lost its client says nothing about this request's budget
+            return isinstance(error, DeadlineExceeded) and (deadline is None or not deadline.expired())
+        
+        try:
+            result, shared = self.single_flight.do(key, work, timeout=timeout, retry=retry)
+        except TimeoutError:
+            raise DeadlineExceeded(f"Deadline of {deadline.budget_ms} ms exceeded waiting for an identical request")
+        if not shared:
+            return result
+        
+        # The deadline block describes the leader's budget; replace it with this request's
+        leader_deadline = result.pop('deadline', None) if isinstance(result, dict) else None
+        skipped = leader_deadline['skipped'] if leader_deadline else {}
+        if skipped and not self.budget_covered(deadline, leader_deadline['budget_ms']):
+            # The leader shed work this request has the time (or no limit) to do
+            print(f"🔗 Identical request in flight shed work under a tighter deadline; recomputing")
+            return work()
+        
+        self.coalesced_total.inc(match=key[0])
+        print(f"🔗 Reused an identical request in flight ({key[0]} match)")
+        if deadline is not None:
+            skipped_before = dict(deadline.skipped)
+            for kind, count in skipped.items():
+                deadline.skip(kind, count)
+            if deadline.budget_ms is not None or skipped:
+                result['deadline'] = deadline.summary(since=skipped_before)
+        return result
+    
+    @staticmethod
+    def budget_covered(deadline, leader_budget_ms):
+        """True if a leader's budget was at least as long as this request's, so its degraded result will do"""
+        if deadline is None or deadline.budget_ms is None:
+            return leader_budget_ms is None
+        return leader_budget_ms is None or leader_budget_ms >= deadline.budget_ms
+    
+    def download_image(self, image_url, deadline=None):
         """Download image from URL or load from local file:// path"""
+        download_start = time.perf_counter()
         try:
             # Validate URL
             parsed = urlparse(image_url)
@@ -392,8 +1544,9 @@ Cache-Control: public, max-age=3600\r
                 print(f"❌ Invalid URL: {image_url}")
                 return None
             
-            # Download image
-            response = requests.get(image_url, timeout=30, stream=True)
+            # Download image, giving up early if the request's deadline is closer
+            timeout = 30 if deadline is None else max(0.1, min(30, deadline.remaining()))
+            response = requests.get(image_url, timeout=timeout, stream=True)
             response.raise_for_status()
             
             # Check content type
@@ -421,136 +1574,129 @@ Cache-Control: public, max-age=3600\r
             
         except Exception as e:
             print(f"❌ Download error: {e}")
+            self.errors_total.inc(type='download')
             return None
+        finally:
+            self.stage_latency.observe(time.perf_counter() - download_start, stage='download')
+    
+    def store_artifact(self, filename, render, artifact_options):
+        """Queue an artifact for encoding unless the store already has it"""
+        if self.artifact_encoder.is_pending(filename):
+            self.artifact_cache.inc(result='hit')
+            return
+        if self.artifact_store.contains(filename):
+            # Refresh its LRU position so the reused file isn't evicted first
+            self.artifact_store.touch(filename)
+            self.artifact_cache.inc(result='hit')
+            return
+        self.artifact_cache.inc(result='miss')
+        self.artifact_encoder.submit(filename, render, artifact_options)
+    
+    def defer_artifact(self, filename, recipe, source=None, data_key=None, data=None):
+        """Register a derived artifact to be rendered on first fetch, unless already stored"""
+        if self.artifact_store.contains(filename):
+            self.artifact_store.touch(filename)
+            self.artifact_cache.inc(result='hit')
+            return
+        self.artifact_cache.inc(result='deferred')
+        self.artifact_store.put_recipe(filename, recipe, source=source, data_key=data_key, data=data)
+    
+    def render_deferred(self, filename):
+        """Render a deferred artifact from its recipe; True once the file exists"""
+        recipe = self.artifact_store.recipe(filename)
+        if recipe is None:
+            return False
+        self.artifact_renders.inc(kind=recipe['kind'])
+        self.store_artifact(filename, lambda: self.render_recipe(recipe), recipe['options'])
+        return self.artifact_encoder.wait(filename) and os.path.isfile(self.artifact_store.path(filename))
     
-    def detect_diseases(self, image_path):
+    def render_recipe(self, recipe):
+        """BGR image of a heatmap or overlay recipe (runs on the encoder pool)"""
+        # Recipes registered before maps were shared embed their own copy
+        anomaly_map = unpack_anomaly_map(recipe['data'] if 'data' in recipe else recipe['anomaly_map'])
+        if recipe['kind'] == 'heatmap':
+            return render_heatmap(anomaly_map, recipe['size'])
+        
+        # Overlays blend onto the stored leaf artifact, at the size it was stored
+        leaf_name = recipe['leaf']
+        self.artifact_encoder.wait(leaf_name)
+        leaf_path = self.artifact_store.path(leaf_name)
+        leaf_img = cv2.imread(leaf_path) if leaf_path and os.path.isfile(leaf_path) else None
+        if leaf_img is None:
+            raise FileNotFoundError(f"Leaf artifact {leaf_name} is no longer stored")
+        self.artifact_store.touch(leaf_name)
+        return render_overlay(leaf_img, anomaly_map)
+    
+    def cleanup_temp_image(self, image_url, temp_image_path):
+        """Remove a downloaded temp file (never a local file:// source)"""
+        try:
+            parsed = urlparse(image_url)
+            if parsed.scheme != 'file' and temp_image_path.startswith(tempfile.gettempdir()):
+                os.remove(temp_image_path)
+        except:
+            pass
+    
+    def detect_diseases(self, image_path, artifact_options=None, profile=None, deadline=None, lane='interactive'):
         """Detect diseases in image and return results"""
+        profile = profile or self.default_profile
+        artifact_options = artifact_options or QUALITY_PROFILES[profile]['artifacts']
+        artifact_mode = artifact_options['artifacts']
+        base_url = f"http://{self.get_local_ip()}:{self.port}"
+        
         try:
             # Use the grape leaf pipeline
-            detection_results = self.detector.process_image(image_path, visualize=False)
+            # Reject unusable photos in milliseconds, before waiting for a replica
+            if self.quality_gate is not None:
+                gate_start = time.perf_counter()
+                verdict = self.quality_gate.check(image_path)
+                self.stage_latency.observe(time.perf_counter() - gate_start, stage='quality_gate')
+                self.gate_total.inc(verdict=verdict['reason'] or 'passed')
+                if not verdict['passed']:
+                    self.gate_saved.inc(self.pipeline_seconds or 0.0)
+                    raise ImageRejected(verdict)
+            
+            self.profile_images.inc(profile=profile)
+            skipped_before = dict(deadline.skipped) if deadline is not None else None
+            wait_limit = None
+            if deadline is not None and deadline.budget_ms is not None:
+                wait_limit = deadline.remaining()
+            # Heatmaps are rendered from the raw anomaly map on first fetch (or by the app)
+            settings = {**QUALITY_PROFILES[profile]['inference'], 'heatmap_render': False}
+            try:
+                with self.replica_pool.checkout(timeout=wait_limit, lane=lane) as detector:
+                    pipeline_start = time.perf_counter()
+                    detection_results = detector.process_image(
+                        image_path,
+                        visualize=False,
+                        settings=settings,
+                        deadline=deadline,
+                        # The leaf crop is the only full-resolution array the response needs
+                        keep_arrays=('leaf_image',) if artifact_mode != 'none' else ()
+                    )
+                    report = dict(detector.last_report)
+                    self.observe_pipeline_seconds(time.perf_counter() - pipeline_start,
+                                                  profiled=getattr(self.request_local, 'profiling', False))
+            except TimeoutError:
+                raise DeadlineExceeded(f"Deadline of {deadline.budget_ms} ms exceeded waiting for a model replica")
             
             # Check if detection returned valid results
             if detection_results is None or len(detection_results) == 0:
                 print("⚠️ No leaves detected in image")
+                self.leaves_per_image.observe(0)
+                self.images_total.inc(outcome='no_leaves')
                 raise ValueError("No grape leaves detected in the image")
             
+            self.leaves_per_image.observe(len(detection_results))
+            response_start = time.perf_counter()
+            
             # Format results leaf by leaf
             leafs = []
-            total_diseased = 0
-            total_healthy = 0
-            
             for leaf_result in detection_results:
-                anomaly_result = leaf_result.get('anomaly_result', {})
-                disease_result = leaf_result.get('disease_result', None)
-                
-                # Build diseases dictionary for this leaf
-                diseases = {}
-                
-                # Check if leaf is diseased
-                is_diseased = anomaly_result.get('is_diseased', False)
-                
-                if is_diseased:
-                    total_diseased += 1
-                    
-                    # Add specific disease information if available
-                    if disease_result and 'disease_info' in disease_result:
-                        for disease_info in disease_result['disease_info']:
-                            disease_name_raw = disease_info.get('name', 'unknown_disease')
-                            confidence = disease_info.get('confidence', 0.0)
-                            percentage = disease_info.get('percentage', 0.0)
-                            
-                            # Normalize disease name to match database (proper case)
-                            disease_name = normalize_disease_name(disease_name_raw)
-                            
-                            # Get detailed disease information from database
-                            disease_details = get_disease_info(disease_name)
-                            
-                            if disease_details:
-                                # Disease found in database
-                                diseases[disease_name] = {
-                                    'confidence': float(confidence),
-                                    'percentage': float(percentage),
-                                    'description': disease_details.get('description', 'Unknown disease'),
-                                    'severity': disease_details.get('severity', 'unknown'),
-                                    'treatment': disease_details.get('treatment', 'Consult with agricultural specialist')
-                                }
-                            else:
-                                # Disease not in database, use generic info
-                                diseases[disease_name] = {
-                                    'confidence': float(confidence),
-                                    'percentage': float(percentage),
-                                    'description': f'{disease_name} detected',
-                                    'severity': 'unknown',
-                                    'treatment': 'Consult with agricultural specialist for proper treatment'
-                                }
-                    else:
-                        # No specific disease detected, but anomaly score indicates disease
-                        # Only add if confidence is reasonable
-                        anomaly_confidence = anomaly_result.get('confidence', 0.0) / 100.0
-                        if anomaly_confidence > 0.4:  # Only if >40% confidence
-                            diseases['Unknown Disease'] = {
-                                'confidence': float(anomaly_confidence),
-                                'percentage': 0.0,
-                                'description': 'Anomaly detected but specific disease type unidentified',
-                                'severity': 'unknown',
-                                'treatment': 'Further analysis recommended. Consult with agricultural specialist.'
-                            }
-                else:
-                    # Healthy leaf - keep diseases empty
-                    total_healthy += 1
-                    # Don't add anything to diseases dict for healthy leaves
-                
-                # Save leaf image to static directory
-                with self.counter_lock:
-                    self.image_counter += 1
-                    leaf_filename = f"leaf_{self.image_counter}_{int(time.time() * 1000)}.jpg"
-                    heatmap_filename = f"heatmap_{self.image_counter}_{int(time.time() * 1000)}.jpg"
-                    overlay_filename = f"overlay_{self.image_counter}_{int(time.time() * 1000)}.jpg"
-                
-                leaf_image = leaf_result.get('leaf_image')
-                leaf_path = os.path.join(self.static_dir, leaf_filename)
-                cv2.imwrite(leaf_path, leaf_image)
-                
-                # Generate static URL
-                base_url = f"http://{self.get_local_ip()}:{self.port}"
-                leaf_url = f"{base_url}/static/{leaf_filename}"
-                
-                # Save heatmap and overlay if available
-                heatmap_url = None
-                overlay_url = None
-                if anomaly_result.get('heatmap') is not None:
-                    heatmap = anomaly_result['heatmap']
-                    heatmap_path = os.path.join(self.static_dir, heatmap_filename)
-                    cv2.imwrite(heatmap_path, heatmap)
-                    heatmap_url = f"{base_url}/static/{heatmap_filename}"
-                    
-                    # Create overlay (blend leaf image with heatmap)
-                    overlay = cv2.addWeighted(leaf_image, 0.6, heatmap, 0.4, 0)
-                    overlay_path = os.path.join(self.static_dir, overlay_filename)
-                    cv2.imwrite(overlay_path, overlay)
-                    overlay_url = f"{base_url}/static/{overlay_filename}"
-                
-                # Get bounding box coordinates
-                bbox = leaf_result.get('bbox', None)
-                bbox_data = None
-                if bbox:
-                    x1, y1, x2, y2 = bbox
-                    bbox_data = {
-                        'x1': int(x1),
-                        'y1': int(y1),
-                        'x2': int(x2),
-                        'y2': int(y2)
-                    }
-                
-                leafs.append({
-                    "image": leaf_url,
-                    "heatmap": heatmap_url,
-                    "overlay": overlay_url,
-                    "bbox": bbox_data,
-                    "diseases": diseases,
-                    "anomaly_score": float(anomaly_result.get('anomaly_score', 0.0)),
-                    "is_diseased": bool(is_diseased)
-                })
+                leafs.append(self.build_leaf_entry(leaf_result, artifact_options, base_url))
+                # Only the queued encode still references the leaf crop now
+                leaf_result.release()
+            total_diseased = sum(1 for leaf in leafs if leaf['is_diseased'])
+            total_healthy = len(leafs) - total_diseased
             
             # Build final response
             result = {
@@ -558,62 +1704,231 @@ Cache-Control: public, max-age=3600\r
                 "summary": {
                     "total_leafs": int(len(leafs)),
                     "diseased_leafs": int(total_diseased),
-                    "healthy_leafs": int(total_healthy)
+                    "healthy_leafs": int(total_healthy),
+                    "duplicate_leafs_removed": int(report.get('duplicate_leaves_removed', 0)),
+                    "tiles": int(report.get('tiles', 0))
                 },
+                "profile": profile,
                 "timestamp": datetime.now().isoformat(),
                 "image_processed": True
             }
+            if deadline is not None and (deadline.budget_ms is not None or deadline.skipped):
+                result["deadline"] = deadline.summary(since=skipped_before)
             
+            self.stage_latency.observe(time.perf_counter() - response_start, stage='response_build')
+            self.images_total.inc(outcome='processed')
             return result
             
-        except ValueError as e:
-            # Re-raise ValueError for no leaves detected
+        except (ValueError, DeadlineExceeded, ImageRejected):
+            # Re-raise ValueError for no leaves detected, deadline outcomes and gate rejections
             raise
         except Exception as e:
             print(f"❌ Detection error: {e}")
+            self.errors_total.inc(type='detection')
+            self.images_total.inc(outcome='error')
             raise Exception(f"Detection error: {str(e)}")
 
     
-    def process_bulk_images(self, image_urls):
-        """Process multiple images and return array of results"""
+    def build_leaf_entry(self, leaf_result, artifact_options, base_url):
+        """
+        Response entry for one LeafResult (the per-leaf schema of /api/process)
+        Artifact URLs are reserved here; pixels are encoded in the background
+        """
+        artifact_mode = artifact_options['artifacts']
+        map_encoding = artifact_options['anomaly_map']
+        ext = self.artifact_encoder.extension(artifact_options)
+        
+        anomaly_result = leaf_result.anomaly_result
+        disease_result = leaf_result.disease_result
+        
+        # Build diseases dictionary for this leaf
+        diseases = {}
+        
+        # Check if leaf is diseased
+        is_diseased = anomaly_result.is_diseased
+        
+        if is_diseased:
+            # Add specific disease information if available
+            if disease_result and disease_result.disease_info:
+                for disease_info in disease_result.disease_info:
+                    disease_name_raw = disease_info.get('name', 'unknown_disease')
+                    confidence = disease_info.get('confidence', 0.0)
+                    percentage = disease_info.get('percentage', 0.0)
+                    
+                    # Normalize disease name to match database (proper case)
+                    disease_name = normalize_disease_name(disease_name_raw)
+                    
+                    # Get detailed disease information from database
+                    disease_details = get_disease_info(disease_name)
+                    
+                    if disease_details:
+                        # Disease found in database
+                        diseases[disease_name] = {
+                            'confidence': float(confidence),
+                            'percentage': float(percentage),
+                            'description': disease_details.get('description', 'Unknown disease'),
+                            'severity': disease_details.get('severity', 'unknown'),
+                            'treatment': disease_details.get('treatment', 'Consult with agricultural specialist')
+                        }
+                    else:
+                        # Disease not in database, use generic info
+                        diseases[disease_name] = {
+                            'confidence': float(confidence),
+                            'percentage': float(percentage),
+                            'description': f'{disease_name} detected',
+                            'severity': 'unknown',
+                            'treatment': 'Consult with agricultural specialist for proper treatment'
+                        }
+            else:
+                # No specific disease detected, but anomaly score indicates disease
+                # Only add if confidence is reasonable
+                anomaly_confidence = anomaly_result.confidence / 100.0
+                if anomaly_confidence > 0.4:  # Only if >40% confidence
+                    diseases['Unknown Disease'] = {
+                        'confidence': float(anomaly_confidence),
+                        'percentage': 0.0,
+                        'description': 'Anomaly detected but specific disease type unidentified',
+                        'severity': 'unknown',
+                        'treatment': 'Further analysis recommended. Consult with agricultural specialist.'
+                    }
+        
+        # Reserve artifact URLs now; pixels are encoded in the background
+        leaf_url = None
+        heatmap_url = None
+        overlay_url = None
+        leaf_image = leaf_result.leaf_image
+        
+        # Raw low-resolution anomaly map for client-side colorizing
+        anomaly_map = anomaly_result.anomaly_map
+        anomaly_map_data = None
+        if map_encoding != 'off' and anomaly_map is not None:
+            anomaly_map_data = describe_anomaly_map(anomaly_map, map_encoding, leaf_result.leaf_size)
+            if map_encoding == 'png':
+                map_filename = self.artifact_store.name_for('anomalymap', content_key(anomaly_map), '.png')
+                self.store_artifact(
+                    map_filename, lambda am=anomaly_map: anomaly_map_png(am), ANOMALY_MAP_PNG_OPTIONS
+                )
+                anomaly_map_data['url'] = f"{base_url}/static/{map_filename}"
+        
+        if artifact_mode != 'none':
+            # Content-addressed names: identical leaves reuse the stored file
+            encoding = (artifact_options['format'], artifact_options['quality'], artifact_options['max_dim'])
+            leaf_key = content_key(leaf_image, *encoding)
+            leaf_filename = self.artifact_store.name_for('leaf', leaf_key, ext)
+            self.store_artifact(leaf_filename, lambda img=leaf_image: img, artifact_options)
+            leaf_url = f"{base_url}/static/{leaf_filename}"
+            
+            # Heatmap and overlay are only rendered if someone fetches them
+            if artifact_mode == 'all' and map_encoding == 'off' and anomaly_map is not None:
+                options = {name: artifact_options[name] for name in ('format', 'quality', 'max_dim')}
+                # Both recipes share one stored copy of the map
+                packed_map = pack_anomaly_map(anomaly_map)
+                map_key = content_key(anomaly_map)
+                heatmap_key = content_key(anomaly_map, leaf_result.leaf_size, *encoding)
+                heatmap_filename = self.artifact_store.name_for('heatmap', heatmap_key, ext)
+                self.defer_artifact(heatmap_filename, {
+                    'kind': 'heatmap',
+                    'size': list(leaf_result.leaf_size),
+                    'options': options
+                }, data_key=map_key, data=packed_map)
+                heatmap_url = f"{base_url}/static/{heatmap_filename}"
+                
+                overlay_filename = self.artifact_store.name_for(
+                    'overlay', content_key(leaf_key, heatmap_key), ext
+                )
+                # The overlay blends onto the leaf artifact, so the leaf is pinned until the recipe expires
+                self.defer_artifact(overlay_filename, {
+                    'kind': 'overlay',
+                    'leaf': leaf_filename,
+                    'options': options
+                }, source=leaf_filename, data_key=map_key, data=packed_map)
+                overlay_url = f"{base_url}/static/{overlay_filename}"
+        
+        # Get bounding box coordinates
+        bbox = leaf_result.bbox
+        bbox_data = None
+        if bbox:
+            x1, y1, x2, y2 = bbox
+            bbox_data = {
+                'x1': int(x1),
+                'y1': int(y1),
+                'x2': int(x2),
+                'y2': int(y2)
+            }
+        
+        return {
+            "image": leaf_url,
+            "heatmap": heatmap_url,
+            "overlay": overlay_url,
+            "anomaly_map": anomaly_map_data,
+            "bbox": bbox_data,
+            "diseases": diseases,
+            "anomaly_score": float(anomaly_result.anomaly_score),
+            "is_diseased": bool(is_diseased)
+        }
+    
+    def observe_pipeline_seconds(self, seconds, profiled=False):
+        """
+        Update the moving average of pipeline time per image
+        Profiled runs are kept out of the average and recorded as a slowdown against it
+        """
+        if profiled:
+            if self.pipeline_seconds:
+                self.profiler_slowdown.observe(seconds / self.pipeline_seconds)
+            return
+        if self.pipeline_seconds is None:
+            self.pipeline_seconds = seconds
+        else:
+            self.pipeline_seconds += 0.1 * (seconds - self.pipeline_seconds)
+    
+    def rejection_response(self, error):
+        """Structured body for an image the quality gate rejected"""
+        return {
+            "error": str(error),
+            "reason": error.reason,
+            "quality": error.verdict['measurements'],
+            "status": 422,
+            "timestamp": datetime.now().isoformat(),
+            "image_processed": False
+        }
+    
+    def process_bulk_images(self, image_urls, artifact_options=None, profile=None, deadline=None, lane='bulk'):
+        """
+        Process multiple images and return array of results
+        Each image checks out a replica on its own, so interactive requests
+        are served between the images of a bulk request
+        """
         results = []
         
         for i, image_url in enumerate(image_urls, 1):
+            # Images the deadline no longer allows are reported instead of processed
+            if deadline is not None:
+                if deadline.client_gone():
+                    raise DeadlineExceeded("Client disconnected during bulk processing", cancelled=True)
+                if deadline.expired():
+                    deadline.skip('images')
+                    results.append({
+                        "error": "Deadline exceeded before this image was processed",
+                        "timestamp": datetime.now().isoformat(),
+                        "image_processed": False,
+                        "image_url": image_url,
+                        "processing_index": i
+                    })
+                    print(f"   ⏰ Skipped {i}/{len(image_urls)}: deadline exceeded")
+                    continue
+            
             print(f"📸 Processing image {i}/{len(image_urls)}: {image_url}")
             
             try:
-                # Download image
-                temp_image_path = self.download_image(image_url)
+                # Download and detect diseases
+                result = self.process_image_url(image_url, artifact_options, profile, deadline, lane)
                 
-                if temp_image_path:
-                    try:
-                        # Detect diseases
-                        result = self.detect_diseases(temp_image_path)
-                        result['image_url'] = image_url
-                        result['processing_index'] = i
-                        
-                        # Clean up temp file (only if it's a downloaded temp file, not a local file)
-                        try:
-                            parsed = urlparse(image_url)
-                            if parsed.scheme != 'file' and temp_image_path.startswith(tempfile.gettempdir()):
-                                os.remove(temp_image_path)
-                        except:
-                            pass
-                            
-                        results.append(result)
-                        leaf_count = len(result.get('leafs', []))
-                        print(f"   ✅ Completed {i}/{len(image_urls)} - {leaf_count} leaf/leaves")
-                    except ValueError as e:
-                        # No leaves detected
-                        error_result = {
-                            "error": str(e),
-                            "timestamp": datetime.now().isoformat(),
-                            "image_processed": False,
-                            "image_url": image_url,
-                            "processing_index": i
-                        }
-                        results.append(error_result)
-                        print(f"   ⚠️ No leaves {i}/{len(image_urls)}: {e}")
+                if result is not None:
+                    result['image_url'] = image_url
+                    result['processing_index'] = i
+                    results.append(result)
+                    leaf_count = len(result.get('leafs', []))
+                    print(f"   ✅ Completed {i}/{len(image_urls)} - {leaf_count} leaf/leaves")
                 else:
                     # Failed to download
                     error_result = {
@@ -626,6 +1941,35 @@ Cache-Control: public, max-age=3600\r
                     results.append(error_result)
                     print(f"   ❌ Failed to download {i}/{len(image_urls)}")
                     
+            except ImageRejected as e:
+                error_result = self.rejection_response(e)
+                error_result['image_url'] = image_url
+                error_result['processing_index'] = i
+                results.append(error_result)
+                print(f"   🚫 Rejected {i}/{len(image_urls)} ({e.reason}): {e}")
+            except ValueError as e:
+                # No leaves detected
+                error_result = {
+                    "error": str(e),
+                    "timestamp": datetime.now().isoformat(),
+                    "image_processed": False,
+                    "image_url": image_url,
+                    "processing_index": i
+                }
+                results.append(error_result)
+                print(f"   ⚠️ No leaves {i}/{len(image_urls)}: {e}")
+            except DeadlineExceeded as e:
+                if e.cancelled:
+                    raise
+                deadline.skip('images')
+                results.append({
+                    "error": str(e),
+                    "timestamp": datetime.now().isoformat(),
+                    "image_processed": False,
+                    "image_url": image_url,
+                    "processing_index": i
+                })
+                print(f"   ⏰ Deadline exceeded {i}/{len(image_urls)}: {e}")
             except Exception as e:
                 # Processing error
                 error_result = {
@@ -640,18 +1984,20 @@ Cache-Control: public, max-age=3600\r
         
         return results
     
-    def send_json_response(self, client_socket, data):
+    def send_json_response(self, client_socket, data, status_code=200):
         """Send JSON HTTP response"""
         json_data = json.dumps(data, indent=2)
-        response = f"""HTTP/1.1 200 OK\r
+        reason = HTTP_REASONS.get(status_code, 'OK')
+        self.request_local.status = status_code
+        response = f"""HTTP/1.1 {status_code} {reason}\r
 Content-Type: application/json\r
-Content-Length: {len(json_data)}\r
+Content-Length: {len(json_data.encode('utf-8'))}\r
 Access-Control-Allow-Origin: *\r
-Access-Control-Allow-Methods: GET, OPTIONS\r
-Access-Control-Allow-Headers: Content-Type\r
+Access-Control-Allow-Methods: GET, HEAD, POST, OPTIONS\r
+Access-Control-Allow-Headers: Content-Type, Range, If-None-Match, If-Modified-Since, X-Deadline-Ms\r
 \r
 {json_data}"""
-        client_socket.send(response.encode())
+        client_socket.sendall(response.encode())
     
     def send_error_response(self, client_socket, status_code, message):
         """Send error HTTP response"""
@@ -661,27 +2007,29 @@ Access-Control-Allow-Headers: Content-Type\r
             "timestamp": datetime.now().isoformat()
         }
         json_data = json.dumps(error_data, indent=2)
+        self.request_local.status = status_code
         
         response = f"""HTTP/1.1 {status_code} Error\r
 Content-Type: application/json\r
-Content-Length: {len(json_data)}\r
+Content-Length: {len(json_data.encode('utf-8'))}\r
 Access-Control-Allow-Origin: *\r
-Access-Control-Allow-Methods: GET, OPTIONS\r
-Access-Control-Allow-Headers: Content-Type\r
+Access-Control-Allow-Methods: GET, HEAD, POST, OPTIONS\r
+Access-Control-Allow-Headers: Content-Type, Range, If-None-Match, If-Modified-Since, X-Deadline-Ms\r
 \r
 {json_data}"""
-        client_socket.send(response.encode())
+        client_socket.sendall(response.encode())
     
     def send_cors_response(self, client_socket):
         """Send CORS preflight response"""
+        self.request_local.status = 200
         response = """HTTP/1.1 200 OK\r
 Access-Control-Allow-Origin: *\r
-Access-Control-Allow-Methods: GET, OPTIONS\r
-Access-Control-Allow-Headers: Content-Type\r
+Access-Control-Allow-Methods: GET, HEAD, POST, OPTIONS\r
+Access-Control-Allow-Headers: Content-Type, Range, If-None-Match, If-Modified-Since, X-Deadline-Ms\r
 Content-Length: 0\r
 \r
 """
-        client_socket.send(response.encode())
+        client_socket.sendall(response.encode())
     
     def get_local_ip(self):
         """Get local IP address"""
@@ -703,6 +2051,11 @@ Content-Length: 0\r
                 self.server_socket.close()
             except:
                 pass
+        for worker in self.job_threads:
+            worker.join(timeout=2.0)
+        self.job_queue.close()
+        self.artifact_encoder.shutdown()
+        self.artifact_store.close()
         print("\n🛑 Server stopped")
 
 def main():
@@ -710,20 +2063,112 @@ def main():
     print("🍇 Grape Leaf Disease Detection API Server")
     print("=" * 50)
     
-    # Default configuration
-    host = '0.0.0.0'  # Listen on all interfaces for network access
-    port = 8888
+    parser = argparse.ArgumentParser(description='Grape Leaf Disease Detection API Server')
+    parser.add_argument('port', type=int, nargs='?', default=8888, help='Port to listen on')
+    parser.add_argument('--host', type=str, default='0.0.0.0', help='Interface to listen on')
+    parser.add_argument('--job-workers', type=int, default=1, help='Threads draining the async job queue')
+    parser.add_argument('--jobs-db', type=str, default=None, help='SQLite file for the async job queue')
+    parser.add_argument('--encoder-workers', type=int, default=ENCODER_WORKERS, help='Threads encoding leaf/heatmap/overlay images')
+    parser.add_argument('--static-max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), help='Size cap of the static artifact store (0 = unlimited)')
+    parser.add_argument('--static-ttl-hours', type=float, default=DEFAULT_TTL / 3600, help='Evict artifacts not accessed for this long (0 = never)')
+    parser.add_argument('--workers', type=int, default=1, help='Pre-forked worker processes sharing one model load (1 = single process)')
+    parser.add_argument('--threads-per-worker', type=int, default=None, help='CPU threads available to each worker (default: cores / workers)')
+    parser.add_argument('--replicas', type=int, default=1, help='Independent model replicas per process for concurrent inference')
+    parser.add_argument('--replica-devices', type=str, default=None, help='Comma-separated devices assigned round-robin, e.g. cuda:0,cuda:1')
+    parser.add_argument('--threads-per-replica', type=int, default=None, help='CPU threads used by each running replica (default: threads per worker / replicas)')
+    parser.add_argument('--torch-threads', type=int, default=None, help='Torch intra-op threads (default: threads per replica)')
+    parser.add_argument('--torch-interop-threads', type=int, default=None, help='Torch inter-op threads (default: 1)')
+    parser.add_argument('--opencv-threads', type=int, default=None, help='OpenCV threads (default: threads per replica)')
+    parser.add_argument('--blas-threads', type=int, default=None, help='BLAS/OpenMP threads (default: threads per replica)')
+    parser.add_argument('--knn-jobs', type=int, default=None, help='sklearn/joblib jobs for PatchCore k-NN queries (default: 1)')
+    parser.add_argument('--warmup-sizes', type=str, default=None, help='Synthetic warmup frames as WxH list, e.g. 640x480,1920x1440 ("none" to skip)')
+    parser.add_argument('--ready-max-queue', type=int, default=READY_MAX_QUEUE_DEPTH, help='Queued jobs above which /readyz reports 503')
+    parser.add_argument('--profile', type=str, default=DEFAULT_PROFILE, choices=list(QUALITY_PROFILES), help='Quality profile used when a request has no ?profile=')
+    parser.add_argument('--profiles', type=str, default=','.join(RESIDENT_PROFILES), help='Comma-separated profiles whose models stay loaded, e.g. fast,balanced,accurate')
+    parser.add_argument('--default-deadline-ms', type=int, default=0, help='Deadline for /api/process requests without X-Deadline-Ms (0 = none)')
+    parser.add_argument('--interactive-share', type=int, default=INTERACTIVE_SHARE, help='Interactive replica checkouts granted in a row before waiting bulk work gets one')
+    parser.add_argument('--bulk-aging-seconds', type=float, default=BULK_AGING_SECONDS, help='Serve a bulk image next once it has waited this long for a replica')
+    parser.add_argument('--speculation', type=str, default='auto', choices=['auto', 'on', 'off'], help='Run disease YOLO concurrently with anomaly scoring (auto = when the cost model expects a gain)')
+    parser.add_argument('--quality-gate', type=str, default='off', help='Image quality gate: off (default), on, or threshold overrides such as min_sharpness=30,min_green_ratio=0.02')
+    parser.add_argument('--profile-sample-rate', type=float, default=0.0, help='Fraction of single-image requests run under cProfile and the torch profiler (0 = none)')
+    parser.add_argument('--config', type=str, default=None, help='JSON file with defaults for any of these options, e.g. {"workers": 4}')
     
-    # Allow custom port via command line
-    if len(sys.argv) > 1:
+    # Values from the config file become defaults, so explicit flags still win
+    config_args, _ = parser.parse_known_args()
+    if config_args.config:
         try:
-            port = int(sys.argv[1])
+            parser.set_defaults(**load_config_file(config_args.config))
+        except (OSError, ValueError) as e:
+            parser.error(f"Cannot read config file: {e}")
+    args = parser.parse_args()
+    
+    if args.workers > 1 and not fork_supported():
+        print("⚠️ Pre-fork mode needs os.fork; falling back to a single process")
+        args.workers = 1
+    
+    thread_budget = ThreadBudget(
+        workers=args.workers,
+        replicas=args.replicas,
+        threads_per_worker=args.threads_per_worker,
+        threads_per_replica=args.threads_per_replica,
+        torch_threads=args.torch_threads,
+        torch_interop_threads=args.torch_interop_threads,
+        opencv_threads=args.opencv_threads,
+        blas_threads=args.blas_threads,
+        knn_jobs=args.knn_jobs
+    )
+    thread_budget.apply_environment()
+    thread_budget.report()
+    
+    try:
+        resident_profiles = parse_profile_list(args.profiles)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    warmup_sizes = None
+    if args.warmup_sizes is not None:
+        try:
+            warmup_sizes = [] if args.warmup_sizes.lower() == 'none' else [
+                tuple(int(v) for v in size.lower().split('x', 1)) for size in args.warmup_sizes.split(',')
+            ]
         except ValueError:
-            print("❌ Invalid port number")
-            sys.exit(1)
+            parser.error(f"Invalid --warmup-sizes: {args.warmup_sizes}")
+    
+    try:
+        gate_thresholds = parse_gate_thresholds(args.quality_gate)
+    except ValueError as e:
+        parser.error(f"Invalid --quality-gate: {e}")
+    
+    if not 0.0 <= args.profile_sample_rate <= 1.0:
+        parser.error("--profile-sample-rate must be between 0 and 1")
     
     # Create and start server
-    api_server = DiseaseDetectionAPI(host, port)
+    api_server = DiseaseDetectionAPI(
+        args.host,
+        args.port,
+        job_workers=args.job_workers,
+        jobs_db=args.jobs_db,
+        encoder_workers=args.encoder_workers,
+        static_max_bytes=args.static_max_mb * 1024 * 1024,
+        static_ttl=args.static_ttl_hours * 3600,
+        replicas=args.replicas,
+        replica_devices=args.replica_devices.split(',') if args.replica_devices else None,
+        thread_budget=thread_budget,
+        warmup_sizes=warmup_sizes,
+        ready_max_queue_depth=args.ready_max_queue,
+        profile=args.profile,
+        resident_profiles=resident_profiles,
+        default_deadline_ms=args.default_deadline_ms or None,
+        interactive_share=args.interactive_share,
+        bulk_aging_seconds=args.bulk_aging_seconds,
+        speculation=args.speculation,
+        gate_thresholds=gate_thresholds,
+        profile_sample_rate=args.profile_sample_rate
+    )
+    
+    if args.workers > 1:
+        PreforkServer(api_server, args.workers, thread_budget).run()
+        return
     
     try:
         api_server.start_server()
@@ -0,0 +1,189 @@
+"""
+Artifact Encoder
+Write-behind encoding of leaf, heatmap and overlay images.
+URLs are reserved up front and the pixels are encoded on a background pool,
+so the API can respond before any image has been written to the artifact store.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from anomaly_map import ANOMALY_MAP_ENCODINGS
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+# format -> (file extension, OpenCV quality flag)
+ARTIFACT_FORMATS = {
+    'jpeg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY),
+    'png': ('.png', cv2.IMWRITE_PNG_COMPRESSION)
+}
+
+# none: numbers only, leaf: leaf crop only, all: leaf + heatmap + overlay
+ARTIFACT_MODES = ('none', 'leaf', 'all')
+
+DEFAULT_ARTIFACT_OPTIONS = {
+    'format': 'jpeg',
+    'quality': 85,      # 1-100, mapped to a compression level for PNG
+    'max_dim': None,    # Longest side in pixels, None keeps the original size
+    'artifacts': 'all',
+    'anomaly_map': 'off'    # Raw anomaly map instead of heatmap/overlay images (see anomaly_map.py)
+}
+
+ENCODER_WORKERS = 2
+MAX_PENDING_ARTIFACTS = 64  # Back-pressure: images held in memory awaiting encode
+
+
+def parse_artifact_options(params, defaults=None):
+    """
+    Build artifact options from query parameters (parse_qs format)
+    Raises ValueError with a client-facing message on invalid input
+    """
+    options = dict(defaults or DEFAULT_ARTIFACT_OPTIONS)
+
+    def param(name):
+        value = params.get(name)
+        if isinstance(value, list):
+            value = value[0] if value else None
+        return value
+
+    fmt = param('format')
+    if fmt:
+        fmt = fmt.lower()
+        if fmt == 'jpg':
+            fmt = 'jpeg'
+        if fmt not in ARTIFACT_FORMATS:
+            raise ValueError(f"Unsupported format '{fmt}' (choose from {', '.join(ARTIFACT_FORMATS)})")
+        options['format'] = fmt
+
+    quality = param('quality')
+    if quality not in (None, ''):
+        try:
+            quality = int(quality)
+        except (TypeError, ValueError):
+            raise ValueError("quality must be an integer between 1 and 100")
+        if not 1 <= quality <= 100:
+            raise ValueError("quality must be an integer between 1 and 100")
+        options['quality'] = quality
+
+    max_dim = param('max_dim')
+    if max_dim not in (None, ''):
+        try:
+            max_dim = int(max_dim)
+        except (TypeError, ValueError):
+            raise ValueError("max_dim must be a positive integer")
+        if max_dim <= 0:
+            raise ValueError("max_dim must be a positive integer")
+        options['max_dim'] = max_dim
+
+    artifacts = param('artifacts')
+    if artifacts:
+        artifacts = artifacts.lower()
+        if artifacts not in ARTIFACT_MODES:
+            raise ValueError(f"artifacts must be one of {', '.join(ARTIFACT_MODES)}")
+        options['artifacts'] = artifacts
+
+    anomaly_map = param('anomaly_map')
+    if anomaly_map:
+        anomaly_map = anomaly_map.lower()
+        if anomaly_map not in ANOMALY_MAP_ENCODINGS:
+            raise ValueError(f"anomaly_map must be one of {', '.join(ANOMALY_MAP_ENCODINGS)}")
+        options['anomaly_map'] = anomaly_map
+
+    return options
+
+
+def encode_image(image, options):
+    """Resize (if requested) and encode an image, returning the encoded bytes"""
+    max_dim = options.get('max_dim')
+    if max_dim:
+        h, w = image.shape[:2]
+        scale = max_dim / float(max(h, w))
+        if scale < 1.0:
+            image = cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))),
+                               interpolation=cv2.INTER_AREA)
+
+    ext, quality_flag = ARTIFACT_FORMATS[options['format']]
+    quality = options.get('quality', DEFAULT_ARTIFACT_OPTIONS['quality'])
+    if options['format'] == 'png':
+        # PNG is lossless; map quality 100 -> fastest, 1 -> smallest
+        quality = min(9, max(0, round((100 - quality) / 11)))
+
+    ok, encoded = cv2.imencode(ext, image, [quality_flag, int(quality)])
+    if not ok:
+        raise ValueError(f"Failed to encode image as {options['format']}")
+    return encoded.tobytes()
+
+
+class ArtifactEncoder:
+    """Background pool that encodes and writes artifacts after their URLs are handed out"""
+
+    def __init__(self, store, workers=ENCODER_WORKERS, max_pending=MAX_PENDING_ARTIFACTS):
+        self.store = store
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='artifact-encoder')
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_pending)
+
+    def extension(self, options):
+        """File extension for the given artifact options"""
+        return ARTIFACT_FORMATS[options['format']][0]
+
+    def submit(self, filename, render, options):
+        """
+        Queue an artifact for encoding
+        render is a callable returning the BGR image; it runs on the pool so
+        derived images (overlays) are also built off the request thread
+        """
+        # Blocks when too many images are waiting, bounding memory held by the queue
+        self.slots.acquire()
+        try:
+            with self.lock:
+                future = self.executor.submit(self._write, filename, render, options)
+                self.pending[filename] = future
+        except Exception:
+            self.slots.release()
+            raise
+
+        future.add_done_callback(lambda f: self._done(filename, f))
+        return future
+
+    def _write(self, filename, render, options):
+        return self.store.put(filename, encode_image(render(), options))
+
+    def _done(self, filename, future):
+        self.slots.release()
+        with self.lock:
+            if self.pending.get(filename) is future:
+                del self.pending[filename]
+        if future.exception() is not None:
+            print(f"⚠️ Artifact encoding failed for {filename}: {future.exception()}")
+
+    def is_pending(self, filename):
+        """True if the artifact is queued or being encoded"""
+        with self.lock:
+            return filename in self.pending
+
+    def wait(self, filename, timeout=30):
+        """Block until a pending artifact has been written; no-op if not pending"""
+        with self.lock:
+            future = self.pending.get(filename)
+        if future is None:
+            return True
+        try:
+            future.result(timeout=timeout)
+            return True
+        except Exception:
+            return False
+
+    def pending_count(self):
+        """Number of artifacts queued or being encoded"""
+        with self.lock:
+            return len(self.pending)
+
+    def shutdown(self, wait=True):
+        """Flush queued artifacts and stop the pool"""
+        self.executor.shutdown(wait=wait)
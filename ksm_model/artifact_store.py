@@ -0,0 +1,340 @@
+"""
+Artifact Store
+Bounded, content-addressed storage for the images served from /static/.
+Files are sharded into subdirectories, tracked in a SQLite index and evicted
+by TTL and least-recent access once the byte cap is exceeded. Derived images
+can be registered as recipes instead of files and rendered on first fetch.
+A recipe may name a source artifact it renders from, which is then evicted only
+after unpinned files (together with its recipe) and may share a data blob
+with other recipes.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3   # 2 GB
+DEFAULT_TTL = 7 * 24 * 3600         # Unused artifacts expire after a week
+SWEEP_INTERVAL = 60                 # Minimum seconds between TTL sweeps
+INDEX_FILENAME = '.artifact_index.sqlite3'
+MAX_RECIPES = 100000                # Recipes kept beyond the TTL sweep, most recently used first
+
+# Files in the static root that belong to the web UI, never evicted
+RESERVED_FILES = ('index.html',)
+
+
+def content_key(*parts):
+    """Hash arrays, bytes and strings into a stable hex digest"""
+    digest = hashlib.sha1()
+    for part in parts:
+        if hasattr(part, 'tobytes'):
+            # Include shape and dtype so equal bytes in different layouts differ
+            digest.update(f"{part.shape}{part.dtype}".encode())
+            digest.update(part.tobytes())
+        elif isinstance(part, bytes):
+            digest.update(part)
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b'|')
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """Size- and age-bounded artifact directory with LRU eviction"""
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.last_sweep = 0
+        self.last_recipe_prune = 0
+        self._conn = None
+        self._conn_pid = None
+
+        os.makedirs(self.root, exist_ok=True)
+
+        with self.lock:
+            conn = self._connection()
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    name TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_access ON artifacts (last_access)")
+            # Running byte total kept by triggers, so eviction never scans the table;
+            # in SQLite rather than in memory because pre-fork workers share the store
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS artifact_totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    bytes INTEGER NOT NULL
+                )
+            """)
+            conn.execute(
+                "INSERT OR IGNORE INTO artifact_totals (id, bytes) SELECT 0, COALESCE(SUM(size), 0) FROM artifacts"
+            )
+            conn.executescript("""
+                CREATE TRIGGER IF NOT EXISTS artifacts_total_insert AFTER INSERT ON artifacts
+                BEGIN UPDATE artifact_totals SET bytes = bytes + NEW.size; END;
+                CREATE TRIGGER IF NOT EXISTS artifacts_total_delete AFTER DELETE ON artifacts
+                BEGIN UPDATE artifact_totals SET bytes = bytes - OLD.size; END;
+                CREATE TRIGGER IF NOT EXISTS artifacts_total_update AFTER UPDATE OF size ON artifacts
+                BEGIN UPDATE artifact_totals SET bytes = bytes + NEW.size - OLD.size; END;
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS recipes (
+                    name TEXT PRIMARY KEY,
+                    recipe TEXT NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            # Source artifacts are pinned; data blobs are shared between recipes
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(recipes)")}
+            for column in ('source', 'data_key'):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE recipes ADD COLUMN {column} TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_recipes_source ON recipes (source)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_recipes_data ON recipes (data_key)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS recipe_data (
+                    key TEXT PRIMARY KEY,
+                    data TEXT NOT NULL
+                )
+            """)
+
+            if conn.execute("SELECT COUNT(*) FROM artifacts").fetchone()[0] == 0:
+                self._index_existing_files(conn)
+
+    def _connection(self):
+        """Return the SQLite connection for the current process"""
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(
+                os.path.join(self.root, INDEX_FILENAME),
+                timeout=30,
+                isolation_level=None,
+                check_same_thread=False
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _index_existing_files(self, conn):
+        """Adopt files written before the index existed so they can be evicted"""
+        adopted = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.startswith('.') or filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if name in RESERVED_FILES:
+                    continue
+                stat = os.stat(path)
+                conn.execute(
+                    "INSERT OR IGNORE INTO artifacts (name, size, created_at, last_access) VALUES (?, ?, ?, ?)",
+                    (name, stat.st_size, stat.st_mtime, stat.st_mtime)
+                )
+                adopted += 1
+        if adopted:
+            print(f"🗃️ Indexed {adopted} existing static file(s)")
+
+    def name_for(self, kind, key, ext):
+        """Sharded relative name for a content key, e.g. 'ab/leaf-ab12...jpg'"""
+        return f"{key[:2]}/{kind}-{key}{ext}"
+
+    def path(self, name):
+        """
+        Absolute path for an artifact name, or None if it escapes the store or names
+        a private file: the SQLite index (and its -wal/-shm files) or a partial write
+        """
+        if any(part.startswith('.') for part in name.replace('\\', '/').split('/')) or name.endswith('.tmp'):
+            return None
+        path = os.path.abspath(os.path.join(self.root, name))
+        if not path.startswith(self.root + os.sep):
+            return None
+        return path
+
+    def contains(self, name):
+        """True if the artifact is indexed and present on disk"""
+        path = self.path(name)
+        if path is None or not os.path.exists(path):
+            return False
+        with self.lock:
+            row = self._connection().execute(
+                "SELECT 1 FROM artifacts WHERE name = ?", (name,)
+            ).fetchone()
+        return row is not None
+
+    def put(self, name, data):
+        """Atomically write an artifact and evict old ones if over budget"""
+        path = self.path(name)
+        if path is None:
+            raise ValueError(f"Invalid artifact name: {name}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temp name and rename, so readers never see partial files
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self.lock:
+            # An upsert, not OR REPLACE: a replace would skip the delete trigger
+            self._connection().execute(
+                "INSERT INTO artifacts (name, size, created_at, last_access) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET size = excluded.size, created_at = excluded.created_at, "
+                "last_access = excluded.last_access",
+                (name, len(data), now, now)
+            )
+        self.evict()
+        return path
+
+    def touch(self, name):
+        """Record an access for LRU ordering"""
+        with self.lock:
+            self._connection().execute(
+                "UPDATE artifacts SET last_access = ? WHERE name = ?",
+                (time.time(), name)
+            )
+
+    def put_recipe(self, name, recipe, source=None, data_key=None, data=None):
+        """
+        Register how to render an artifact that is only written when first fetched
+        source names an artifact the recipe renders from; it is not evicted while the
+        recipe exists. data is stored once under data_key and returned as recipe['data'].
+        """
+        with self.lock:
+            conn = self._connection()
+            if data_key is not None and data is not None:
+                conn.execute(
+                    "INSERT OR IGNORE INTO recipe_data (key, data) VALUES (?, ?)", (data_key, json.dumps(data))
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO recipes (name, recipe, source, data_key, last_access) VALUES (?, ?, ?, ?, ?)",
+                (name, json.dumps(recipe), source, data_key, time.time())
+            )
+
+    def recipe(self, name):
+        """The recipe registered for an artifact name (refreshing its access time), or None"""
+        with self.lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT r.recipe, d.data FROM recipes r LEFT JOIN recipe_data d ON d.key = r.data_key "
+                "WHERE r.name = ?", (name,)
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE recipes SET last_access = ? WHERE name = ?", (time.time(), name))
+        if row is None:
+            return None
+        recipe = json.loads(row[0])
+        if row[1] is not None:
+            recipe['data'] = json.loads(row[1])
+        return recipe
+
+    def total_bytes(self):
+        """Bytes currently tracked by the index"""
+        with self.lock:
+            return self._connection().execute(
+                "SELECT bytes FROM artifact_totals"
+            ).fetchone()[0]
+
+    def evict(self, force_sweep=False):
+        """Remove expired artifacts, then least-recently used ones until under the cap"""
+        now = time.time()
+        removed = []
+        removed_bytes = 0
+
+        with self.lock:
+            conn = self._connection()
+
+            if self.ttl and (force_sweep or now - self.last_sweep >= SWEEP_INTERVAL):
+                self.last_sweep = now
+                # Rendered files can be evicted and rendered again; recipes only expire
+                conn.execute("DELETE FROM recipes WHERE last_access < ?", (now - self.ttl,))
+                rows = conn.execute(
+                    "SELECT name, size FROM artifacts WHERE last_access < ? "
+                    "AND name NOT IN (SELECT source FROM recipes WHERE source IS NOT NULL)",
+                    (now - self.ttl,)
+                ).fetchall()
+                removed.extend(row[0] for row in rows)
+                removed_bytes = sum(row[1] for row in rows)
+
+            if force_sweep or now - self.last_recipe_prune >= SWEEP_INTERVAL:
+                self.last_recipe_prune = now
+                conn.execute(
+                    "DELETE FROM recipes WHERE name NOT IN "
+                    "(SELECT name FROM recipes ORDER BY last_access DESC LIMIT ?)",
+                    (MAX_RECIPES,)
+                )
+                conn.execute(
+                    "DELETE FROM recipe_data WHERE key NOT IN "
+                    "(SELECT data_key FROM recipes WHERE data_key IS NOT NULL)"
+                )
+
+            if self.max_bytes:
+                # Expired sizes come from the rows above: an IN (...) over every expired
+                # name could exceed SQLite's limit on bound variables
+                total = conn.execute("SELECT bytes FROM artifact_totals").fetchone()[0] - removed_bytes
+
+                if total > self.max_bytes:
+                    # Sources of live recipes stay until their recipes expire
+                    skip = set(removed)
+                    skip.update(row[0] for row in conn.execute(
+                        "SELECT DISTINCT source FROM recipes WHERE source IS NOT NULL"
+                    ))
+                    for name, size in conn.execute("SELECT name, size FROM artifacts ORDER BY last_access"):
+                        if total <= self.max_bytes:
+                            break
+                        if name in skip:
+                            continue
+                        removed.append(name)
+                        total -= size
+
+                if total > self.max_bytes:
+                    # Pinned sources alone exceed the cap: drop the least recently used
+                    # recipes together with their sources (those URLs then return 404)
+                    rows = conn.execute(
+                        "SELECT r.source, a.size FROM recipes r JOIN artifacts a ON a.name = r.source "
+                        "GROUP BY r.source ORDER BY MAX(r.last_access)"
+                    ).fetchall()
+                    for source, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        conn.execute("DELETE FROM recipes WHERE source = ?", (source,))
+                        removed.append(source)
+                        total -= size
+
+            for name in removed:
+                conn.execute("DELETE FROM artifacts WHERE name = ?", (name,))
+
+        for name in removed:
+            path = self.path(name)
+            try:
+                if path:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"⚠️ Failed to evict {name}: {e}")
+
+        if removed:
+            print(f"🧹 Evicted {len(removed)} artifact(s)")
+        return len(removed)
+
+    def close(self):
+        """Close the index connection"""
+        with self.lock:
+            if self._conn is not None and self._conn_pid == os.getpid():
+                self._conn.close()
+            self._conn = None
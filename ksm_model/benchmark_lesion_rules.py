@@ -0,0 +1,107 @@
+"""
+Compare the rule-based lesion classifier with disease YOLO
+Runs LesionRuleEngine and DiseaseSegmenter on the same leaf crops (extracted
+leaves on a black background) and reports per-leaf latency for both, plus how
+often they agree: diseased or not, top disease, and disease-mask IoU.
+
+Usage:
+    python benchmark_lesion_rules.py --leaves ./leaf_crops
+    python benchmark_lesion_rules.py --leaves ./leaf_crops --device cuda --repeat 3
+"""
+
+import os
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from disease_pipeline import DiseaseSegmenter, YOLO_DISEASE_MODEL
+from lesion_rules import LesionRuleEngine
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+
+def timed(fn, leaf, repeat):
+    """Return (result of the last run, best time in ms)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(leaf)
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return result, best
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def mask_iou(a, b):
+    """IoU of two disease masks; empty against empty counts as agreement"""
+    a, b = a > 0, b > 0
+    union = np.count_nonzero(a | b)
+    return 1.0 if union == 0 else np.count_nonzero(a & b) / union
+
+
+def top_disease(result):
+    return result['disease_info'][0]['name'] if result and result['disease_info'] else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rule-based lesion classifier vs disease YOLO')
+    parser.add_argument('--leaves', type=str, required=True, help='Folder of extracted leaf crops')
+    parser.add_argument('--yolo-disease', type=str, default=YOLO_DISEASE_MODEL, help='Disease detection model')
+    parser.add_argument('--device', type=str, default=None, help='Device for disease YOLO')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per leaf (best time is kept)')
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.leaves, name) for name in os.listdir(args.leaves)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        print(f"❌ No images in {args.leaves}")
+        return
+
+    rules = LesionRuleEngine()
+    segmenter = DiseaseSegmenter(args.yolo_disease, device=args.device)
+
+    rule_ms, yolo_ms, ious = [], [], []
+    same_verdict = same_top = both_diseased = 0
+    for path in paths:
+        leaf = cv2.imread(path)
+        if leaf is None:
+            print(f"⚠️  Skipping unreadable {path}")
+            continue
+        rule_result, rule_time = timed(lambda img: rules.classify(img, full_resolution=True), leaf, args.repeat)
+        yolo_result, yolo_time = timed(segmenter.segment_diseases, leaf, args.repeat)
+        rule_ms.append(rule_time)
+        yolo_ms.append(yolo_time)
+
+        same_verdict += (rule_result is None) == (yolo_result is None)
+        if rule_result and yolo_result:
+            both_diseased += 1
+            same_top += top_disease(rule_result) == top_disease(yolo_result)
+            ious.append(mask_iou(rule_result['disease_mask'], yolo_result['disease_mask']))
+
+    leaves = len(rule_ms)
+    print("📊 Lesion rules vs disease YOLO")
+    print("=" * 70)
+    print(f"Leaves: {leaves}")
+    print(f"{'backend':<16}{'p50':>12}{'p95':>12}{'mean':>12}")
+    print("-" * 70)
+    for name, values in (('rules', rule_ms), ('yolo', yolo_ms)):
+        print(f"{name:<16}{percentile(values, 50):>9.1f} ms{percentile(values, 95):>9.1f} ms"
+              f"{float(np.mean(values)) if values else 0.0:>9.1f} ms")
+    print("-" * 70)
+    if leaves:
+        print(f"Diseased/healthy agreement:    {same_verdict / leaves:.1%}")
+    if both_diseased:
+        print(f"Top disease agreement:         {same_top / both_diseased:.1%} of {both_diseased} leaves both flag")
+        print(f"Disease mask IoU (mean):       {float(np.mean(ious)):.3f}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
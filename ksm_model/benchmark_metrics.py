@@ -0,0 +1,103 @@
+"""
+Benchmark the cost of metric recording on the request hot path
+Measures Counter.inc / Gauge inc+dec / Histogram.observe and estimates the
+per-request overhead against a typical end-to-end processing time.
+
+Usage:
+    python benchmark_metrics.py
+    python benchmark_metrics.py --iterations 2000000 --threads 4
+"""
+
+import time
+import argparse
+import threading
+
+from metrics import MetricsRegistry, COUNT_BUCKETS
+
+# Metric operations recorded for one /api/process request with N leaves:
+# in-flight inc/dec, request latency + counter, download, extraction,
+# leaves-per-image, response build, image outcome, then per leaf anomaly,
+# disease stage and up to three artifact cache lookups
+FIXED_OPS_PER_REQUEST = 9
+OPS_PER_LEAF = 5
+TYPICAL_REQUEST_SECONDS = 2.0  # GPU single-image time from the README
+
+
+def time_ops(fn, iterations):
+    """Return nanoseconds per call of fn"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def run_threads(fn, iterations, threads):
+    """Return nanoseconds per call when fn is hammered from several threads"""
+    per_thread = iterations // threads
+    workers = [threading.Thread(target=lambda: [fn() for _ in range(per_thread)]) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return (time.perf_counter() - start) / (per_thread * threads) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Metric recording overhead benchmark')
+    parser.add_argument('--iterations', type=int, default=1_000_000, help='Operations per measurement')
+    parser.add_argument('--threads', type=int, default=4, help='Threads for the contention test')
+    parser.add_argument('--leaves', type=int, default=5, help='Leaves per request for the overhead estimate')
+    args = parser.parse_args()
+
+    registry = MetricsRegistry()
+    counter = registry.counter('bench_total', 'Benchmark counter')
+    gauge = registry.gauge('bench_in_flight', 'Benchmark gauge')
+    histogram = registry.histogram('bench_seconds', 'Benchmark histogram')
+    count_histogram = registry.histogram('bench_leaves', 'Benchmark leaves', COUNT_BUCKETS)
+
+    def baseline():
+        pass
+
+    def gauge_inc_dec():
+        gauge.inc()
+        gauge.dec()
+
+    cases = [
+        ('baseline (empty call)', baseline),
+        ('counter.inc() labelled', lambda: counter.inc(endpoint='/api/process', status='200')),
+        ('gauge.inc()+dec()', gauge_inc_dec),
+        ('histogram.observe() labelled', lambda: histogram.observe(0.42, stage='anomaly_detection')),
+        ('histogram.observe() counts', lambda: count_histogram.observe(7)),
+    ]
+
+    print("📊 Metric recording overhead")
+    print("=" * 70)
+    print(f"{'operation':<34}{'single thread':>16}{f'{args.threads} threads':>16}")
+    print("-" * 70)
+
+    results = {}
+    for name, fn in cases:
+        single = time_ops(fn, args.iterations)
+        contended = run_threads(fn, args.iterations, args.threads)
+        results[name] = (single, contended)
+        print(f"{name:<34}{single:>13.0f} ns{contended:>13.0f} ns")
+
+    baseline_ns = results['baseline (empty call)'][0]
+    worst_ns = max(max(v) for k, v in results.items() if k != 'baseline (empty call)') - baseline_ns
+    ops = FIXED_OPS_PER_REQUEST + OPS_PER_LEAF * args.leaves
+    per_request_us = ops * worst_ns / 1000
+
+    print("-" * 70)
+    print(f"Ops per request ({args.leaves} leaves): {ops}")
+    print(f"Worst-case cost per request:   {per_request_us:.1f} µs")
+    print(f"Share of a {TYPICAL_REQUEST_SECONDS:.0f} s request:      {per_request_us / (TYPICAL_REQUEST_SECONDS * 1e6) * 100:.4f}%")
+
+    start = time.perf_counter()
+    registry.render()
+    print(f"Rendering /metrics:            {(time.perf_counter() - start) * 1000:.2f} ms")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Throughput benchmark against a running API server
+Fires concurrent /api/process requests and reports images/second, latency
+percentiles and the replica wait time exported on /metrics, so settings
+such as --replicas can be compared on each machine type.
+
+With --sweep the benchmark starts its own server for each thread budget
+(semicolon-separated sets of api_server flags) and compares them.
+
+With --bulk-background the measured single-image requests run while bulk
+urls= requests keep the server busy, showing how well the interactive lane
+is protected.
+
+Usage:
+    python api_server.py --replicas 2 &
+    python benchmark_throughput.py --image-url file:///data/leaf.jpg --concurrency 4 --requests 40
+
+    python benchmark_throughput.py --image-url file:///data/leaf.jpg --concurrency 8 \
+        --sweep "workers=1,replicas=1;workers=1,replicas=2;workers=2,replicas=2,torch-threads=2"
+
+    python benchmark_throughput.py --image-url file:///data/leaf.jpg --concurrency 1,2 --bulk-background 20
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Seconds to wait for a sweep server to load its models
+SERVER_START_TIMEOUT = 300
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))
+    return ordered[index]
+
+
+def scrape_sum_count(server, metric):
+    """Return (sum, count) of a histogram from /metrics, added up over its labels"""
+    try:
+        text = requests.get(f"{server}/metrics", timeout=10).text
+    except requests.RequestException:
+        return 0.0, 0
+    total = re.findall(rf"^{metric}_sum(?:{{[^}}]*}})?\s+(\S+)$", text, re.M)
+    count = re.findall(rf"^{metric}_count(?:{{[^}}]*}})?\s+(\S+)$", text, re.M)
+    return sum(float(v) for v in total), sum(int(float(v)) for v in count)
+
+
+class BulkBackground:
+    """Keeps bulk urls= requests running against the server until stopped"""
+
+    def __init__(self, server, image_url, images_per_request):
+        # Different artifact options from the measured requests, so the two never coalesce
+        self.query = {'urls': ','.join([image_url] * images_per_request), 'artifacts': 'none', 'quality': '84'}
+        self.server = server
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.completed = 0
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                requests.get(f"{self.server}/api/process", params=self.query, timeout=3600)
+                self.completed += 1
+            except requests.RequestException:
+                time.sleep(1)
+
+    def __enter__(self):
+        self.thread.start()
+        # Let the first bulk request reach the pipeline before measuring
+        time.sleep(1)
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        return False
+
+
+def run_load(server, image_url, concurrency, total_requests, params=None):
+    """Send total_requests requests with the given concurrency, return a summary dict"""
+    query = {'url': image_url, 'artifacts': 'none'}
+    query.update(params or {})
+
+    def one_request(_):
+        start = time.perf_counter()
+        try:
+            response = requests.get(f"{server}/api/process", params=query, timeout=600)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return ok, time.perf_counter() - start
+
+    wait_before = scrape_sum_count(server, 'ksm_replica_wait_seconds')
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one_request, range(total_requests)))
+    elapsed = time.perf_counter() - start
+    wait_after = scrape_sum_count(server, 'ksm_replica_wait_seconds')
+
+    latencies = [latency for ok, latency in results if ok]
+    waits = wait_after[1] - wait_before[1]
+    return {
+        'ok': len(latencies),
+        'failed': len(results) - len(latencies),
+        'throughput': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'replica_wait_avg': (wait_after[0] - wait_before[0]) / waits if waits > 0 else 0.0
+    }
+
+
+def print_summary(label, summary):
+    print(f"{label:<40}{summary['throughput']:>10.2f}{summary['p50']:>10.2f}{summary['p95']:>10.2f}"
+          f"{summary['replica_wait_avg']:>12.3f}{summary['failed']:>8}")
+
+
+def print_header():
+    print(f"{'run':<40}{'img/s':>10}{'p50 s':>10}{'p95 s':>10}{'wait s':>12}{'fail':>8}")
+    print("-" * 90)
+
+
+def parse_sweep(spec):
+    """'workers=2,replicas=1;workers=4' -> [['--workers', '2', '--replicas', '1'], ['--workers', '4']]"""
+    settings = []
+    for entry in spec.split(';'):
+        flags = []
+        for pair in filter(None, (p.strip() for p in entry.split(','))):
+            name, _, value = pair.partition('=')
+            flags.extend([f"--{name.strip()}", value.strip()])
+        if flags:
+            settings.append(flags)
+    return settings
+
+
+def start_server(port, flags):
+    """Launch api_server.py with the given flags and wait until it answers /metrics"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api_server.py')
+    process = subprocess.Popen(
+        [sys.executable, script, str(port), '--host', '127.0.0.1'] + flags,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + SERVER_START_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode} for {' '.join(flags)}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/metrics", timeout=2)
+            return process
+        except requests.RequestException:
+            time.sleep(1)
+    stop_server(process)
+    raise RuntimeError(f"Server did not start within {SERVER_START_TIMEOUT}s")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run_sweep(settings, port, image_url, concurrency_levels, total_requests):
+    """Benchmark one freshly started server per thread-budget setting"""
+    for flags in settings:
+        label = ' '.join(f"{flags[i][2:]}={flags[i + 1]}" for i in range(0, len(flags), 2))
+        try:
+            process = start_server(port, flags)
+        except RuntimeError as e:
+            print(f"⚠️ {e}")
+            continue
+        try:
+            server = f"http://127.0.0.1:{port}"
+            # One unmeasured request so model warm-up does not skew the first level
+            run_load(server, image_url, 1, 1)
+            for concurrency in concurrency_levels:
+                summary = run_load(server, image_url, concurrency, total_requests)
+                print_summary(f"{label} c={concurrency}", summary)
+        finally:
+            stop_server(process)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent throughput benchmark for the detection API')
+    parser.add_argument('--server', type=str, default='http://127.0.0.1:8888', help='Base URL of a running server')
+    parser.add_argument('--image-url', type=str, required=True, help='Image URL (http(s):// or file://) to process')
+    parser.add_argument('--concurrency', type=str, default='1,2,4,8', help='Comma-separated client concurrency levels')
+    parser.add_argument('--requests', type=int, default=20, help='Requests per concurrency level')
+    parser.add_argument('--sweep', type=str, default=None, help='Semicolon-separated api_server flag sets to start and compare')
+    parser.add_argument('--sweep-port', type=int, default=8899, help='Port used for servers started by --sweep')
+    parser.add_argument('--bulk-background', type=int, default=0, help='Images per bulk request kept running in the background (0 = off)')
+    args = parser.parse_args()
+
+    concurrency_levels = [int(c) for c in args.concurrency.split(',')]
+
+    print("🚀 Throughput benchmark")
+    print("=" * 90)
+    print_header()
+    if args.sweep:
+        run_sweep(parse_sweep(args.sweep), args.sweep_port, args.image_url, concurrency_levels, args.requests)
+    elif args.bulk_background:
+        # Same levels without and with bulk traffic: interactive p95 should barely move
+        for concurrency in concurrency_levels:
+            summary = run_load(args.server, args.image_url, concurrency, args.requests)
+            print_summary(f"concurrency={concurrency}", summary)
+        with BulkBackground(args.server, args.image_url, args.bulk_background):
+            for concurrency in concurrency_levels:
+                summary = run_load(args.server, args.image_url, concurrency, args.requests)
+                print_summary(f"concurrency={concurrency} +bulk {args.bulk_background}", summary)
+    else:
+        for concurrency in concurrency_levels:
+            summary = run_load(args.server, args.image_url, concurrency, args.requests)
+            print_summary(f"concurrency={concurrency}", summary)
+    print("=" * 90)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Recall/latency of tiled leaf detection
+Runs LeafExtractor.detect_leaves (leaf YOLO only, no SAM) over a labelled image
+set with tiling off, auto and on, plus whole-frame detection at a larger imgsz
+(the old workaround for small leaves), and reports leaf recall (all leaves and
+small ones), precision and detection latency for each.
+
+Labels are YOLO text files next to the images or in --labels, one
+"class cx cy w h" line (normalized) per leaf. A leaf is small when its box
+would be under SMALL_LEAF_PX on its short side at the first pass's imgsz.
+
+Usage:
+    python benchmark_tiling.py --images ./canopy/images --labels ./canopy/labels
+    python benchmark_tiling.py --images ./canopy/images --imgsz 640 --baseline-imgsz 1280,1920 --device cuda
+"""
+
+import os
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from disease_pipeline import LeafExtractor, YOLO_LEAF_MODEL
+from leaf_tiling import SMALL_LEAF_PX, TILE_SIZE
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+MATCH_IOU = 0.5
+
+
+def load_labels(path, width, height):
+    """YOLO-format label file -> (N, 4) xyxy boxes in pixels"""
+    boxes = []
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 5:
+                    continue
+                cx, cy, w, h = (float(v) for v in parts[1:5])
+                boxes.append(((cx - w / 2) * width, (cy - h / 2) * height,
+                              (cx + w / 2) * width, (cy + h / 2) * height))
+    return np.array(boxes, dtype=np.float32).reshape(-1, 4)
+
+
+def box_iou(a, b):
+    """IoU matrix between (N, 4) and (M, 4) xyxy boxes"""
+    w = np.clip(np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    h = np.clip(np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = w * h
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def match(truth, detected, confidences):
+    """One-to-one greedy matching by confidence; returns a matched flag per ground-truth box"""
+    matched = np.zeros(len(truth), dtype=bool)
+    if len(truth) == 0 or len(detected) == 0:
+        return matched
+    ious = box_iou(detected, truth)
+    for i in np.argsort(-np.asarray(confidences)):
+        candidates = np.where(~matched & (ious[i] >= MATCH_IOU))[0]
+        if candidates.size:
+            matched[candidates[np.argmax(ious[i, candidates])]] = True
+    return matched
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tiled vs whole-frame leaf detection')
+    parser.add_argument('--images', type=str, required=True, help='Folder of labelled canopy photos')
+    parser.add_argument('--labels', type=str, default=None, help='Folder of YOLO label files (default: --images)')
+    parser.add_argument('--yolo-leaf', type=str, default=YOLO_LEAF_MODEL, help='Leaf detection model')
+    parser.add_argument('--sam', type=str, default='mobile_sam.pt', help='SAM model (loaded by LeafExtractor, not run)')
+    parser.add_argument('--device', type=str, default=None, help='Device for leaf YOLO')
+    parser.add_argument('--imgsz', type=int, default=640, help='Leaf detection input size')
+    parser.add_argument('--conf', type=float, default=0.25, help='Detection confidence threshold')
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help='Tile side in frame pixels')
+    parser.add_argument('--baseline-imgsz', type=str, default='1280', help='Comma-separated larger imgsz to compare, untiled')
+    args = parser.parse_args()
+
+    labels_dir = args.labels or args.images
+    paths = sorted(
+        os.path.join(args.images, name) for name in os.listdir(args.images)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        print(f"❌ No images in {args.images}")
+        return
+
+    base = {'imgsz': args.imgsz, 'conf': args.conf, 'iou': 0.4, 'tile_size': args.tile_size}
+    configs = [(f"tiling={mode}", {**base, 'tiling': mode}) for mode in ('off', 'auto', 'on')]
+    for size in (int(v) for v in args.baseline_imgsz.split(',') if v.strip()):
+        configs.append((f"imgsz={size}", {**base, 'imgsz': size, 'tiling': 'off'}))
+
+    extractor = LeafExtractor(args.yolo_leaf, args.sam, device=args.device)
+    frames = []
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            print(f"⚠️  Skipping unreadable {path}")
+            continue
+        stem = os.path.splitext(os.path.basename(path))[0]
+        truth = load_labels(os.path.join(labels_dir, stem + '.txt'), img.shape[1], img.shape[0])
+        scale = args.imgsz / float(max(img.shape[:2]))
+        small = np.minimum(truth[:, 2] - truth[:, 0], truth[:, 3] - truth[:, 1]) * scale < SMALL_LEAF_PX
+        frames.append((img, truth, small))
+    if not frames:
+        print("❌ No readable images")
+        return
+
+    # One untimed pass so CUDA/allocator start-up is not charged to the first configuration
+    for _, settings in configs:
+        extractor.detect_leaves(frames[0][0], settings)
+
+    print("📊 Leaf detection: tiling vs whole frame")
+    print("=" * 96)
+    print(f"Images: {len(frames)}, leaves: {sum(len(t) for _, t, _ in frames)}, "
+          f"small leaves: {sum(int(s.sum()) for _, _, s in frames)}")
+    print(f"{'config':<16}{'recall':>9}{'small':>9}{'precision':>11}{'p50':>12}{'p95':>12}{'mean':>12}{'tiled':>9}")
+    print("-" * 96)
+    for name, settings in configs:
+        hits = total = small_hits = small_total = detections = tiled = 0
+        latencies = []
+        for img, truth, small in frames:
+            start = time.perf_counter()
+            xyxy, confidences = extractor.detect_leaves(img, settings)
+            latencies.append((time.perf_counter() - start) * 1000)
+            tiled += extractor.last_tiles > 0
+
+            matched = match(truth, xyxy, confidences)
+            hits += int(matched.sum())
+            total += len(truth)
+            small_hits += int(matched[small].sum())
+            small_total += int(small.sum())
+            detections += len(confidences)
+
+        recall = hits / total if total else 0.0
+        small_recall = small_hits / small_total if small_total else 0.0
+        precision = hits / detections if detections else 0.0
+        print(f"{name:<16}{recall:>9.1%}{small_recall:>9.1%}{precision:>11.1%}"
+              f"{percentile(latencies, 50):>9.1f} ms{percentile(latencies, 95):>9.1f} ms"
+              f"{float(np.mean(latencies)):>9.1f} ms{tiled / len(frames):>9.0%}")
+    print("=" * 96)
+    print("tiled = share of images where the tiled pass ran")
+
+
+if __name__ == "__main__":
+    main()
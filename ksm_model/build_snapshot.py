@@ -0,0 +1,43 @@
+"""
+Build the PatchCore snapshot used for fast server startup
+Combines the training checkpoint's memory bank and metadata with the ImageNet
+backbone weights (trimmed to the hooked layers) into one file that the server
+loads with a single memory-mapped torch.load, without touching the network.
+This is the only step that may download weights; run it once per deployment.
+
+Usage:
+    python build_snapshot.py
+    python build_snapshot.py --checkpoint patchcore_anomaly.pth --output patchcore_snapshot.pt --offline
+"""
+
+import os
+import time
+import argparse
+
+from disease_pipeline import PATCHCORE_SNAPSHOT, PatchCoreInference, build_patchcore_snapshot
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the PatchCore snapshot for fast startup')
+    parser.add_argument('--checkpoint', type=str, default=os.path.join(current_dir, 'patchcore_anomaly.pth'), help='PatchCore training checkpoint')
+    parser.add_argument('--output', type=str, default=os.path.join(current_dir, PATCHCORE_SNAPSHOT), help='Snapshot file to write')
+    parser.add_argument('--offline', action='store_true', help='Fail instead of downloading ImageNet weights that are not cached')
+    args = parser.parse_args()
+
+    print("📦 Building PatchCore snapshot")
+    print("=" * 50)
+    start = time.perf_counter()
+    build_patchcore_snapshot(args.checkpoint, args.output, allow_download=not args.offline)
+    print(f"✅ Wrote {args.output} ({os.path.getsize(args.output) / 1024 ** 2:.1f} MB) in {time.perf_counter() - start:.1f}s")
+
+    # Compare load times of both formats on this machine
+    for label, path in (('checkpoint', args.checkpoint), ('snapshot', args.output)):
+        start = time.perf_counter()
+        PatchCoreInference(path, device='cpu')
+        print(f"⏱️ {label:<12}{time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Request Deadlines
+A per-request time budget passed down through GrapeLeafPipeline. Stages check
+it between units of work, stop when the budget is spent or the client has gone
+away, and shed optional work (heatmaps, low-confidence leaves) when the
+remaining budget is too short, recording what was skipped.
+"""
+
+import time
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+DEADLINE_HEADER = 'x-deadline-ms'   # Relative budget in milliseconds
+DEADLINE_PARAM = 'deadline_ms'
+MAX_DEADLINE_MS = 10 * 60 * 1000
+
+# Leaves whose detection confidence is below this are dropped first when time runs short
+LOW_CONFIDENCE_LEAF = 0.5
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time or its client disconnected"""
+
+    def __init__(self, message, cancelled=False):
+        super().__init__(message)
+        self.cancelled = cancelled
+
+
+def parse_deadline_ms(headers, params, default_ms=None):
+    """
+    Read the budget from the X-Deadline-Ms header or ?deadline_ms= (header wins)
+    Returns milliseconds or None; raises ValueError with a client-facing message
+    """
+    value = (headers or {}).get(DEADLINE_HEADER)
+    if value is None:
+        value = params.get(DEADLINE_PARAM)
+        if isinstance(value, list):
+            value = value[0] if value else None
+    if value in (None, ''):
+        return default_ms
+
+    try:
+        deadline_ms = int(float(value))
+    except (TypeError, ValueError):
+        raise ValueError(f"{DEADLINE_PARAM} must be a positive number of milliseconds")
+    if not 0 < deadline_ms <= MAX_DEADLINE_MS:
+        raise ValueError(f"{DEADLINE_PARAM} must be between 1 and {MAX_DEADLINE_MS}")
+    return deadline_ms
+
+
+class Deadline:
+    """Time budget of one request, plus a record of the work shed to meet it"""
+
+    def __init__(self, budget_ms=None, disconnect_probe=None):
+        """
+        budget_ms=None only watches for client disconnects
+        disconnect_probe() returns True once the client connection has closed
+        """
+        self.budget_ms = budget_ms
+        self.started = time.perf_counter()
+        self.expires_at = float('inf') if budget_ms is None else self.started + budget_ms / 1000.0
+        self.disconnect_probe = disconnect_probe
+        self.cancelled = False
+        self.skipped = {}
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def remaining(self):
+        """Seconds left, never negative"""
+        return max(0.0, self.expires_at - time.perf_counter())
+
+    def expired(self):
+        return time.perf_counter() >= self.expires_at
+
+    def client_gone(self):
+        """True if the client disconnected (checked with a cheap non-blocking probe)"""
+        if not self.cancelled and self.disconnect_probe is not None and self.disconnect_probe():
+            self.cancelled = True
+        return self.cancelled
+
+    def check(self, stage):
+        """Raise DeadlineExceeded if the budget is spent or the client is gone"""
+        if self.client_gone():
+            raise DeadlineExceeded(f"Client disconnected during {stage}", cancelled=True)
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline of {self.budget_ms} ms exceeded during {stage}")
+
+    def can_afford(self, seconds):
+        """True if an estimated amount of work still fits in the remaining budget"""
+        return seconds <= self.remaining()
+
+    def skip(self, kind, count=1):
+        """Record optional work that was shed"""
+        self.skipped[kind] = self.skipped.get(kind, 0) + count
+
+    def summary(self, since=None):
+        """
+        Deadline block included in responses
+        since: a copy of skipped taken earlier, to report only what was shed after it
+        """
+        since = since or {}
+        skipped = {kind: count - since.get(kind, 0) for kind, count in self.skipped.items()
+                   if count > since.get(kind, 0)}
+        return {
+            'budget_ms': self.budget_ms,
+            'elapsed_ms': round(self.elapsed() * 1000, 1),
+            'degraded': bool(skipped),
+            'skipped': skipped
+        }
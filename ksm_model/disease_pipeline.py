@@ -8,23 +8,33 @@ Requirements:
 Usage:
     python complete_pipeline.py --image path/to/grape_image.jpg
     python complete_pipeline.py --folder path/to/images/ --workers 4
+    python complete_pipeline.py --video path/to/row_walk.mp4 --sample-fps 5
 """
 
 import os
+import time
+import pickle
 import argparse
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
+from datetime import datetime
 from pathlib import Path
 from PIL import Image
 import torch
 import torch.nn.functional as F
-import torchvision.transforms as transforms
-import torchvision.models as models
-from sklearn.neighbors import NearestNeighbors
-from ultralytics import YOLO, SAM
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from tqdm import tqdm
+
+from deadline import DeadlineExceeded, LOW_CONFIDENCE_LEAF
+from lesion_rules import LesionRuleEngine
+from anomaly_map import render_heatmap as render_heatmap_image
+from leaf_tiling import TILING_MODES, TILE_SIZE, TILE_BATCH_SIZE, tile_grid, tiling_reason, merge_boxes, detect_tiles
+from leaf_tracking import SAMPLE_FPS, LeafTracker, iter_frames
+
+# ultralytics, torchvision, scikit-learn and matplotlib are imported where they
+# are used, so importing this module (and starting the API server) stays fast
+
+# Model files are local; keep ultralytics from checking for updates or assets at startup
+os.environ.setdefault('YOLO_OFFLINE', '1')
 
 # ============================================================================
 # CONFIGURATION
@@ -35,144 +45,512 @@ SAM_MODEL = 'sam2.1_l.pt'  # Segmentation model
 PATCHCORE_MODEL = 'best_model.pth'  # Anomaly detection model
 YOLO_DISEASE_MODEL = 'ds.pt'  # Disease detection model
 OUTPUT_DIR = 'results'
+LEAF_CROP_PADDING = 10  # Pixels kept around a leaf's mask when cropping it
+
+# Single-file PatchCore snapshot: trimmed backbone weights, k-NN memory bank and metadata
+PATCHCORE_SNAPSHOT = 'patchcore_snapshot.pt'
+SNAPSHOT_FORMAT = 'ksm-patchcore-snapshot'
+SNAPSHOT_VERSION = 1
+
+# Per-call inference settings; quality profiles override some of them
+DEFAULT_INFERENCE_SETTINGS = {
+    'sam_model': None,      # Basename of a loaded SAM checkpoint (None = first loaded)
+    'imgsz': 640,           # Leaf detection input size
+    'conf': 0.25,
+    'iou': 0.4,
+    'heatmap': True,        # Generate the PatchCore anomaly heatmap
+    'heatmap_size': 28,     # Heatmap grid resolution before upscaling
+    'heatmap_render': True, # Upscale and colormap the heatmap (False = raw anomaly map only)
+    'knn_backend': None,    # 'torch' / 'sklearn' (None = the model's default)
+    'disease_backend': 'yolo',  # 'yolo' (DiseaseSegmenter) or 'rules' (LesionRuleEngine)
+    'dedup_iou': 0.85,          # Leaf masks overlapping this much (IoU) are one leaf (None = off)
+    'dedup_containment': 0.9,   # ... or when this share of the smaller mask lies inside the other
+    'tiling': 'off',            # 'off' / 'auto' / 'on': extra leaf YOLO pass over tiles (see leaf_tiling.py)
+    'tile_size': TILE_SIZE,     # Tile side in frame pixels
+    'tile_empty_frames': False  # In 'auto', also tile large frames where the first pass found no leaf
+}
+
+# Initial per-leaf stage costs in seconds for deadline planning, refined by a moving average
+# ('speculative_leaf' is the per-leaf critical path with anomaly and disease YOLO run concurrently)
+STAGE_COST_PRIORS = {'sam': 0.15, 'anomaly': 0.08, 'heatmap': 0.05, 'disease': 0.10, 'speculative_leaf': 0.14,
+                     'tile': 0.03}
+STAGE_COST_SMOOTHING = 0.2
+
+DISEASE_BACKENDS = ('yolo', 'rules')
+
+# Speculative disease detection: 'auto' (cost model), 'on' or 'off'
+SPECULATION_MODES = ('auto', 'on', 'off')
+DISEASED_RATE_PRIOR = 0.3       # Share of leaves expected to be diseased before any are seen
+SPECULATION_PROBE_INTERVAL = 20 # In auto mode, every Nth image runs the other mode to refresh its cost
+
+# (width, height) of the synthetic frames used to warm up every stage
+WARMUP_SIZES = ((640, 480), (1280, 960), (1920, 1440))
+
+# Pre-segmented leaves (classify_leaves) run through PatchCore and disease YOLO this many at a time
+CLASSIFY_BATCH_SIZE = 8
 
 # ============================================================================
 # LEAF EXTRACTION MODULE (YOLO + SAM)
 # ============================================================================
+def mask_bounds(mask):
+    """Tight (y1, y2, x1, x2) bounds of a boolean mask, end-exclusive, or None if empty"""
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+
+
+def mask_overlap(a, b):
+    """
+    (IoU, containment) of two leaf masks given as dicts with 'bounds', 'crop' (the
+    mask cropped to its bounds) and 'area'. Containment is the intersection over the
+    smaller mask. Only the overlap of the two bounding boxes is compared.
+    """
+    ay1, ay2, ax1, ax2 = a['bounds']
+    by1, by2, bx1, bx2 = b['bounds']
+    y1, y2 = max(ay1, by1), min(ay2, by2)
+    x1, x2 = max(ax1, bx1), min(ax2, bx2)
+    if y1 >= y2 or x1 >= x2:
+        return 0.0, 0.0
+    
+    intersection = np.count_nonzero(
+        a['crop'][y1 - ay1:y2 - ay1, x1 - ax1:x2 - ax1] & b['crop'][y1 - by1:y2 - by1, x1 - bx1:x2 - bx1]
+    )
+    union = a['area'] + b['area'] - intersection
+    return intersection / union, intersection / min(a['area'], b['area'])
+
+
+def crop_to_leaf(img, mask):
+    """Crop image to the largest contour of mask, plus LEAF_CROP_PADDING"""
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if len(contours) == 0:
+        return img
+    
+    largest = max(contours, key=cv2.contourArea)
+    x, y, w, h = cv2.boundingRect(largest)
+    
+    padding = LEAF_CROP_PADDING
+    x = max(0, x - padding)
+    y = max(0, y - padding)
+    w = min(img.shape[1] - x, w + 2*padding)
+    h = min(img.shape[0] - y, h + 2*padding)
+    
+    return img[y:y+h, x:x+w]
+
+
+def isolate_leaf(img, mask):
+    """
+    Leaf crop as extract_leaves makes it: pixels outside mask (non-zero = leaf, same
+    height and width as img) blacked out, then cropped to the leaf
+    """
+    mask_uint8 = (mask > 0).astype(np.uint8) * 255
+    leaf_img = img.copy()
+    leaf_img[mask_uint8 == 0] = [0, 0, 0]
+    return crop_to_leaf(leaf_img, mask_uint8)
+
+
 class LeafExtractor:
     """Extract individual leaves using YOLO detection and SAM segmentation"""
     
-    def __init__(self, yolo_path, sam_path):
+    def __init__(self, yolo_path, sam_path, device=None):
+        """sam_path may be a list to keep several SAM variants resident; the first is the default"""
+        from ultralytics import YOLO, SAM
+        
         print("🔍 Loading Leaf Detection Models...")
+        self.device = device or DEVICE
         self.yolo_model = YOLO(yolo_path)
-        self.sam_model = SAM(sam_path)
-        print(f"✅ Models loaded on {DEVICE}")
+        
+        sam_paths = [sam_path] if isinstance(sam_path, str) else list(sam_path)
+        self.sam_models = {os.path.basename(path): SAM(path) for path in sam_paths}
+        self.sam_model = self.sam_models[os.path.basename(sam_paths[0])]
+        print(f"✅ Models loaded on {self.device} (SAM: {', '.join(self.sam_models)})")
     
-    def extract_leaves(self, img_path):
-        """Extract all leaves from image"""
+    def get_sam(self, name=None):
+        """Loaded SAM model by checkpoint basename, or the default one"""
+        if name is None:
+            return self.sam_model
+        if name not in self.sam_models:
+            raise KeyError(f"SAM model {name} is not loaded")
+        return self.sam_models[name]
+    
+    def detect_leaves(self, img_bgr, settings=None, deadline=None, tile_cost=0.0, leaf_cost=0.0):
+        """
+        Leaf YOLO boxes as (xyxy array in frame pixels, confidences)
+        After the whole-frame pass, settings['tiling'] may add a pass over overlapping
+        tiles (see leaf_tiling.py); the tiled pass is shed under a deadline when
+        tile_cost (seconds per tile) plus one leaf_cost no longer fits.
+        last_tiles / last_tiling_seconds / last_tiling_reason describe the tiled pass.
+        """
+        settings = {**DEFAULT_INFERENCE_SETTINGS, **(settings or {})}
+        if settings['tiling'] not in TILING_MODES:
+            raise ValueError(f"tiling must be one of {TILING_MODES}")
+        self.last_tiles = 0
+        self.last_tiling_seconds = None
+        self.last_tiling_reason = None
+        
+        results = self.yolo_model.predict(
+            source=img_bgr,
+            imgsz=settings['imgsz'],
+            conf=settings['conf'],
+            iou=settings['iou'],
+            device=self.device,
+            verbose=False
+        )
+        boxes = results[0].boxes
+        xyxy = boxes.xyxy.cpu().numpy()
+        confidences = [float(c) for c in boxes.conf.cpu().numpy()]
+        
+        reason = tiling_reason(img_bgr.shape, xyxy, settings['imgsz'], settings['tiling'],
+                               settings['tile_size'], settings['tile_empty_frames'])
+        if reason is None:
+            return xyxy, confidences
+        
+        tiles = tile_grid(img_bgr.shape[0], img_bgr.shape[1], settings['tile_size'])
+        if deadline is not None and not deadline.can_afford(len(tiles) * tile_cost + leaf_cost):
+            deadline.skip('tiling')
+            return xyxy, confidences
+        
+        tiling_start = time.perf_counter()
+        tile_xyxy, tile_confidences = detect_tiles(self.yolo_model, img_bgr, tiles, settings, self.device)
+        # Whole-frame boxes first: on equal confidence they win over a tile's partial view
+        xyxy = np.concatenate([xyxy, tile_xyxy])
+        confidences = confidences + tile_confidences
+        keep = merge_boxes(xyxy, confidences, settings['iou'])
+        self.last_tiles = len(tiles)
+        self.last_tiling_seconds = time.perf_counter() - tiling_start
+        self.last_tiling_reason = reason
+        print(f"   Tiled detection ({reason}): {len(tiles)} tiles, {len(boxes)} -> {len(keep)} leaves")
+        return xyxy[keep], [confidences[i] for i in keep]
+    
+    def segment_box(self, img_bgr, box, sam_model=None):
+        """SAM mask of the leaf in box (x1, y1, x2, y2), prompted at its center and cropped to box, or None"""
+        x1, y1, x2, y2 = box
+        masks = (sam_model or self.sam_model).predict(
+            img_bgr,
+            points=[[(x1 + x2) // 2, (y1 + y2) // 2]],
+            labels=[1],
+            device=self.device,
+            verbose=False
+        )
+        if len(masks) == 0 or masks[0].masks is None:
+            return None
+        return masks[0].masks.data[0].cpu().numpy().squeeze()[y1:y2, x1:x2] > 0.5
+    
+    def extract_leaves(self, img_path, settings=None, deadline=None, leaf_cost=0.0, tile_cost=0.0):
+        """
+        Extract all leaves from image
+        Overlapping boxes that SAM resolves to the same leaf are merged (see
+        dedup_iou / dedup_containment), so later stages see each leaf once.
+        With a deadline, leaves are segmented in order of detection confidence;
+        low-confidence leaves are shed when leaf_cost (seconds per leaf) no longer
+        fits, and extraction stops once the deadline has passed.
+        """
+        settings = {**DEFAULT_INFERENCE_SETTINGS, **(settings or {})}
+        sam_model = self.get_sam(settings['sam_model'])
+        self.last_sam_seconds = None
+        self.last_duplicates_removed = 0
+        self.last_tiles = 0
+        self.last_tiling_seconds = None
+        
         img_bgr = cv2.imread(img_path)
         if img_bgr is None:
             print(f"❌ Failed to load image: {img_path}")
             return []
         
-        # YOLO detection
+        # YOLO detection (whole frame, plus tiles for small leaves in large frames)
         try:
-            results = self.yolo_model.predict(
-                source=img_path,
-                imgsz=640,
-                conf=0.25,
-                iou=0.4,
-                verbose=False
-            )
-            
-            boxes = results[0].boxes
-            if len(boxes) == 0:
+            xyxy, confidences = self.detect_leaves(img_bgr, settings, deadline, tile_cost, leaf_cost)
+            if len(confidences) == 0:
                 print("⚠️ YOLO detected no leaves in the image")
                 return []
         except Exception as e:
             print(f"❌ YOLO detection error: {e}")
             return []
         
-        # Extract each leaf
-        leaves = []
-        for idx, box in enumerate(boxes):
+        # Segment each detection, merging masks of the same leaf as they arrive
+        candidates = []
+        order = list(range(len(confidences)))
+        if deadline is not None:
+            order.sort(key=lambda i: confidences[i], reverse=True)
+        
+        sam_seconds = []
+        for position, idx in enumerate(order):
+            if deadline is not None:
+                if deadline.client_gone():
+                    raise DeadlineExceeded("Client disconnected during leaf extraction", cancelled=True)
+                if deadline.expired():
+                    deadline.skip('leaves_after_deadline', len(order) - position)
+                    break
+                if confidences[idx] < LOW_CONFIDENCE_LEAF and not deadline.can_afford(leaf_cost * (len(candidates) + 1)):
+                    deadline.skip('low_confidence_leaves')
+                    continue
+            
             try:
-                x1, y1, x2, y2 = map(int, box.xyxy[0].cpu().numpy())
+                sam_start = time.perf_counter()
+                x1, y1, x2, y2 = map(int, xyxy[idx])
                 center_x = (x1 + x2) // 2
                 center_y = (y1 + y2) // 2
                 
                 # SAM segmentation
-                masks = self.sam_model.predict(
+                masks = sam_model.predict(
                     img_bgr, 
                     points=[[center_x, center_y]], 
                     labels=[1], 
-                    device=DEVICE,
+                    device=self.device,
                     verbose=False
                 )
                 
                 if len(masks) > 0 and masks[0].masks is not None:
-                    mask = masks[0].masks.data[0].cpu().numpy().squeeze()
-                    mask_uint8 = (mask * 255).astype(np.uint8)
-                    
-                    # Extract with black background
-                    leaf_img = img_bgr.copy()
-                    leaf_img[mask_uint8 == 0] = [0, 0, 0]
-                    
-                    # Crop to boundaries
-                    leaf_img = self._crop_to_leaf(leaf_img, mask_uint8)
-                    
-                    leaves.append({
-                        'image': leaf_img,
+                    mask = masks[0].masks.data[0].cpu().numpy().squeeze() > 0.5
+                    bounds = mask_bounds(mask)
+                    # Only the mask's bounding-box crop is kept, not the full-frame mask
+                    candidate = {
+                        'bounds': bounds,
+                        'crop': mask[bounds[0]:bounds[1], bounds[2]:bounds[3]] if bounds else None,
+                        'area': int(np.count_nonzero(mask)),
                         'bbox': (x1, y1, x2, y2),
                         'center': (center_x, center_y),
-                        'index': idx
-                    })
+                        'index': idx,
+                        'confidence': confidences[idx]
+                    }
+                    self.last_duplicates_removed += self._merge_duplicate(candidates, candidate, settings)
+                sam_seconds.append(time.perf_counter() - sam_start)
             except Exception as e:
                 print(f"⚠️ Failed to extract leaf {idx}: {e}")
                 continue
         
+        if sam_seconds:
+            self.last_sam_seconds = sum(sam_seconds) / len(sam_seconds)
+        if self.last_duplicates_removed:
+            print(f"   Merged {self.last_duplicates_removed} duplicate leaf mask(s)")
+        
+        # Cut out only the distinct leaves
+        leaves = []
+        for candidate in candidates:
+            if candidate['bounds'] is None:
+                # Empty mask: nothing of the frame is kept
+                leaf_img = np.zeros_like(img_bgr)
+            else:
+                # Work in the mask bounds plus the crop padding instead of on a full-frame copy
+                # (crop_to_leaf can reach twice the padding past the bottom/right edge)
+                y1, y2, x1, x2 = candidate['bounds']
+                wy1, wx1 = max(0, y1 - LEAF_CROP_PADDING), max(0, x1 - LEAF_CROP_PADDING)
+                wy2 = min(img_bgr.shape[0], y2 + 2 * LEAF_CROP_PADDING)
+                wx2 = min(img_bgr.shape[1], x2 + 2 * LEAF_CROP_PADDING)
+                mask_uint8 = np.zeros((wy2 - wy1, wx2 - wx1), dtype=np.uint8)
+                mask_uint8[y1 - wy1:y2 - wy1, x1 - wx1:x2 - wx1] = candidate['crop'].astype(np.uint8) * 255
+                
+                # Extract with black background
+                leaf_img = img_bgr[wy1:wy2, wx1:wx2].copy()
+                leaf_img[mask_uint8 == 0] = [0, 0, 0]
+                
+                # Crop to boundaries
+                leaf_img = crop_to_leaf(leaf_img, mask_uint8)
+            
+            leaves.append({
+                'image': leaf_img,
+                'bbox': candidate['bbox'],
+                'center': candidate['center'],
+                'index': candidate['index'],
+                'confidence': candidate['confidence']
+            })
+        
+        # Keep detection order regardless of the processing order
+        leaves.sort(key=lambda leaf: leaf['index'])
         return leaves
     
-    def _crop_to_leaf(self, img, mask):
-        """Crop image to leaf boundaries"""
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        if len(contours) == 0:
-            return img
-        
-        largest = max(contours, key=cv2.contourArea)
-        x, y, w, h = cv2.boundingRect(largest)
+    def _merge_duplicate(self, candidates, candidate, settings):
+        """
+        Add a segmented leaf to candidates, merging it with every mask it duplicates
+        The kept mask is compared again with the remaining candidates after each merge,
+        so a whole leaf absorbs all of its partial masks whatever order they came in.
+        Returns the number of leaves merged away
+        """
+        iou_threshold = settings['dedup_iou']
+        containment_threshold = settings['dedup_containment']
+        if candidate['area'] == 0 or (iou_threshold is None and containment_threshold is None):
+            candidates.append(candidate)
+            return 0
         
-        padding = 10
-        x = max(0, x - padding)
-        y = max(0, y - padding)
-        w = min(img.shape[1] - x, w + 2*padding)
-        h = min(img.shape[0] - y, h + 2*padding)
+        merged = 0
+        i = 0
+        while i < len(candidates):
+            other = candidates[i]
+            if other['area'] == 0:
+                i += 1
+                continue
+            iou, containment = mask_overlap(candidate, other)
+            if (iou_threshold is not None and iou >= iou_threshold) or \
+                    (containment_threshold is not None and containment >= containment_threshold):
+                # Keep the larger mask (a part of a leaf inside the whole leaf is the duplicate),
+                # with the best detection confidence and the earliest detection index
+                keep = candidate if candidate['area'] > other['area'] else other
+                keep['confidence'] = max(candidate['confidence'], other['confidence'])
+                keep['index'] = min(candidate['index'], other['index'])
+                # Candidates are pairwise distinct, so the kept mask only needs
+                # comparing with the ones after this position
+                del candidates[i]
+                candidate = keep
+                merged += 1
+                continue
+            i += 1
         
-        return img[y:y+h, x:x+w]
+        candidates.append(candidate)
+        return merged
 
 # ============================================================================
 # ANOMALY DETECTION MODULE (PatchCore)
 # ============================================================================
+class TorchKNNIndex:
+    """Exact euclidean k-NN over the memory bank with torch; drop-in for NearestNeighbors"""
+    
+    def __init__(self, memory_bank, n_neighbors, device, sq_norms=None):
+        bank = memory_bank if torch.is_tensor(memory_bank) else torch.from_numpy(np.asarray(memory_bank))
+        self.bank = bank.to(device=device, dtype=torch.float32)
+        if sq_norms is None:
+            sq_norms = (self.bank * self.bank).sum(dim=1)
+        self.bank_sq_norms = sq_norms.to(device=device, dtype=torch.float32)
+        self.n_neighbors = n_neighbors
+    
+    def kneighbors(self, features_np):
+        """Return (distances, indices) arrays like sklearn's kneighbors"""
+        queries = torch.as_tensor(features_np, dtype=torch.float32, device=self.bank.device)
+        sq_dist = (queries * queries).sum(dim=1, keepdim=True) + self.bank_sq_norms - 2.0 * (queries @ self.bank.T)
+        sq_dist, indices = torch.topk(sq_dist.clamp_(min=0), self.n_neighbors, dim=1, largest=False)
+        return sq_dist.sqrt_().cpu().numpy(), indices.cpu().numpy()
+
+
+def build_backbone(backbone_name, layers):
+    """Untrained backbone architecture, trimmed after the last hooked layer"""
+    import torchvision.models as models
+    
+    if backbone_name == 'wide_resnet50_2':
+        backbone = models.wide_resnet50_2(weights=None)
+    else:
+        backbone = models.resnet50(weights=None)
+    
+    # Modules after the deepest hooked layer (e.g. layer4, fc) never affect the features
+    names = [name for name, _ in backbone.named_children()]
+    last = max(names.index(layer.split('.')[0]) for layer in layers)
+    for name in names[last + 1:]:
+        setattr(backbone, name, torch.nn.Identity())
+    return backbone
+
+
+def load_imagenet_weights(backbone_name, allow_download=False):
+    """ImageNet state dict from the local torch hub cache; downloads only if allowed"""
+    import torchvision.models as models
+    
+    if backbone_name == 'wide_resnet50_2':
+        weights = models.Wide_ResNet50_2_Weights.IMAGENET1K_V1
+    else:
+        weights = models.ResNet50_Weights.IMAGENET1K_V1
+    
+    path = os.path.join(torch.hub.get_dir(), 'checkpoints', os.path.basename(weights.url))
+    if not os.path.exists(path) and not allow_download:
+        raise FileNotFoundError(
+            f"ImageNet weights for {backbone_name} not cached at {path}; "
+            f"run build_snapshot.py once to create {PATCHCORE_SNAPSHOT}"
+        )
+    return torch.hub.load_state_dict_from_url(weights.url, map_location='cpu', progress=True)
+
+
+def load_patchcore_checkpoint(model_path, map_location='cpu'):
+    """Load a PatchCore training checkpoint (contains pickled numpy arrays)"""
+    try:
+        return torch.load(model_path, map_location=map_location, weights_only=False)
+    except TypeError:
+        return torch.load(model_path, map_location=map_location)
+
+
+def load_patchcore_snapshot(path):
+    """Load a snapshot with one memory-mapped read, or return None if path is not a snapshot"""
+    try:
+        snapshot = torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+    except TypeError:
+        # torch < 2.1 cannot memory-map
+        snapshot = torch.load(path, map_location='cpu', weights_only=True)
+    except (RuntimeError, pickle.UnpicklingError):
+        # Training checkpoints hold numpy arrays, which weights_only refuses
+        return None
+    
+    if not isinstance(snapshot, dict) or snapshot.get('format') != SNAPSHOT_FORMAT:
+        return None
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Snapshot {path} has version {snapshot.get('version')}, expected {SNAPSHOT_VERSION}; rebuild it")
+    return snapshot
+
+
+def build_patchcore_snapshot(checkpoint_path, output_path, allow_download=True):
+    """Write a snapshot combining the checkpoint, trimmed ImageNet backbone and k-NN bank"""
+    model_data = load_patchcore_checkpoint(checkpoint_path)
+    backbone_name = model_data['backbone_name']
+    layers = list(model_data['layers'])
+    
+    backbone = build_backbone(backbone_name, layers)
+    missing, _ = backbone.load_state_dict(load_imagenet_weights(backbone_name, allow_download), strict=False)
+    if missing:
+        raise ValueError(f"ImageNet weights are missing backbone parameters: {missing[:5]}")
+    
+    memory_bank = torch.as_tensor(np.ascontiguousarray(model_data['memory_bank'], dtype=np.float32))
+    snapshot = {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'created_at': datetime.now().isoformat(),
+        'source_checkpoint': os.path.basename(checkpoint_path),
+        'backbone_name': backbone_name,
+        'layers': layers,
+        'num_neighbors': int(model_data['num_neighbors']),
+        'image_size': int(model_data['config']['IMAGE_SIZE']),
+        'threshold': float(model_data['performance']['threshold']),
+        'feature_mean': torch.tensor(model_data['feature_mean']),
+        'feature_std': torch.tensor(model_data['feature_std']),
+        'memory_bank': memory_bank,
+        'memory_bank_sq_norms': (memory_bank * memory_bank).sum(dim=1),
+        'backbone_state': {k: v.contiguous() for k, v in backbone.state_dict().items()}
+    }
+    
+    tmp_path = f"{output_path}.tmp"
+    torch.save(snapshot, tmp_path)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
 class PatchCoreInference:
     """PatchCore anomaly detection for healthy/diseased classification"""
     
-    def __init__(self, model_path):
-        print("🔍 Loading PatchCore Model...")
-        self.device = torch.device(DEVICE)
+    def __init__(self, model_path, device=None, knn_jobs=-1, knn_backend=None, extra_knn_backends=()):
+        """
+        model_path is a snapshot from build_snapshot.py or a training checkpoint.
+        knn_backend is 'torch' (exact search on the memory bank, no fit) or
+        'sklearn'; by default snapshots use torch and checkpoints sklearn.
+        extra_knn_backends are built as well, for predict(knn_backend=...).
+        """
+        import torchvision.transforms as transforms
         
-        # Load model
-        try:
-            model_data = torch.load(model_path, map_location=self.device, weights_only=False)
-        except TypeError:
-            model_data = torch.load(model_path, map_location=self.device)
-        
-        self.memory_bank = model_data['memory_bank']
-        self.feature_mean = torch.tensor(model_data['feature_mean']).to(self.device)
-        self.feature_std = torch.tensor(model_data['feature_std']).to(self.device)
-        self.threshold = model_data['performance']['threshold']
-        self.backbone_name = model_data['backbone_name']
-        self.layers = model_data['layers']
-        self.num_neighbors = model_data['num_neighbors']
-        self.image_size = model_data['config']['IMAGE_SIZE']
+        print("🔍 Loading PatchCore Model...")
+        self.device = torch.device(device or DEVICE)
         
-        # Load backbone
-        if self.backbone_name == 'wide_resnet50_2':
-            self.backbone = models.wide_resnet50_2(pretrained=True)
+        snapshot = load_patchcore_snapshot(model_path)
+        if snapshot is not None:
+            self._load_snapshot(snapshot)
+            knn_backend = knn_backend or 'torch'
         else:
-            self.backbone = models.resnet50(pretrained=True)
+            self._load_checkpoint(model_path)
+            knn_backend = knn_backend or 'sklearn'
         
         self.backbone.eval()
         self.backbone.to(self.device)
         self._setup_hooks()
         
-        # k-NN index
-        self.nn_model = NearestNeighbors(
-            n_neighbors=min(self.num_neighbors, len(self.memory_bank)),
-            metric='euclidean',
-            algorithm='auto',
-            n_jobs=-1
-        )
-        self.nn_model.fit(self.memory_bank)
+        # k-NN indexes over the memory bank (small, so several backends are cheap)
+        self.knn_backend = knn_backend
+        self.nn_models = {}
+        for backend in [knn_backend] + [b for b in extra_knn_backends if b]:
+            if backend not in self.nn_models:
+                self.nn_models[backend] = self._build_knn_index(backend, knn_jobs)
+        self.nn_model = self.nn_models[knn_backend]
         
         # Transforms
         self.transform = transforms.Compose([
@@ -181,7 +559,61 @@ class PatchCoreInference:
             transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
         ])
         
-        print(f"✅ PatchCore loaded (Threshold: {self.threshold:.4f})")
+        print(f"✅ PatchCore loaded (Threshold: {self.threshold:.4f}, k-NN: {knn_backend})")
+    
+    def _build_knn_index(self, backend, knn_jobs):
+        """Build a k-NN index over the memory bank with the given backend"""
+        n_neighbors = min(self.num_neighbors, len(self.memory_bank))
+        if backend == 'torch':
+            return TorchKNNIndex(self.memory_bank, n_neighbors, self.device, self.memory_bank_sq_norms)
+        if backend == 'sklearn':
+            from sklearn.neighbors import NearestNeighbors
+            nn_model = NearestNeighbors(
+                n_neighbors=n_neighbors,
+                metric='euclidean',
+                algorithm='auto',
+                n_jobs=knn_jobs
+            )
+            nn_model.fit(np.asarray(self.memory_bank))
+            return nn_model
+        raise ValueError(f"Unknown k-NN backend: {backend}")
+    
+    def _load_snapshot(self, snapshot):
+        """Restore from a snapshot; tensors stay in the file's memory-mapped pages"""
+        self.backbone_name = snapshot['backbone_name']
+        self.layers = list(snapshot['layers'])
+        self.num_neighbors = int(snapshot['num_neighbors'])
+        self.image_size = int(snapshot['image_size'])
+        self.threshold = float(snapshot['threshold'])
+        self.memory_bank = snapshot['memory_bank']
+        self.memory_bank_sq_norms = snapshot['memory_bank_sq_norms']
+        self.feature_mean = snapshot['feature_mean'].to(self.device)
+        self.feature_std = snapshot['feature_std'].to(self.device)
+        
+        self.backbone = build_backbone(self.backbone_name, self.layers)
+        try:
+            # assign=True adopts the mapped tensors instead of copying them
+            self.backbone.load_state_dict(snapshot['backbone_state'], assign=True)
+        except TypeError:
+            self.backbone.load_state_dict(snapshot['backbone_state'])
+    
+    def _load_checkpoint(self, model_path):
+        """Restore from a training checkpoint plus locally cached ImageNet weights"""
+        model_data = load_patchcore_checkpoint(model_path, self.device)
+        
+        self.memory_bank = model_data['memory_bank']
+        self.memory_bank_sq_norms = None
+        self.feature_mean = torch.tensor(model_data['feature_mean']).to(self.device)
+        self.feature_std = torch.tensor(model_data['feature_std']).to(self.device)
+        self.threshold = model_data['performance']['threshold']
+        self.backbone_name = model_data['backbone_name']
+        self.layers = model_data['layers']
+        self.num_neighbors = model_data['num_neighbors']
+        self.image_size = model_data['config']['IMAGE_SIZE']
+        
+        # The checkpoint has no backbone weights: features come from ImageNet weights
+        self.backbone = build_backbone(self.backbone_name, self.layers)
+        self.backbone.load_state_dict(load_imagenet_weights(self.backbone_name), strict=False)
     
     def _setup_hooks(self):
         """Setup feature extraction hooks"""
@@ -197,14 +629,25 @@ class PatchCoreInference:
             if name in self.layers:
                 self.hooks.append(module.register_forward_hook(get_hook(name)))
     
-    def predict(self, leaf_img_bgr):
-        """Predict if leaf is healthy or diseased with heatmap generation"""
-        # Convert BGR to RGB
-        img_rgb = cv2.cvtColor(leaf_img_bgr, cv2.COLOR_BGR2RGB)
-        img_pil = Image.fromarray(img_rgb)
+    def predict(self, leaf_img_bgr, heatmap=True, heatmap_size=28, knn_backend=None, render_heatmap=True):
+        """
+        Predict if leaf is healthy or diseased with heatmap generation
+        With render_heatmap=False only the raw anomaly map (heatmap_size grid) is returned
+        """
+        return self.predict_batch([leaf_img_bgr], heatmap, heatmap_size, knn_backend, render_heatmap)[0]
+    
+    def predict_batch(self, leaf_imgs_bgr, heatmap=True, heatmap_size=28, knn_backend=None, render_heatmap=True):
+        """
+        predict() for several leaves with one backbone pass and one k-NN query per stage
+        Leaves are resized to image_size first, so crops of any size share a batch
+        """
+        nn_model = self.nn_models[knn_backend or self.knn_backend]
         
-        # Transform
-        img_tensor = self.transform(img_pil).unsqueeze(0).to(self.device)
+        # Convert BGR to RGB and transform
+        img_tensor = torch.stack([
+            self.transform(Image.fromarray(cv2.cvtColor(leaf_img_bgr, cv2.COLOR_BGR2RGB)))
+            for leaf_img_bgr in leaf_imgs_bgr
+        ]).to(self.device)
         
         # Extract features
         with torch.no_grad():
@@ -236,38 +679,59 @@ class PatchCoreInference:
             normalized = (features - self.feature_mean) / self.feature_std
             normalized = torch.nan_to_num(normalized, nan=0.0)
             
-            # Calculate score
+            # Calculate score (one row of neighbour distances per leaf)
             features_np = normalized.cpu().numpy()
-            distances, _ = self.nn_model.kneighbors(features_np)
-            score = float(np.mean(distances))
+            distances, _ = nn_model.kneighbors(features_np)
+            scores = distances.mean(axis=1)
             
-            # Generate heatmap
-            heatmap = self._generate_heatmap(feature_maps_for_heatmap, leaf_img_bgr.shape[:2])
-        
-        is_anomaly = score > self.threshold
-        
-        if is_anomaly:
-            confidence = min(100, ((score - self.threshold) / self.threshold) * 100)
-        else:
-            confidence = min(100, ((self.threshold - score) / self.threshold) * 100)
+            # Generate heatmaps
+            distance_maps = None
+            self.last_heatmap_seconds = None
+            if heatmap:
+                heatmap_start = time.perf_counter()
+                distance_maps = self._generate_anomaly_map(feature_maps_for_heatmap, heatmap_size, nn_model)
         
-        return {
-            'anomaly_score': float(score),
-            'is_diseased': bool(is_anomaly),
-            'confidence': float(confidence),
-            'prediction': 'DISEASED' if is_anomaly else 'HEALTHY',
-            'heatmap': heatmap
-        }
+        results = []
+        for i, leaf_img_bgr in enumerate(leaf_imgs_bgr):
+            score = float(scores[i])
+            distance_map = distance_maps[i] if distance_maps is not None else None
+            heatmap_img = None
+            if heatmap and render_heatmap:
+                if distance_map is not None:
+                    heatmap_img = render_heatmap_image(distance_map, leaf_img_bgr.shape[:2])
+                else:
+                    # Blank heatmap on error
+                    heatmap_img = np.zeros((*leaf_img_bgr.shape[:2], 3), dtype=np.uint8)
+            
+            is_anomaly = score > self.threshold
+            
+            if is_anomaly:
+                confidence = min(100, ((score - self.threshold) / self.threshold) * 100)
+            else:
+                confidence = min(100, ((self.threshold - score) / self.threshold) * 100)
+            
+            results.append({
+                'anomaly_score': score,
+                'is_diseased': bool(is_anomaly),
+                'confidence': float(confidence),
+                'prediction': 'DISEASED' if is_anomaly else 'HEALTHY',
+                'heatmap': heatmap_img,
+                'anomaly_map': distance_map
+            })
+        if heatmap:
+            self.last_heatmap_seconds = time.perf_counter() - heatmap_start
+        return results
     
-    def _generate_heatmap(self, feature_maps, target_size):
-        """Generate anomaly heatmap from feature maps"""
+    def _generate_anomaly_map(self, feature_maps, grid_size=28, nn_model=None):
+        """Mean k-NN distance per grid cell (float32 batch x grid_size x grid_size), or None on error"""
+        nn_model = nn_model or self.nn_model
         try:
             # Combine all feature maps
             combined_map = None
             
             for fmap in feature_maps:
                 # Resize to common size
-                resized = F.interpolate(fmap, size=(28, 28), mode='bilinear', align_corners=False)
+                resized = F.interpolate(fmap, size=(grid_size, grid_size), mode='bilinear', align_corners=False)
                 
                 # Calculate per-pixel anomaly scores
                 B, C, H, W = resized.shape
@@ -282,8 +746,8 @@ class PatchCoreInference:
                 
                 # Calculate distances to memory bank
                 features_np = resized_flat.cpu().numpy().reshape(-1, C)
-                distances, _ = self.nn_model.kneighbors(features_np)
-                distance_map = distances.mean(axis=1).reshape(H, W)
+                distances, _ = nn_model.kneighbors(features_np)
+                distance_map = distances.mean(axis=1).reshape(B, H, W)
                 
                 if combined_map is None:
                     combined_map = distance_map
@@ -294,22 +758,11 @@ class PatchCoreInference:
             if len(feature_maps) > 0:
                 combined_map /= len(feature_maps)
             
-            # Normalize to 0-255
-            combined_map = (combined_map - combined_map.min()) / (combined_map.max() - combined_map.min() + 1e-8)
-            combined_map = (combined_map * 255).astype(np.uint8)
-            
-            # Resize to target size
-            heatmap = cv2.resize(combined_map, (target_size[1], target_size[0]))
-            
-            # Apply colormap
-            heatmap_colored = cv2.applyColorMap(heatmap, cv2.COLORMAP_JET)
-            
-            return heatmap_colored
+            return combined_map.astype(np.float32)
             
         except Exception as e:
             print(f"⚠️ Heatmap generation warning: {e}")
-            # Return blank heatmap on error
-            return np.zeros((target_size[0], target_size[1], 3), dtype=np.uint8)
+            return None
 
 # ============================================================================
 # DISEASE SEGMENTATION MODULE (YOLO + Color Analysis)
@@ -317,8 +770,11 @@ class PatchCoreInference:
 class DiseaseSegmenter:
     """Detect and segment disease regions on leaves"""
     
-    def __init__(self, yolo_path):
+    def __init__(self, yolo_path, device=None):
+        from ultralytics import YOLO
+        
         print("🔍 Loading Disease Detection Model...")
+        self.device = device or DEVICE
         self.model = YOLO(yolo_path)
         self.class_names = self.model.names
         print(f"✅ Disease model loaded")
@@ -326,14 +782,24 @@ class DiseaseSegmenter:
     def segment_diseases(self, leaf_img_bgr):
         """Detect and segment disease regions"""
         # YOLO detection
-        results = self.model.predict(source=leaf_img_bgr, verbose=False)
-        
+        results = self.model.predict(source=leaf_img_bgr, device=self.device, verbose=False)
+        return self._segment_boxes(leaf_img_bgr, results[0].boxes)
+    
+    def segment_diseases_batch(self, leaf_imgs_bgr):
+        """
+        segment_diseases() for several leaves with one YOLO call
+        Leaves of different sizes are letterboxed to a common square, so boxes can
+        differ slightly from one-at-a-time calls
+        """
+        results = self.model.predict(source=list(leaf_imgs_bgr), device=self.device, verbose=False)
+        return [self._segment_boxes(leaf_img_bgr, result.boxes) for leaf_img_bgr, result in zip(leaf_imgs_bgr, results)]
+    
+    def _segment_boxes(self, leaf_img_bgr, boxes):
+        """Disease masks and coverage from the YOLO boxes of one leaf (None if no boxes)"""
         img_rgb = cv2.cvtColor(leaf_img_bgr, cv2.COLOR_BGR2RGB)
         img_hsv = cv2.cvtColor(leaf_img_bgr, cv2.COLOR_BGR2HSV)
         img_lab = cv2.cvtColor(leaf_img_bgr, cv2.COLOR_BGR2LAB)
         
-        boxes = results[0].boxes
-        
         if len(boxes) == 0:
             return None
         
@@ -493,64 +959,370 @@ class DiseaseSegmenter:
             'black_mask': black_mask
         }
 
+def synthetic_leaf_image(width, height, seed=0):
+    """BGR frame with a textured green leaf and brown spots on a soil-coloured background"""
+    rng = np.random.default_rng(seed)
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[:] = (40, 70, 100)
+    
+    center = (width // 2, height // 2)
+    axes = (max(1, width // 3), max(1, height // 3))
+    cv2.ellipse(img, center, axes, 30, 0, 360, (40, 150, 60), -1)
+    for _ in range(12):
+        spot = (int(rng.integers(width // 3, 2 * width // 3)), int(rng.integers(height // 3, 2 * height // 3)))
+        cv2.circle(img, spot, max(2, min(width, height) // 40), (30, 60, 120), -1)
+    
+    noise = rng.integers(-12, 13, size=img.shape, dtype=np.int16)
+    return np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+# ============================================================================
+# RESULT TYPES
+# ============================================================================
+# Full-resolution per-leaf arrays. process_image keeps only those named in
+# keep_arrays (all of them when visualizing) and drops the rest as soon as the
+# stage that produced them is done. Bytes per leaf pixel: leaf_image 3,
+# heatmap 3, result_img 3, disease_mask 1, distance_heatmap 4, black_mask 1.
+HEAVY_ARRAYS = ('leaf_image', 'heatmap', 'result_img', 'disease_mask', 'distance_heatmap', 'black_mask')
+DEFAULT_KEEP_ARRAYS = ('leaf_image',)
+
+
+class AnomalyResult:
+    """PatchCore verdict for one leaf; anomaly_map is the small raw grid, heatmap the rendered image"""
+    __slots__ = ('anomaly_score', 'is_diseased', 'confidence', 'prediction', 'anomaly_map', 'heatmap')
+    
+    def __init__(self, result, keep=()):
+        self.anomaly_score = result['anomaly_score']
+        self.is_diseased = result['is_diseased']
+        self.confidence = result['confidence']
+        self.prediction = result['prediction']
+        self.anomaly_map = result.get('anomaly_map')
+        self.heatmap = result['heatmap'] if 'heatmap' in keep else None
+
+
+class DiseaseResult:
+    """Diseases found on one leaf; the masks and annotated image are only kept on request"""
+    __slots__ = ('disease_info', 'total_leaf_pixels', 'total_disease_pixels', 'total_disease_percentage',
+                 'result_img', 'disease_mask', 'distance_heatmap', 'black_mask')
+    
+    def __init__(self, result, keep=()):
+        self.disease_info = result['disease_info']
+        self.total_leaf_pixels = result['total_leaf_pixels']
+        self.total_disease_pixels = result['total_disease_pixels']
+        self.total_disease_percentage = result['total_disease_percentage']
+        for name in ('result_img', 'disease_mask', 'distance_heatmap', 'black_mask'):
+            setattr(self, name, result[name] if name in keep else None)
+
+
+class LeafResult:
+    """One analysed leaf as returned by GrapeLeafPipeline.process_image"""
+    __slots__ = ('leaf_index', 'bbox', 'center', 'leaf_size', 'leaf_image', 'anomaly_result', 'disease_result')
+    
+    def __init__(self, leaf_index, bbox, center, leaf_size, leaf_image, anomaly_result, disease_result):
+        self.leaf_index = leaf_index
+        self.bbox = bbox
+        self.center = center
+        self.leaf_size = leaf_size      # (height, width) of the leaf crop, kept with or without the image
+        self.leaf_image = leaf_image
+        self.anomaly_result = anomaly_result
+        self.disease_result = disease_result
+    
+    def release(self):
+        """Drop every heavy array once its consumer is done; the numbers stay"""
+        self.leaf_image = None
+        self.anomaly_result.heatmap = None
+        if self.disease_result is not None:
+            for name in ('result_img', 'disease_mask', 'distance_heatmap', 'black_mask'):
+                setattr(self.disease_result, name, None)
+
+
+class TrackResult:
+    """One leaf followed through a video or burst, analysed once on its best frame"""
+    __slots__ = ('track_id', 'first_frame', 'last_frame', 'best_frame', 'hits', 'leaf')
+    
+    def __init__(self, track_id, first_frame, last_frame, best_frame, hits, leaf):
+        self.track_id = track_id
+        self.first_frame = first_frame      # Frame indices in the source, sampled or not
+        self.last_frame = last_frame
+        self.best_frame = best_frame
+        self.hits = hits                    # Sampled frames the leaf was detected in
+        self.leaf = leaf                    # LeafResult; bbox and center are in best_frame
+
 # ============================================================================
 # COMPLETE PIPELINE
 # ============================================================================
 class GrapeLeafPipeline:
     """Complete grape leaf disease detection pipeline"""
     
-    def __init__(self, yolo_leaf_path, sam_path, patchcore_path, yolo_disease_path):
-        self.leaf_extractor = LeafExtractor(yolo_leaf_path, sam_path)
-        self.anomaly_detector = PatchCoreInference(patchcore_path)
-        self.disease_segmenter = DiseaseSegmenter(yolo_disease_path)
+    def __init__(self, yolo_leaf_path, sam_path, patchcore_path, yolo_disease_path, device=None, knn_jobs=-1,
+                 knn_backends=(), speculation='auto'):
+        self.device = device or DEVICE
+        self.leaf_extractor = LeafExtractor(yolo_leaf_path, sam_path, device=self.device)
+        self.anomaly_detector = PatchCoreInference(
+            patchcore_path, device=self.device, knn_jobs=knn_jobs, extra_knn_backends=knn_backends
+        )
+        self.disease_segmenter = DiseaseSegmenter(yolo_disease_path, device=self.device)
+        self.lesion_rules = LesionRuleEngine()
+        
+        # Optional callable(stage_name, seconds) used to export stage latency
+        self.stage_observer = None
+        
+        # Moving-average per-leaf stage costs used to plan work under a deadline
+        self.stage_costs = dict(STAGE_COST_PRIORS)
+        
+        # Counters from the last process_image call, e.g. duplicate leaves merged
+        self.last_report = {}
+        
+        # Speculative mode runs disease YOLO on its own thread while PatchCore scores the
+        # leaf. Every disease call goes through this executor, so a discarded run that is
+        # still finishing never shares the model with the next call.
+        if speculation not in SPECULATION_MODES:
+            raise ValueError(f"speculation must be one of {SPECULATION_MODES}")
+        self.speculation = speculation
+        self.disease_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='disease')
+        self.diseased_rate = DISEASED_RATE_PRIOR
+        self.images_since_probe = 0
+        self.speculation_stats = {'used': 0, 'cancelled': 0, 'discarded': 0}
         
         os.makedirs(OUTPUT_DIR, exist_ok=True)
     
-    def process_image(self, img_path, visualize=True):
-        """Process single image through complete pipeline"""
+    def warmup(self, sizes=WARMUP_SIZES, settings_list=None):
+        """
+        Run synthetic frames through every stage (YOLO, SAM, PatchCore, disease YOLO, lesion rules)
+        so lazy CUDA/MKL init, predictor setup and allocator growth happen before
+        the first real request. Stages are called directly, so no leaf needs to be found.
+        settings_list holds the inference settings of each profile to warm.
+        """
+        extractor = self.leaf_extractor
+        for settings in settings_list or [None]:
+            settings = {**DEFAULT_INFERENCE_SETTINGS, **(settings or {})}
+            for width, height in sizes:
+                frame = synthetic_leaf_image(width, height)
+                extractor.yolo_model.predict(
+                    source=frame,
+                    imgsz=settings['imgsz'],
+                    conf=settings['conf'],
+                    iou=settings['iou'],
+                    device=extractor.device,
+                    verbose=False
+                )
+                if settings['tiling'] != 'off':
+                    # Tiles go through YOLO as a batch, which allocates differently from one frame
+                    tile = frame[:settings['tile_size'], :settings['tile_size']]
+                    extractor.yolo_model.predict(
+                        source=[tile] * TILE_BATCH_SIZE,
+                        imgsz=settings['imgsz'],
+                        conf=settings['conf'],
+                        iou=settings['iou'],
+                        device=extractor.device,
+                        verbose=False
+                    )
+                extractor.get_sam(settings['sam_model']).predict(
+                    frame,
+                    points=[[width // 2, height // 2]],
+                    labels=[1],
+                    device=extractor.device,
+                    verbose=False
+                )
+                
+                leaf = frame[height // 4:3 * height // 4, width // 4:3 * width // 4]
+                self.anomaly_detector.predict(
+                    leaf,
+                    heatmap=settings['heatmap'],
+                    heatmap_size=settings['heatmap_size'],
+                    knn_backend=settings['knn_backend'],
+                    render_heatmap=settings['heatmap_render']
+                )
+                if settings['disease_backend'] == 'rules':
+                    self.lesion_rules.classify(leaf)
+                else:
+                    self.disease_segmenter.segment_diseases(leaf)
+    
+    def _observe_stage(self, stage, start):
+        """Report the time spent in a stage since start (perf_counter), and return it"""
+        seconds = time.perf_counter() - start
+        if self.stage_observer is not None:
+            self.stage_observer(stage, seconds)
+        return seconds
+    
+    def _update_cost(self, name, seconds):
+        """Fold a measured per-leaf cost into the moving average"""
+        if seconds is not None:
+            self.stage_costs[name] += STAGE_COST_SMOOTHING * (seconds - self.stage_costs[name])
+    
+    def _should_speculate(self, heatmap):
+        """
+        Cost model: speculate when the learned concurrent per-leaf time beats
+        anomaly + diseased_rate * disease. Needs a spare core set for the second
+        model, and now and then runs the other mode so both estimates stay current.
+        """
+        if self.speculation != 'auto':
+            return self.speculation == 'on'
+        if str(self.device) == 'cpu' and (os.cpu_count() or 1) < 2 * torch.get_num_threads():
+            return False
+        
+        costs = self.stage_costs
+        sequential = costs['anomaly'] + (costs['heatmap'] if heatmap else 0.0) + self.diseased_rate * costs['disease']
+        speculate = costs['speculative_leaf'] < sequential
+        
+        self.images_since_probe += 1
+        if self.images_since_probe >= SPECULATION_PROBE_INTERVAL:
+            self.images_since_probe = 0
+            return not speculate
+        return speculate
+    
+    def _segment_diseases(self, leaf_img):
+        """Disease YOLO with its stage time, run on the disease executor"""
+        stage_start = time.perf_counter()
+        disease_result = self.disease_segmenter.segment_diseases(leaf_img)
+        return disease_result, self._observe_stage('disease_segmentation', stage_start)
+    
+    def process_image(self, img_path, visualize=True, settings=None, deadline=None, keep_arrays=DEFAULT_KEEP_ARRAYS):
+        """
+        Process single image through complete pipeline (settings: see DEFAULT_INFERENCE_SETTINGS)
+        Returns a list of LeafResult holding only the heavy arrays named in keep_arrays
+        (see HEAVY_ARRAYS); visualizing keeps them all.
+        With a deadline (deadline.Deadline), work stops when it expires or the client
+        disconnects, and heatmaps and low-confidence leaves are shed when time runs short;
+        the shed work is recorded in deadline.skipped.
+        """
+        settings = {**DEFAULT_INFERENCE_SETTINGS, **(settings or {})}
+        if settings['disease_backend'] not in DISEASE_BACKENDS:
+            raise ValueError(f"disease_backend must be one of {DISEASE_BACKENDS}")
+        if settings['tiling'] not in TILING_MODES:
+            raise ValueError(f"tiling must be one of {TILING_MODES}")
+        costs = self.stage_costs
         print(f"\n{'='*70}")
         print(f"Processing: {os.path.basename(img_path)}")
         print(f"{'='*70}")
         
         # Step 1: Extract leaves
         print("\n📍 Step 1: Extracting leaves...")
-        leaves = self.leaf_extractor.extract_leaves(img_path)
+        if deadline is not None:
+            deadline.check('leaf extraction')
+            shed_before = dict(deadline.skipped)
+        stage_start = time.perf_counter()
+        leaves = self.leaf_extractor.extract_leaves(
+            img_path, settings, deadline, costs['sam'] + costs['anomaly'] + costs['disease'], costs['tile']
+        )
+        self._observe_stage('leaf_extraction', stage_start)
+        self._update_cost('sam', self.leaf_extractor.last_sam_seconds)
+        tiling_seconds = self.leaf_extractor.last_tiling_seconds
+        if tiling_seconds is not None:
+            # Part of leaf_extraction, also reported on its own
+            self._update_cost('tile', tiling_seconds / self.leaf_extractor.last_tiles)
+            if self.stage_observer is not None:
+                self.stage_observer('leaf_tiling', tiling_seconds)
+        self.last_report = {
+            'duplicate_leaves_removed': self.leaf_extractor.last_duplicates_removed,
+            'tiles': self.leaf_extractor.last_tiles
+        }
         print(f"   Found {len(leaves)} leaves")
         
         if len(leaves) == 0:
+            if deadline is not None and deadline.skipped != shed_before:
+                # Leaves were found but shed, so this is a timeout rather than an empty image
+                deadline.check('leaf extraction')
+                raise DeadlineExceeded(f"Deadline of {deadline.budget_ms} ms too short to process any leaf")
             print("❌ No leaves detected!")
             return None
         
+        keep = set(HEAVY_ARRAYS) if visualize else set(keep_arrays)
         results = []
+        # The rule engine is cheap enough that speculating on it saves nothing
+        rules_backend = settings['disease_backend'] == 'rules'
+        speculative = not rules_backend and self._should_speculate(settings['heatmap'])
+        self.last_report['speculative'] = speculative
         
         # Process each leaf
         for i, leaf_data in enumerate(leaves):
+            heatmap = settings['heatmap']
+            if deadline is not None:
+                if deadline.client_gone():
+                    raise DeadlineExceeded("Client disconnected during anomaly detection", cancelled=True)
+                if deadline.expired():
+                    if not results:
+                        deadline.check('anomaly detection')
+                    # Return what is done rather than nothing
+                    deadline.skip('leaves_after_deadline', len(leaves) - i)
+                    break
+                
+                # Heatmaps are optional: drop them when the remaining leaves would not fit
+                remaining_leaves = len(leaves) - i
+                if heatmap and not deadline.can_afford(
+                        remaining_leaves * (costs['anomaly'] + costs['heatmap'] + costs['disease'])):
+                    heatmap = False
+                    deadline.skip('heatmap')
+            
             print(f"\n🍃 Processing Leaf {i+1}/{len(leaves)}...")
+            leaf_start = time.perf_counter()
+            
+            # Speculative: start disease YOLO now instead of after the anomaly verdict
+            disease_future = None
+            if speculative:
+                disease_future = self.disease_executor.submit(self._segment_diseases, leaf_data['image'])
             
             # Step 2: Anomaly detection
             print("   📊 Running anomaly detection...")
-            anomaly_result = self.anomaly_detector.predict(leaf_data['image'])
+            stage_start = time.perf_counter()
+            anomaly_result = self.anomaly_detector.predict(
+                leaf_data['image'],
+                heatmap=heatmap,
+                heatmap_size=settings['heatmap_size'],
+                knn_backend=settings['knn_backend'],
+                render_heatmap=settings['heatmap_render']
+            )
+            seconds = self._observe_stage('anomaly_detection', stage_start)
+            if not speculative:
+                # Concurrent runs contend for cores, so only sequential timings feed the stage costs
+                heatmap_seconds = self.anomaly_detector.last_heatmap_seconds
+                self._update_cost('heatmap', heatmap_seconds)
+                self._update_cost('anomaly', seconds - (heatmap_seconds or 0.0))
             print(f"      {anomaly_result['prediction']} (Score: {anomaly_result['anomaly_score']:.4f}, Confidence: {anomaly_result['confidence']:.1f}%)")
+            self.diseased_rate += STAGE_COST_SMOOTHING * (float(anomaly_result['is_diseased']) - self.diseased_rate)
             
             # Step 3: Disease segmentation (only if diseased)
             disease_result = None
             if anomaly_result['is_diseased']:
                 print("   🔬 Analyzing disease regions...")
-                disease_result = self.disease_segmenter.segment_diseases(leaf_data['image'])
+                if rules_backend:
+                    stage_start = time.perf_counter()
+                    # Full-resolution masks are only needed to draw over the leaf
+                    disease_result = self.lesion_rules.classify(leaf_data['image'], full_resolution=visualize)
+                    self._observe_stage('disease_rules', stage_start)
+                elif disease_future is None:
+                    disease_result, seconds = self.disease_executor.submit(
+                        self._segment_diseases, leaf_data['image']
+                    ).result()
+                    self._update_cost('disease', seconds)
+                else:
+                    disease_result, _ = disease_future.result()
+                    self.speculation_stats['used'] += 1
                 
                 if disease_result:
                     print(f"      Total disease coverage: {disease_result['total_disease_percentage']:.2f}%")
                     for disease in disease_result['disease_info']:
                         print(f"      - {disease['name']}: {disease['percentage']:.2f}% (conf: {disease['confidence']:.1%})")
+            elif disease_future is not None:
+                # Healthy leaf: drop the speculative run, or let it finish unread if already started
+                if disease_future.cancel():
+                    self.speculation_stats['cancelled'] += 1
+                else:
+                    self.speculation_stats['discarded'] += 1
             
-            results.append({
-                'leaf_index': i,
-                'leaf_image': leaf_data['image'],
-                'bbox': leaf_data.get('bbox', None),
-                'center': leaf_data.get('center', None),
-                'anomaly_result': anomaly_result,
-                'disease_result': disease_result
-            })
+            if speculative:
+                self._update_cost('speculative_leaf', time.perf_counter() - leaf_start)
+            
+            results.append(LeafResult(
+                i,
+                leaf_data.get('bbox', None),
+                leaf_data.get('center', None),
+                leaf_data['image'].shape[:2],
+                leaf_data['image'] if 'leaf_image' in keep else None,
+                AnomalyResult(anomaly_result, keep),
+                DiseaseResult(disease_result, keep) if disease_result else None
+            ))
+            # Unless kept, the leaf crop is freed as soon as its stages are done
+            leaves[i] = None
         
         # Visualization
         if visualize:
@@ -558,25 +1330,207 @@ class GrapeLeafPipeline:
         
         return results
     
+    def classify_leaves(self, leaf_images, masks=None, settings=None, deadline=None, keep_arrays=DEFAULT_KEEP_ARRAYS):
+        """
+        Anomaly and disease stages only, for leaves the caller has already cropped (BGR)
+        masks holds an optional mask per leaf (non-zero = leaf, None = use the crop as
+        is); masked leaves are blacked out and cropped like extract_leaves does.
+        Leaves go through PatchCore and disease YOLO in batches of CLASSIFY_BATCH_SIZE.
+        Returns a list of LeafResult in input order, without bbox or center.
+        Deadlines behave as in process_image, checked per batch.
+        """
+        settings = {**DEFAULT_INFERENCE_SETTINGS, **(settings or {})}
+        if settings['disease_backend'] not in DISEASE_BACKENDS:
+            raise ValueError(f"disease_backend must be one of {DISEASE_BACKENDS}")
+        costs = self.stage_costs
+        masks = masks or [None] * len(leaf_images)
+        leaves = [img if mask is None else isolate_leaf(img, mask) for img, mask in zip(leaf_images, masks)]
+        self.last_report = {'duplicate_leaves_removed': 0, 'speculative': False}
+        print(f"\n🍃 Classifying {len(leaves)} pre-segmented leaves...")
+        
+        keep = set(keep_arrays)
+        rules_backend = settings['disease_backend'] == 'rules'
+        results = []
+        for start in range(0, len(leaves), CLASSIFY_BATCH_SIZE):
+            batch = leaves[start:start + CLASSIFY_BATCH_SIZE]
+            heatmap = settings['heatmap']
+            if deadline is not None:
+                if deadline.client_gone():
+                    raise DeadlineExceeded("Client disconnected during anomaly detection", cancelled=True)
+                if deadline.expired():
+                    if not results:
+                        deadline.check('anomaly detection')
+                    deadline.skip('leaves_after_deadline', len(leaves) - start)
+                    break
+                # Per-leaf costs are sequential timings, so this errs on the safe side for batches
+                if heatmap and not deadline.can_afford(
+                        (len(leaves) - start) * (costs['anomaly'] + costs['heatmap'] + costs['disease'])):
+                    heatmap = False
+                    deadline.skip('heatmap')
+            
+            # Batch timings are not per-leaf costs, so they only feed the stage metrics
+            stage_start = time.perf_counter()
+            anomaly_results = self.anomaly_detector.predict_batch(
+                batch,
+                heatmap=heatmap,
+                heatmap_size=settings['heatmap_size'],
+                knn_backend=settings['knn_backend'],
+                render_heatmap=settings['heatmap_render']
+            )
+            self._observe_stage('anomaly_detection', stage_start)
+            
+            # Disease stage for the diseased leaves of the batch
+            diseased = [i for i, anomaly_result in enumerate(anomaly_results) if anomaly_result['is_diseased']]
+            disease_results = {}
+            if diseased:
+                stage_start = time.perf_counter()
+                if rules_backend:
+                    for i in diseased:
+                        disease_results[i] = self.lesion_rules.classify(batch[i])
+                    self._observe_stage('disease_rules', stage_start)
+                else:
+                    found = self.disease_executor.submit(
+                        self.disease_segmenter.segment_diseases_batch, [batch[i] for i in diseased]
+                    ).result()
+                    disease_results = dict(zip(diseased, found))
+                    self._observe_stage('disease_segmentation', stage_start)
+            
+            for i, (leaf_img, anomaly_result) in enumerate(zip(batch, anomaly_results)):
+                disease_result = disease_results.get(i)
+                print(f"   Leaf {start + i + 1}: {anomaly_result['prediction']} (Score: {anomaly_result['anomaly_score']:.4f})")
+                results.append(LeafResult(
+                    start + i,
+                    None,
+                    None,
+                    leaf_img.shape[:2],
+                    leaf_img if 'leaf_image' in keep else None,
+                    AnomalyResult(anomaly_result, keep),
+                    DiseaseResult(disease_result, keep) if disease_result else None
+                ))
+                leaves[start + i] = None
+        
+        return results
+    
+    def process_video(self, source, settings=None, deadline=None, keep_arrays=DEFAULT_KEEP_ARRAYS,
+                      sample_fps=SAMPLE_FPS):
+        """
+        Process a video file (path) or a burst (list of BGR frames), analysing each leaf once
+        Runs track_frames over the whole source, then classify_tracks, on this pipeline.
+        Returns a list of TrackResult in order of first appearance.
+        """
+        name = os.path.basename(source) if isinstance(source, str) else f"burst of {len(source)} frames"
+        print(f"\n{'='*70}")
+        print(f"Processing: {name}")
+        print(f"{'='*70}")
+        
+        start = time.perf_counter()
+        tracker = LeafTracker()
+        frames = iter_frames(source, sample_fps)
+        try:
+            self.track_frames(frames, tracker, settings, deadline)
+        finally:
+            frames.close()
+        results = self.classify_tracks(tracker, settings, deadline, keep_arrays)
+        self.last_report = {'duplicate_leaves_removed': 0, 'speculative': False,
+                            **tracker.report(time.perf_counter() - start)}
+        return results
+    
+    def track_frames(self, frames, tracker, settings=None, deadline=None, max_frames=None):
+        """
+        Leaf YOLO (never tiled) and LeafTracker over the next max_frames frames (None = all)
+        frames is an iterator from leaf_tracking.iter_frames. The tracker holds all state,
+        so callers may hand consecutive batches to different replicas.
+        Returns True if more frames may follow, False once frames is exhausted or sampling
+        stopped because analysing the tracks found so far would no longer fit the deadline.
+        """
+        settings = {**DEFAULT_INFERENCE_SETTINGS, **(settings or {})}
+        if settings['disease_backend'] not in DISEASE_BACKENDS:
+            raise ValueError(f"disease_backend must be one of {DISEASE_BACKENDS}")
+        # Tiling costs a batch of YOLO calls per frame; the track's other frames make up for missed leaves
+        settings['tiling'] = 'off'
+        costs = self.stage_costs
+        extractor = self.leaf_extractor
+        sam_model = extractor.get_sam(settings['sam_model'])
+        segment = lambda img, box: extractor.segment_box(img, box, sam_model)
+        
+        count = 0
+        for frame_index, seconds, frame in frames:
+            if deadline is not None:
+                if deadline.client_gone():
+                    raise DeadlineExceeded("Client disconnected during leaf tracking", cancelled=True)
+                found = len(tracker.tracks) + len(tracker.closed)
+                if deadline.expired() or not deadline.can_afford(found * (costs['anomaly'] + costs['disease'])):
+                    deadline.skip('frames_after_deadline')
+                    return False
+            
+            stage_start = time.perf_counter()
+            xyxy, confidences = extractor.detect_leaves(frame, settings)
+            self._observe_stage('leaf_detection', stage_start)
+            stage_start = time.perf_counter()
+            tracker.update(frame_index, frame, xyxy, confidences, segment, seconds)
+            self._observe_stage('leaf_tracking', stage_start)
+            count += 1
+            if max_frames is not None and count >= max_frames:
+                return True
+        return False
+    
+    def classify_tracks(self, tracker, settings=None, deadline=None, keep_arrays=DEFAULT_KEEP_ARRAYS):
+        """
+        Close the tracker and run each confirmed track's best view through classify_leaves
+        Returns a list of TrackResult in order of first appearance.
+        """
+        settings = {**DEFAULT_INFERENCE_SETTINGS, **(settings or {})}
+        extractor = self.leaf_extractor
+        sam_model = extractor.get_sam(settings['sam_model'])
+        
+        tracks = tracker.finish()
+        print(f"   {tracker.frames_sampled} frames sampled, {len(tracks)} leaves tracked "
+              f"({tracker.dropped} unconfirmed dropped, {tracker.segmentations} SAM calls)")
+        if not tracks and deadline is not None and deadline.skipped.get('frames_after_deadline'):
+            # Frames were left unread, so this is a timeout rather than a video without leaves
+            deadline.check('leaf tracking')
+            raise DeadlineExceeded(f"Deadline of {deadline.budget_ms} ms too short to track any leaf")
+        if not tracks:
+            return []
+        
+        # Best views are small context crops; their masks come from the track's SAM run
+        masks = [tracker.best_view_mask(track, lambda img, box: extractor.segment_box(img, box, sam_model))
+                 for track in tracks]
+        leaves = self.classify_leaves([track.best['context'] for track in tracks], masks, settings,
+                                      deadline, keep_arrays)
+        results = []
+        for track, leaf in zip(tracks, leaves):
+            x1, y1, x2, y2 = track.best['frame_box']
+            leaf.leaf_index = track.track_id - 1
+            leaf.bbox = (x1, y1, x2, y2)
+            leaf.center = ((x1 + x2) // 2, (y1 + y2) // 2)
+            results.append(TrackResult(
+                track.track_id, track.first_frame, track.last_frame, track.best['frame_index'],
+                track.hits, leaf
+            ))
+        return results
+    
     def _visualize_results(self, img_path, results):
         """Create comprehensive visualization"""
+        import matplotlib.pyplot as plt
+        
         n_leaves = len(results)
         
         for i, result in enumerate(results):
-            anomaly = result['anomaly_result']
-            disease = result['disease_result']
+            anomaly = result.anomaly_result
+            disease = result.disease_result
             
             if disease is None:
                 # Simple visualization for healthy leaves
                 fig, ax = plt.subplots(1, 1, figsize=(8, 8))
-                leaf_rgb = cv2.cvtColor(result['leaf_image'], cv2.COLOR_BGR2RGB)
+                leaf_rgb = cv2.cvtColor(result.leaf_image, cv2.COLOR_BGR2RGB)
                 ax.imshow(leaf_rgb)
                 ax.axis('off')
                 
-                color = 'red' if anomaly['is_diseased'] else 'green'
-                title = f"Leaf {i+1} - {anomaly['prediction']}\n"
-                title += f"Anomaly Score: {anomaly['anomaly_score']:.4f}\n"
-                title += f"Confidence: {anomaly['confidence']:.1f}%"
+                color = 'red' if anomaly.is_diseased else 'green'
+                title = f"Leaf {i+1} - {anomaly.prediction}\n"
+                title += f"Anomaly Score: {anomaly.anomaly_score:.4f}\n"
+                title += f"Confidence: {anomaly.confidence:.1f}%"
                 ax.set_title(title, fontsize=12, fontweight='bold', color=color)
                 
                 plt.tight_layout()
@@ -586,17 +1540,17 @@ class GrapeLeafPipeline:
                 fig = plt.figure(figsize=(18, 12))
                 gs = fig.add_gridspec(2, 3, hspace=0.3, wspace=0.3)
                 
-                leaf_rgb = cv2.cvtColor(result['leaf_image'], cv2.COLOR_BGR2RGB)
+                leaf_rgb = cv2.cvtColor(result.leaf_image, cv2.COLOR_BGR2RGB)
                 
                 # Detection result
                 ax1 = fig.add_subplot(gs[0, 0])
-                ax1.imshow(disease['result_img'])
+                ax1.imshow(disease.result_img)
                 ax1.set_title(f"Leaf {i+1} - Disease Detection", fontweight='bold')
                 ax1.axis('off')
                 
                 # Disease mask
                 ax2 = fig.add_subplot(gs[0, 1])
-                ax2.imshow(disease['disease_mask'], cmap='hot')
+                ax2.imshow(disease.disease_mask, cmap='hot')
                 ax2.set_title("Disease Segmentation Mask", fontweight='bold')
                 ax2.axis('off')
                 
@@ -604,7 +1558,7 @@ class GrapeLeafPipeline:
                 ax3 = fig.add_subplot(gs[0, 2])
                 overlay = leaf_rgb.copy()
                 colored_mask = np.zeros_like(leaf_rgb)
-                colored_mask[disease['disease_mask'] > 0] = [255, 0, 0]
+                colored_mask[disease.disease_mask > 0] = [255, 0, 0]
                 overlay = cv2.addWeighted(overlay, 0.7, colored_mask, 0.3, 0)
                 ax3.imshow(overlay)
                 ax3.set_title("Disease Overlay (Red)", fontweight='bold')
@@ -613,15 +1567,15 @@ class GrapeLeafPipeline:
                 # Diseased only
                 ax4 = fig.add_subplot(gs[1, 0])
                 diseased_only = leaf_rgb.copy()
-                diseased_only[disease['disease_mask'] == 0] = [255, 255, 255]
+                diseased_only[disease.disease_mask == 0] = [255, 255, 255]
                 ax4.imshow(diseased_only)
                 ax4.set_title("Diseased Regions Only", fontweight='bold')
                 ax4.axis('off')
                 
                 # Heatmap
                 ax5 = fig.add_subplot(gs[1, 1])
-                heatmap = disease['distance_heatmap'].copy()
-                heatmap[disease['black_mask'] > 0] = 0
+                heatmap = disease.distance_heatmap.copy()
+                heatmap[disease.black_mask > 0] = 0
                 im = ax5.imshow(heatmap, cmap='jet')
                 ax5.set_title("Color Distance Heatmap", fontweight='bold')
                 ax5.axis('off')
@@ -632,14 +1586,14 @@ class GrapeLeafPipeline:
                 ax6.axis('off')
                 
                 report = f"LEAF {i+1} ANALYSIS\n{'='*30}\n\n"
-                report += f"Anomaly Score: {anomaly['anomaly_score']:.4f}\n"
-                report += f"Confidence: {anomaly['confidence']:.1f}%\n\n"
-                report += f"Leaf Area: {disease['total_leaf_pixels']:,} px\n"
-                report += f"Disease Area: {disease['total_disease_pixels']:,} px\n"
-                report += f"Coverage: {disease['total_disease_percentage']:.2f}%\n\n"
+                report += f"Anomaly Score: {anomaly.anomaly_score:.4f}\n"
+                report += f"Confidence: {anomaly.confidence:.1f}%\n\n"
+                report += f"Leaf Area: {disease.total_leaf_pixels:,} px\n"
+                report += f"Disease Area: {disease.total_disease_pixels:,} px\n"
+                report += f"Coverage: {disease.total_disease_percentage:.2f}%\n\n"
                 report += f"{'-'*30}\n\nDetected Diseases:\n\n"
                 
-                for j, d in enumerate(disease['disease_info'], 1):
+                for j, d in enumerate(disease.disease_info, 1):
                     report += f"{j}. {d['name']}\n"
                     report += f"   Conf: {d['confidence']:.1%}\n"
                     report += f"   Area: {d['percentage']:.2f}%\n\n"
@@ -660,6 +1614,8 @@ def main():
     parser = argparse.ArgumentParser(description='Complete Grape Leaf Disease Detection Pipeline')
     parser.add_argument('--image', type=str, help='Path to single image')
     parser.add_argument('--folder', type=str, help='Path to folder with images')
+    parser.add_argument('--video', type=str, help='Path to a video (one analysis per tracked leaf)')
+    parser.add_argument('--sample-fps', type=float, default=SAMPLE_FPS, help='Video frames analysed per second')
     parser.add_argument('--yolo-leaf', type=str, default=YOLO_LEAF_MODEL, help='Leaf detection model')
     parser.add_argument('--sam', type=str, default=SAM_MODEL, help='SAM model')
     parser.add_argument('--patchcore', type=str, default=PATCHCORE_MODEL, help='PatchCore model')
@@ -696,11 +1652,11 @@ def main():
             print("SUMMARY")
             print(f"{'='*70}")
             for r in results:
-                print(f"\nLeaf {r['leaf_index']+1}:")
-                print(f"  Status: {r['anomaly_result']['prediction']}")
-                print(f"  Confidence: {r['anomaly_result']['confidence']:.1f}%")
-                if r['disease_result']:
-                    print(f"  Disease Coverage: {r['disease_result']['total_disease_percentage']:.2f}%")
+                print(f"\nLeaf {r.leaf_index+1}:")
+                print(f"  Status: {r.anomaly_result.prediction}")
+                print(f"  Confidence: {r.anomaly_result.confidence:.1f}%")
+                if r.disease_result:
+                    print(f"  Disease Coverage: {r.disease_result.total_disease_percentage:.2f}%")
     
     # Process folder
     elif args.folder:
@@ -721,11 +1677,33 @@ def main():
         for img_path in image_paths:
             pipeline.process_image(str(img_path), visualize=not args.no_viz)
     
+    # Process video
+    elif args.video:
+        if not os.path.exists(args.video):
+            print(f"❌ Video not found: {args.video}")
+            return
+        
+        tracks = pipeline.process_video(args.video, sample_fps=args.sample_fps)
+        report = pipeline.last_report
+        print(f"\n{'='*70}")
+        print("SUMMARY")
+        print(f"{'='*70}")
+        if report['realtime_factor'] is not None:
+            print(f"Processed {report['video_seconds']:.1f}s of video in {report['seconds']:.1f}s "
+                  f"({report['realtime_factor']:.2f}x real time)")
+        for t in tracks:
+            print(f"\nLeaf track {t.track_id} (frames {t.first_frame}-{t.last_frame}, best {t.best_frame}):")
+            print(f"  Status: {t.leaf.anomaly_result.prediction}")
+            print(f"  Confidence: {t.leaf.anomaly_result.confidence:.1f}%")
+            if t.leaf.disease_result:
+                print(f"  Disease Coverage: {t.leaf.disease_result.total_disease_percentage:.2f}%")
+    
     else:
-        print("Please specify --image or --folder")
+        print("Please specify --image, --folder or --video")
         print("\nExamples:")
         print("  python complete_pipeline.py --image test.jpg")
         print("  python complete_pipeline.py --folder test_images/")
+        print("  python complete_pipeline.py --video row_walk.mp4")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
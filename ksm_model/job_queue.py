@@ -0,0 +1,299 @@
+"""
+Persistent Job Queue
+SQLite-backed queue for asynchronous disease detection jobs.
+Jobs survive server restarts and are drained by the inference workers.
+Completion webhooks are queued in the same table, so deliveries that failed
+or were cut short by a restart are retried.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+JOB_RETENTION_SECONDS = 7 * 24 * 3600  # Finished jobs are purged after a week
+CLAIM_POLL_INTERVAL = 1.0              # Seconds between queue polls when idle
+MAX_JOB_ATTEMPTS = 3                   # Runs before a job that keeps interrupting its worker is failed
+CALLBACK_ATTEMPTS = 3                  # Webhook deliveries before a callback is given up
+CALLBACK_BACKOFF = 2.0                 # Seconds before the first retry; doubles after every failure
+CALLBACK_LEASE = 60.0                  # Seconds a claimed delivery is reserved for its sender
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+
+CALLBACK_PENDING = 'pending'
+CALLBACK_FAILED = 'failed'
+
+# SET clause that makes a finished job's webhook (if it has one) due now; binds (CALLBACK_PENDING, now)
+CALLBACK_DUE = ("callback_status = CASE WHEN callback_url IS NULL THEN NULL ELSE ? END, "
+                "callback_next_at = CASE WHEN callback_url IS NULL THEN NULL ELSE ? END")
+
+
+class JobQueue:
+    """Durable FIFO job queue stored in a local SQLite database"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self._conn = None
+        self._conn_pid = None
+
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+
+        with self.lock:
+            conn = self._connection()
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    callback_url TEXT,
+                    callback_status TEXT,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker_pid INTEGER,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+
+            # Databases created before pre-fork mode and durable callbacks lack these columns
+            columns = [row['name'] for row in conn.execute("PRAGMA table_info(jobs)")]
+            for column, kind in (('worker_pid', 'INTEGER'), ('callback_attempts', 'INTEGER NOT NULL DEFAULT 0'),
+                                 ('callback_next_at', 'REAL')):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_callback ON jobs (callback_status, callback_next_at)")
+
+    def _connection(self):
+        """Return the SQLite connection for the current process"""
+        # Connections must not cross a fork, so reopen in child processes
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(
+                self.db_path,
+                timeout=30,
+                isolation_level=None,
+                check_same_thread=False
+            )
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def recover(self):
+        """
+        Requeue jobs that were running when the server last stopped
+        Returns (requeued, failed); jobs already run MAX_JOB_ATTEMPTS times are failed instead
+        """
+        with self.lock:
+            conn = self._connection()
+            failed = self._fail_exhausted(conn, "status = ?", (STATUS_RUNNING,))
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?",
+                (STATUS_QUEUED, STATUS_RUNNING)
+            )
+            return cursor.rowcount, failed
+
+    def requeue_worker(self, pid):
+        """
+        Requeue jobs held by a worker process that died
+        Returns (requeued, failed); a job that keeps killing workers fails after MAX_JOB_ATTEMPTS runs
+        """
+        with self.lock:
+            conn = self._connection()
+            failed = self._fail_exhausted(conn, "status = ? AND worker_pid = ?", (STATUS_RUNNING, pid))
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, worker_pid = NULL WHERE status = ? AND worker_pid = ?",
+                (STATUS_QUEUED, STATUS_RUNNING, pid)
+            )
+            return cursor.rowcount, failed
+
+    def _fail_exhausted(self, conn, where, params):
+        """Fail the interrupted jobs matching where that used up their attempts (caller holds the lock)"""
+        now = time.time()
+        cursor = conn.execute(
+            f"UPDATE jobs SET status = ?, error = ?, finished_at = ?, worker_pid = NULL, {CALLBACK_DUE} "
+            f"WHERE {where} AND attempts >= ?",
+            (STATUS_FAILED, f"Job was interrupted {MAX_JOB_ATTEMPTS} times (worker crash or restart); not retried",
+             now, CALLBACK_PENDING, now, *params, MAX_JOB_ATTEMPTS)
+        )
+        return cursor.rowcount
+
+    def purge(self, max_age=JOB_RETENTION_SECONDS):
+        """Delete finished jobs older than max_age seconds"""
+        cutoff = time.time() - max_age
+        with self.lock:
+            cursor = self._connection().execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (STATUS_COMPLETED, STATUS_FAILED, cutoff)
+            )
+            return cursor.rowcount
+
+    def submit(self, payload, callback_url=None):
+        """Add a new job to the queue and return its record"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self.condition:
+            self._connection().execute(
+                "INSERT INTO jobs (id, status, payload, callback_url, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, STATUS_QUEUED, json.dumps(payload), callback_url, now)
+            )
+            self.condition.notify()
+        return self.get(job_id)
+
+    def claim(self, timeout=None):
+        """Atomically take the oldest queued job, waiting up to timeout seconds"""
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self.condition:
+            while True:
+                job = self._claim_next()
+                if job is not None:
+                    return job
+
+                # Poll periodically so jobs queued by other processes are seen
+                wait = CLAIM_POLL_INTERVAL
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return None
+                    wait = min(wait, remaining)
+                self.condition.wait(wait)
+
+    def _claim_next(self):
+        """Mark the oldest queued job as running (caller holds the lock)"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                (STATUS_QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, worker_pid = ?, attempts = attempts + 1 WHERE id = ?",
+                (STATUS_RUNNING, time.time(), os.getpid(), row['id'])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return self._get_locked(row['id'])
+
+    def complete(self, job_id, result):
+        """Store the result of a finished job"""
+        self._finish(job_id, STATUS_COMPLETED, result=json.dumps(result))
+
+    def fail(self, job_id, error):
+        """Mark a job as failed with an error message"""
+        self._finish(job_id, STATUS_FAILED, error=str(error))
+
+    def _finish(self, job_id, status, result=None, error=None):
+        now = time.time()
+        with self.lock:
+            self._connection().execute(
+                f"UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, {CALLBACK_DUE} WHERE id = ?",
+                (status, result, error, now, CALLBACK_PENDING, now, job_id)
+            )
+
+    def claim_callback(self):
+        """
+        Reserve the next due webhook delivery for CALLBACK_LEASE seconds and return its job, or None
+        A sender that dies mid-delivery leaves the lease to expire, so another one retries it
+        """
+        now = time.time()
+        with self.lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE callback_status = ? AND callback_next_at <= ? "
+                    "ORDER BY callback_next_at LIMIT 1",
+                    (CALLBACK_PENDING, now)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET callback_next_at = ?, callback_attempts = callback_attempts + 1 WHERE id = ?",
+                        (now + CALLBACK_LEASE, row['id'])
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return self._get_locked(row['id']) if row is not None else None
+
+    def finish_callback(self, job_id, delivered_status=None):
+        """
+        Record a webhook delivery: delivered_status (e.g. 'delivered (200)') on success,
+        None on failure, which schedules a retry with backoff until CALLBACK_ATTEMPTS
+        """
+        with self.lock:
+            conn = self._connection()
+            if delivered_status is not None:
+                conn.execute(
+                    "UPDATE jobs SET callback_status = ?, callback_next_at = NULL WHERE id = ?",
+                    (delivered_status, job_id)
+                )
+                return
+            row = conn.execute("SELECT callback_attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            attempts = row['callback_attempts']
+            if attempts >= CALLBACK_ATTEMPTS:
+                conn.execute(
+                    "UPDATE jobs SET callback_status = ?, callback_next_at = NULL WHERE id = ?",
+                    (CALLBACK_FAILED, job_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET callback_next_at = ? WHERE id = ?",
+                    (time.time() + CALLBACK_BACKOFF * 2 ** (attempts - 1), job_id)
+                )
+
+    def get(self, job_id):
+        """Return a job record as a dictionary, or None if unknown"""
+        with self.lock:
+            return self._get_locked(job_id)
+
+    def _get_locked(self, job_id):
+        row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        return job
+
+    def depth(self):
+        """Number of jobs waiting to be processed"""
+        with self.lock:
+            row = self._connection().execute(
+                "SELECT COUNT(*) AS n FROM jobs WHERE status = ?",
+                (STATUS_QUEUED,)
+            ).fetchone()
+            return row['n']
+
+    def close(self):
+        """Close the database connection"""
+        with self.lock:
+            if self._conn is not None and self._conn_pid == os.getpid():
+                self._conn.close()
+            self._conn = None
@@ -0,0 +1,127 @@
+"""
+Adaptive Tiled Leaf Detection
+Leaf YOLO sees the whole frame scaled down to imgsz, so in wide canopy shots a
+distant leaf can shrink to a few input pixels and be missed. Tiling runs YOLO
+again over overlapping full-resolution tiles (batched) and merges the tile
+boxes with the whole-frame boxes across tile borders.
+
+The tiled pass only runs when it is likely to pay off: the frame must be
+downscaled more than TILING_MIN_DOWNSCALE times and span more than one tile,
+and the whole-frame pass must have found mostly small leaves, or none at all
+when empty frames are tiled too (see tiling_reason). A leaf cut by a
+tile border is still found whole, because SAM segments it on the full frame
+from the box center and duplicate masks are merged afterwards.
+
+Measured against whole-frame detection by benchmark_tiling.py.
+"""
+
+import numpy as np
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+# off: whole frame only, auto: tile when the first pass suggests small leaves, on: always tile large frames
+TILING_MODES = ('off', 'auto', 'on')
+
+TILE_SIZE = 1280                # Tile side in frame pixels (each tile is scaled to imgsz)
+TILE_OVERLAP = 0.2              # Share of a tile shared with its neighbour
+TILE_BATCH_SIZE = 8             # Tiles per YOLO call
+
+TILING_MIN_DOWNSCALE = 2.0      # Frames whose longest side is at most imgsz x this are never tiled
+SMALL_LEAF_PX = 32              # A box whose short side is below this many YOLO input pixels is small
+SMALL_LEAF_SHARE = 0.3          # Tile when at least this share of the first-pass boxes are small
+TILE_CONTAINMENT = 0.8          # A box this much inside a kept box is the same leaf, cut by a tile border
+
+
+def tile_starts(length, tile, overlap=TILE_OVERLAP):
+    """Start offsets of overlapping tiles covering [0, length); the last tile ends at length"""
+    if length <= tile:
+        return [0]
+    stride = max(1, int(tile * (1 - overlap)))
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+
+def tile_grid(height, width, tile=TILE_SIZE, overlap=TILE_OVERLAP):
+    """(x1, y1, x2, y2) of the tiles covering a frame, row by row"""
+    return [
+        (x, y, min(x + tile, width), min(y + tile, height))
+        for y in tile_starts(height, tile, overlap)
+        for x in tile_starts(width, tile, overlap)
+    ]
+
+
+def tiling_reason(frame_shape, xyxy, imgsz, mode='auto', tile_size=TILE_SIZE, empty_frames=False):
+    """
+    Why the frame should be tiled ('forced', 'no_leaves', 'small_leaves') or None
+    xyxy holds the first-pass boxes in frame pixels. A frame without any first-pass
+    box is only tiled with empty_frames, since that tiles every large leafless photo.
+    """
+    if mode == 'off':
+        return None
+    long_side = max(frame_shape[:2])
+    if long_side <= imgsz * TILING_MIN_DOWNSCALE:
+        return None
+    # A frame that fits in one tile would only get the whole-frame pass again
+    if long_side <= tile_size:
+        return None
+    if mode == 'on':
+        return 'forced'
+    if len(xyxy) == 0:
+        return 'no_leaves' if empty_frames else None
+    # Box short sides as YOLO saw them in the first pass
+    scale = imgsz / float(long_side)
+    sides = np.minimum(xyxy[:, 2] - xyxy[:, 0], xyxy[:, 3] - xyxy[:, 1]) * scale
+    if np.mean(sides < SMALL_LEAF_PX) >= SMALL_LEAF_SHARE:
+        return 'small_leaves'
+    return None
+
+
+def merge_boxes(xyxy, confidences, iou_threshold, containment=TILE_CONTAINMENT):
+    """
+    Cross-tile NMS: indices of the boxes to keep, by descending confidence
+    A box is dropped when its IoU with a kept box reaches iou_threshold, or when
+    containment of its own area lies inside a kept box (a leaf cut by a tile border)
+    """
+    order = np.argsort(-np.asarray(confidences, dtype=np.float64), kind='stable')
+    areas = np.maximum(0, xyxy[:, 2] - xyxy[:, 0]) * np.maximum(0, xyxy[:, 3] - xyxy[:, 1])
+    keep = []
+    for i in order:
+        if keep:
+            kept = xyxy[keep]
+            w = np.clip(np.minimum(kept[:, 2], xyxy[i, 2]) - np.maximum(kept[:, 0], xyxy[i, 0]), 0, None)
+            h = np.clip(np.minimum(kept[:, 3], xyxy[i, 3]) - np.maximum(kept[:, 1], xyxy[i, 1]), 0, None)
+            inter = w * h
+            union = areas[keep] + areas[i] - inter
+            if np.any(inter >= iou_threshold * np.maximum(union, 1e-9)) or \
+                    np.any(inter >= containment * max(areas[i], 1e-9)):
+                continue
+        keep.append(int(i))
+    return keep
+
+
+def detect_tiles(model, img_bgr, tiles, settings, device):
+    """
+    Leaf YOLO over the given tiles in batches of TILE_BATCH_SIZE
+    Returns (xyxy in frame pixels, confidences)
+    """
+    boxes, confidences = [], []
+    for start in range(0, len(tiles), TILE_BATCH_SIZE):
+        batch = tiles[start:start + TILE_BATCH_SIZE]
+        results = model.predict(
+            source=[img_bgr[y1:y2, x1:x2] for x1, y1, x2, y2 in batch],
+            imgsz=settings['imgsz'],
+            conf=settings['conf'],
+            iou=settings['iou'],
+            device=device,
+            verbose=False
+        )
+        for (x1, y1, _, _), result in zip(batch, results):
+            if len(result.boxes) == 0:
+                continue
+            boxes.append(result.boxes.xyxy.cpu().numpy() + np.array([x1, y1, x1, y1], dtype=np.float32))
+            confidences.extend(float(c) for c in result.boxes.conf.cpu().numpy())
+    if not boxes:
+        return np.zeros((0, 4), dtype=np.float32), []
+    return np.concatenate(boxes), confidences
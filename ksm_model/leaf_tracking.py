@@ -0,0 +1,280 @@
+"""
+Leaf Tracking
+Video and burst input for GrapeLeafPipeline.process_video. Frames are sampled
+at SAMPLE_FPS and leaf YOLO runs on each sampled frame. Boxes are then
+associated with tracks by IoU against each track's constant-velocity
+prediction.
+
+SAM runs once per track, when the track is confirmed. Its mask is propagated
+to later frames by fitting it to the track's new box. Every view of a leaf is
+scored on sharpness of the leaf pixels, size and detection confidence, and a
+leaf cut by the frame edge scores lower. Only the best view of each confirmed
+track is kept for the PatchCore and disease stages, so they run once per leaf
+instead of once per frame.
+"""
+
+import cv2
+import numpy as np
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+SAMPLE_FPS = 5.0                # Video frames analysed per second of footage (None = every frame)
+TRACK_IOU = 0.3                 # Minimum IoU between a box and a track's predicted box
+MAX_TRACK_MISSES = 3            # Sampled frames a track may go unseen before it is closed
+MIN_TRACK_HITS = 2              # Detections before a track is confirmed (drops one-frame false positives)
+VELOCITY_SMOOTHING = 0.5        # Weight of the latest box motion in the velocity estimate
+CONTEXT_MARGIN = 0.15           # Share of the box size kept around a leaf's best view
+QUALITY_FRAME_SIZE = 128        # Views are scaled to this longest side to measure sharpness
+EDGE_PENALTY = 0.5              # Quality factor for a view whose box touches the frame edge
+RESEGMENT_SHAPE_CHANGE = 0.25   # Run SAM again on the best view if its box aspect changed this much
+FRAME_BATCH = 10                # Sampled frames processed per model replica checkout
+
+
+def iter_video_frames(path, sample_fps=SAMPLE_FPS):
+    """
+    (frame_index, seconds, BGR frame) for the sampled frames of a video file
+    Skipped frames are only grabbed, not decoded. Raises ValueError if the video cannot be opened.
+    """
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError("Cannot open video (unsupported or corrupt file)")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+    step = max(1, int(round(fps / sample_fps))) if fps > 0 and sample_fps else 1
+    index = 0
+    try:
+        while True:
+            if index % step == 0:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield index, (index / fps if fps > 0 else None), frame
+            elif not capture.grab():
+                break
+            index += 1
+    finally:
+        capture.release()
+
+
+def iter_burst_frames(frames):
+    """(frame_index, None, BGR frame) for a burst of still frames"""
+    for index, frame in enumerate(frames):
+        yield index, None, frame
+
+
+def iter_frames(source, sample_fps=SAMPLE_FPS):
+    """Frame iterator for a video path or a list of frames"""
+    if isinstance(source, str):
+        return iter_video_frames(source, sample_fps)
+    return iter_burst_frames(source)
+
+
+def box_iou(a, b):
+    """IoU of two (x1, y1, x2, y2) boxes"""
+    w = min(a[2], b[2]) - max(a[0], b[0])
+    h = min(a[3], b[3]) - max(a[1], b[1])
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    return inter / float((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter)
+
+
+def fit_mask(template, box):
+    """Propagate a track's mask (cropped to its box) to a new box by scaling it"""
+    width, height = max(1, box[2] - box[0]), max(1, box[3] - box[1])
+    return cv2.resize(template.astype(np.uint8), (width, height), interpolation=cv2.INTER_NEAREST) > 0
+
+
+def view_quality(frame, box, mask, confidence):
+    """Score of one view of a leaf: leaf-pixel sharpness x sqrt(leaf area) x confidence, less at the frame edge"""
+    x1, y1, x2, y2 = box
+    gray = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+    scale = min(1.0, QUALITY_FRAME_SIZE / float(max(gray.shape)))
+    if scale < 1.0:
+        size = (max(1, int(gray.shape[1] * scale)), max(1, int(gray.shape[0] * scale)))
+        gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+        small_mask = cv2.resize(mask.astype(np.uint8), size, interpolation=cv2.INTER_NEAREST) > 0
+    else:
+        small_mask = mask
+    values = cv2.Laplacian(gray, cv2.CV_32F)[small_mask]
+    if values.size < 2:
+        return 0.0
+
+    quality = float(values.var()) * np.sqrt(np.count_nonzero(mask)) * confidence
+    height, width = frame.shape[:2]
+    if x1 <= 0 or y1 <= 0 or x2 >= width or y2 >= height:
+        quality *= EDGE_PENALTY
+    return quality
+
+
+class LeafTrack:
+    """One leaf followed across frames, with its SAM mask and best view so far"""
+    __slots__ = ('track_id', 'box', 'velocity', 'hits', 'misses', 'first_frame', 'last_frame',
+                 'template', 'template_box', 'best')
+
+    def __init__(self, track_id, box, frame_index):
+        self.track_id = track_id
+        self.box = box
+        self.velocity = (0.0, 0.0, 0.0, 0.0)
+        self.hits = 1
+        self.misses = 0
+        self.first_frame = frame_index
+        self.last_frame = frame_index
+        self.template = None        # SAM mask cropped to template_box
+        self.template_box = None
+        self.best = None            # Best view: see LeafTracker._keep_view
+
+    def predicted_box(self):
+        """Where the leaf should be in the next sampled frame (constant velocity)"""
+        return tuple(c + v for c, v in zip(self.box, self.velocity))
+
+    def move_to(self, box, frame_index):
+        motion = [n - o for n, o in zip(box, self.box)]
+        self.velocity = tuple(
+            VELOCITY_SMOOTHING * m + (1 - VELOCITY_SMOOTHING) * v for m, v in zip(motion, self.velocity)
+        )
+        self.box = box
+        self.hits += 1
+        self.misses = 0
+        self.last_frame = frame_index
+
+
+class LeafTracker:
+    """
+    Greedy IoU association of per-frame leaf boxes into tracks
+    The tracker holds no model: segment(image, box) is passed per call and returns
+    the SAM mask of the leaf in box, cropped to box (or None), so consecutive frame
+    batches may run on different pipeline replicas.
+    """
+
+    def __init__(self, iou_threshold=TRACK_IOU, max_misses=MAX_TRACK_MISSES, min_hits=MIN_TRACK_HITS):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self.tracks = []
+        self.closed = []
+        self.dropped = 0
+        self.segmentations = 0
+        self.next_id = 1
+        self.frames_sampled = 0
+        self.video_seconds = None
+
+    def update(self, frame_index, frame, xyxy, confidences, segment, seconds=None):
+        """Associate one sampled frame's leaf boxes with the open tracks; seconds is its video timestamp"""
+        self.frames_sampled += 1
+        self.video_seconds = seconds
+        boxes = [tuple(int(v) for v in box) for box in xyxy]
+        pairs = sorted(
+            ((box_iou(track.predicted_box(), box), t, d)
+             for t, track in enumerate(self.tracks) for d, box in enumerate(boxes)),
+            reverse=True
+        )
+        matched_tracks, matched_boxes = set(), set()
+        seen = []
+        for iou, t, d in pairs:
+            if iou < self.iou_threshold:
+                break
+            if t in matched_tracks or d in matched_boxes:
+                continue
+            matched_tracks.add(t)
+            matched_boxes.add(d)
+            self.tracks[t].move_to(boxes[d], frame_index)
+            seen.append((self.tracks[t], d))
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+        for d, box in enumerate(boxes):
+            if d not in matched_boxes and box[2] > box[0] and box[3] > box[1]:
+                track = LeafTrack(self.next_id, box, frame_index)
+                self.next_id += 1
+                self.tracks.append(track)
+                seen.append((track, d))
+
+        for track, d in seen:
+            if track.hits >= self.min_hits:
+                self._keep_view(track, frame_index, frame, confidences[d], segment)
+
+        still_open = []
+        for track in self.tracks:
+            if track.misses > self.max_misses:
+                self._close(track)
+            else:
+                still_open.append(track)
+        self.tracks = still_open
+
+    def _keep_view(self, track, frame_index, frame, confidence, segment):
+        """Segment a newly confirmed track once, then keep its view if it beats the best one"""
+        if track.template is None:
+            track.template = self._segment(segment, frame, track.box)
+            track.template_box = track.box
+        mask = fit_mask(track.template, track.box)
+        quality = view_quality(frame, track.box, mask, confidence)
+        if track.best is not None and quality <= track.best['quality']:
+            return
+
+        # Keep only the box plus a margin of the frame, for the leaf crop (and SAM, if needed)
+        x1, y1, x2, y2 = track.box
+        mx, my = int((x2 - x1) * CONTEXT_MARGIN), int((y2 - y1) * CONTEXT_MARGIN)
+        cx1, cy1 = max(0, x1 - mx), max(0, y1 - my)
+        cx2, cy2 = min(frame.shape[1], x2 + mx), min(frame.shape[0], y2 + my)
+        track.best = {
+            'quality': quality,
+            'frame_index': frame_index,
+            'frame_box': track.box,
+            'context': frame[cy1:cy2, cx1:cx2].copy(),
+            'box': (x1 - cx1, y1 - cy1, x2 - cx1, y2 - cy1)
+        }
+
+    def _segment(self, segment, image, box):
+        self.segmentations += 1
+        mask = segment(image, box)
+        if mask is None or not mask.any():
+            # SAM found nothing: fall back to the whole box
+            mask = np.ones((box[3] - box[1], box[2] - box[0]), dtype=bool)
+        return mask
+
+    def _close(self, track):
+        if track.best is not None:
+            self.closed.append(track)
+        else:
+            self.dropped += 1
+
+    def finish(self):
+        """Close every open track; returns the confirmed tracks in order of first appearance"""
+        for track in self.tracks:
+            self._close(track)
+        self.tracks = []
+        return sorted(self.closed, key=lambda track: track.track_id)
+
+    def best_view_mask(self, track, segment):
+        """
+        Leaf mask over the best view's context crop
+        The propagated SAM mask is used unless the box shape changed too much since SAM ran
+        """
+        view = track.best
+        box = view['box']
+        aspect = (box[2] - box[0]) / float(max(1, box[3] - box[1]))
+        tb = track.template_box
+        template_aspect = (tb[2] - tb[0]) / float(max(1, tb[3] - tb[1]))
+        if abs(aspect - template_aspect) / template_aspect > RESEGMENT_SHAPE_CHANGE:
+            crop_mask = self._segment(segment, view['context'], box)
+        else:
+            crop_mask = fit_mask(track.template, box)
+
+        mask = np.zeros(view['context'].shape[:2], dtype=np.uint8)
+        mask[box[1]:box[3], box[0]:box[2]] = crop_mask.astype(np.uint8)
+        return mask
+
+    def report(self, seconds):
+        """Counters for last_report after seconds of processing"""
+        video_seconds = self.video_seconds
+        return {
+            'frames_sampled': self.frames_sampled,
+            'tracks_dropped': self.dropped,
+            'sam_calls': self.segmentations,
+            'video_seconds': video_seconds,
+            'seconds': seconds,
+            # Above 1 means faster than real time (video files only)
+            'realtime_factor': video_seconds / seconds if video_seconds and seconds > 0 else None
+        }
@@ -0,0 +1,222 @@
+"""
+Rule-Based Lesion Classifier
+Compiles DISEASE_CHARACTERISTICS into lookup tables: every H, S, V, R, G and B
+value maps to a bitmask of the diseases whose range contains it, so labelling a
+leaf takes one table lookup per channel and a few ANDs per pixel. Candidate
+lesions are the connected components of each disease's bit plane, tested for
+area and circularity with vectorized per-component statistics, and scored with
+the table's weights: shape 30 + circularity 15 + area 15 + HSV 40 + RGB 10.
+The disease ranges overlap, so one spot can pass for several diseases: every
+connected lesion is assigned to the single disease that scores it best (ties
+go to the disease listed first) before areas and counts are aggregated.
+
+Used as the disease stage of the fast profile (instead of disease YOLO) and
+compared with DiseaseSegmenter by benchmark_lesion_rules.py.
+"""
+
+import cv2
+import numpy as np
+
+from disease_characteristics import DISEASE_CHARACTERISTICS
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+RULE_FRAME_SIZE = 256           # Leaves are analysed with their longest side scaled to this
+HEALTHY_CLASS = 'Healthy Tissue'
+BACKGROUND_MAX_VALUE = 1        # Extracted leaves sit on black; V at or below this is background
+MIN_RULE_CONFIDENCE = 0.6       # Share of the 110 points a lesion needs to be reported
+
+SCORE_WEIGHTS = {'shape': 30, 'circularity': 15, 'area': 15, 'hsv': 40, 'rgb': 10}
+MAX_SCORE = float(sum(SCORE_WEIGHTS.values()))
+
+
+def _range_lut(ranges):
+    """[(lo, hi, flag), ...] -> int32 table (for cv2.LUT) of OR-ed flags for every value in [lo, hi]"""
+    lut = np.zeros(256, dtype=np.int32)
+    for lo, hi, flag in ranges:
+        lut[int(lo):int(hi) + 1] |= flag
+    return lut
+
+
+class LesionRuleEngine:
+    """DISEASE_CHARACTERISTICS compiled into lookup tables and vectorized shape tests"""
+
+    def __init__(self, characteristics=DISEASE_CHARACTERISTICS, frame_size=RULE_FRAME_SIZE,
+                 min_confidence=MIN_RULE_CONFIDENCE):
+        self.frame_size = frame_size
+        self.min_confidence = min_confidence
+        self.names = [name for name in characteristics if name != HEALTHY_CLASS]
+        if len(self.names) > 31:
+            raise ValueError("At most 31 diseases fit in the lookup table bitmasks")
+
+        specs = [characteristics[name] for name in self.names]
+        flags = [1 << bit for bit in range(len(self.names))]
+
+        # One table per channel; a pixel's candidate diseases are the AND of its three lookups
+        self.hsv_luts = [
+            _range_lut([(*spec['color_range'][key], flag) for spec, flag in zip(specs, flags)])
+            for key in ('h_range', 's_range', 'v_range')
+        ]
+        self.rgb_luts = [
+            _range_lut([(*spec['rgb_range'][key], flag) for spec, flag in zip(specs, flags)])
+            for key in ('b', 'g', 'r')      # OpenCV channel order
+        ]
+
+        # Pixels inside the healthy-tissue ranges are never lesion candidates
+        healthy = characteristics.get(HEALTHY_CLASS)
+        self.healthy_luts = None
+        if healthy is not None:
+            self.healthy_luts = [
+                _range_lut([(*healthy['color_range'][key], 1)]).astype(np.uint8)
+                for key in ('h_range', 's_range', 'v_range')
+            ]
+
+        self.circularity_ranges = np.array([spec['circularity_range'] for spec in specs], dtype=np.float64)
+        self.area_ranges = np.array([spec['area_range'] for spec in specs], dtype=np.float64)
+        self.kernel = np.ones((3, 3), np.uint8)
+
+    def _component_scores(self, bit, plane, rgb_bits, area_scale):
+        """Labels, stats and (keep, confidence, native area) per component of one disease's bit plane"""
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(plane, connectivity=8)
+        if count <= 1:
+            return None
+
+        areas = stats[1:, cv2.CC_STAT_AREA].astype(np.float64)
+
+        # Perimeter = boundary pixels per component, counted in one bincount
+        boundary = plane - cv2.erode(plane, self.kernel)
+        perimeters = np.bincount(labels[boundary > 0], minlength=count)[1:].astype(np.float64)
+        circularity = np.clip(4 * np.pi * areas / np.maximum(perimeters, 1.0) ** 2, 0.0, 1.0)
+
+        rgb_match = (rgb_bits >> bit) & 1
+        rgb_share = np.bincount(labels[rgb_match > 0], minlength=count)[1:] / areas
+
+        native_areas = areas * area_scale
+        c_lo, c_hi = self.circularity_ranges[bit]
+        a_lo, a_hi = self.area_ranges[bit]
+        in_circularity = (circularity >= c_lo) & (circularity <= c_hi)
+        in_area = (native_areas >= a_lo) & (native_areas <= a_hi)
+
+        # Shape: how close circularity is to the middle of the disease's range
+        middle, half_width = (c_lo + c_hi) / 2, max((c_hi - c_lo) / 2, 1e-6)
+        shape = np.clip(1 - np.abs(circularity - middle) / half_width, 0.0, 1.0)
+
+        score = (SCORE_WEIGHTS['hsv']
+                 + SCORE_WEIGHTS['rgb'] * rgb_share
+                 + SCORE_WEIGHTS['circularity'] * in_circularity
+                 + SCORE_WEIGHTS['area'] * in_area
+                 + SCORE_WEIGHTS['shape'] * shape)
+        confidence = score / MAX_SCORE
+        keep = in_circularity & in_area & (confidence >= self.min_confidence)
+        return labels, stats, keep, confidence, native_areas
+
+    def classify(self, leaf_img_bgr, full_resolution=False):
+        """
+        Label candidate lesions on an extracted leaf (black background)
+        Returns a dict shaped like DiseaseSegmenter.segment_diseases, or None if no lesion passes.
+        Masks and the annotated image are at the analysis resolution unless full_resolution.
+        """
+        height, width = leaf_img_bgr.shape[:2]
+        scale = min(1.0, self.frame_size / float(max(height, width)))
+        frame = leaf_img_bgr
+        if scale < 1.0:
+            frame = cv2.resize(leaf_img_bgr, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        area_scale = 1.0 / (scale * scale)
+
+        h, s, v = cv2.split(cv2.cvtColor(frame, cv2.COLOR_BGR2HSV))
+        b, g, r = cv2.split(frame)
+        bits = cv2.LUT(h, self.hsv_luts[0]) & cv2.LUT(s, self.hsv_luts[1]) & cv2.LUT(v, self.hsv_luts[2])
+        rgb_bits = cv2.LUT(b, self.rgb_luts[0]) & cv2.LUT(g, self.rgb_luts[1]) & cv2.LUT(r, self.rgb_luts[2])
+
+        # The leaf outline blends into the black background, so its pixels are skipped too
+        background = v <= BACKGROUND_MAX_VALUE
+        excluded = cv2.dilate(background.astype(np.uint8), self.kernel)
+        if self.healthy_luts is not None:
+            excluded |= cv2.LUT(h, self.healthy_luts[0]) & cv2.LUT(s, self.healthy_luts[1]) & cv2.LUT(v, self.healthy_luts[2])
+        bits[excluded > 0] = 0
+
+        leaf_pixels = int(background.size - np.count_nonzero(background))
+        present = int(np.bitwise_or.reduce(bits, axis=None)) if leaf_pixels else 0
+        if present == 0:
+            return None
+
+        lesions = np.zeros(bits.shape, dtype=bool)
+        candidates = []
+        for bit, name in enumerate(self.names):
+            if not present & (1 << bit):
+                continue
+            plane = ((bits >> bit) & 1).astype(np.uint8)
+            scored = self._component_scores(bit, plane, rgb_bits, area_scale)
+            if scored is None:
+                continue
+            labels, stats, keep, confidence, native_areas = scored
+            if not keep.any():
+                continue
+
+            kept = np.flatnonzero(keep) + 1
+            kept_lut = np.zeros(len(keep) + 1, dtype=bool)
+            kept_lut[kept] = True
+            lesions |= kept_lut[labels]
+            candidates.append((name, labels, kept, confidence[keep]))
+
+        if not candidates:
+            return None
+
+        # Score every lesion (connected component of all candidates) for each disease...
+        count, lesion_labels, lesion_stats, _ = cv2.connectedComponentsWithStats(
+            lesions.astype(np.uint8), connectivity=8
+        )
+        scores = np.zeros((len(candidates), count))
+        inside = lesion_labels[lesions]
+        for i, (_, labels, kept, kept_confidence) in enumerate(candidates):
+            # A candidate component lies inside exactly one lesion
+            owner = np.zeros(labels.max() + 1, dtype=np.int32)
+            owner[labels[lesions]] = inside
+            np.maximum.at(scores[i], owner[kept], kept_confidence)
+
+        # ...and give it to the best one only (argmax keeps the first, i.e. listed, disease on ties)
+        winner = scores[:, 1:].argmax(axis=0)
+        native_areas = lesion_stats[1:, cv2.CC_STAT_AREA] * area_scale
+        boxes = lesion_stats[1:, :4].tolist()
+        disease_info = []
+        for i, (name, _, _, _) in enumerate(candidates):
+            won = winner == i
+            if not won.any():
+                continue
+            disease_info.append({
+                'name': name,
+                # Area-weighted, so a few large typical lesions outrank specks
+                'confidence': float(np.average(scores[i, 1:][won], weights=native_areas[won])),
+                'pixels': int(native_areas[won].sum()),
+                'percentage': float(native_areas[won].sum() / area_scale / leaf_pixels * 100),
+                'lesions': int(won.sum())
+            })
+        disease_info.sort(key=lambda info: info['pixels'], reverse=True)
+
+        disease_mask = lesions.astype(np.uint8) * 255
+        black_mask = background.astype(np.uint8) * 255
+        draw_scale = 1.0
+        if full_resolution and scale < 1.0:
+            # Callers that draw on the leaf (visualization) need its own resolution
+            full_size = (width, height)
+            disease_mask = cv2.resize(disease_mask, full_size, interpolation=cv2.INTER_NEAREST)
+            black_mask = cv2.resize(black_mask, full_size, interpolation=cv2.INTER_NEAREST)
+            frame, draw_scale = leaf_img_bgr, scale
+        result_img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        for x, y, w, h in boxes:
+            x1, y1 = int(x / draw_scale), int(y / draw_scale)
+            x2, y2 = int((x + w) / draw_scale), int((y + h) / draw_scale)
+            cv2.rectangle(result_img, (x1, y1), (x2, y2), (0, 255, 0), 1)
+
+        total_disease_pixels = np.count_nonzero(lesions) * area_scale
+        return {
+            'result_img': result_img,
+            'disease_mask': disease_mask,
+            'distance_heatmap': np.zeros(disease_mask.shape, dtype=np.float32),
+            'total_leaf_pixels': int(leaf_pixels * area_scale),
+            'total_disease_pixels': int(total_disease_pixels),
+            'total_disease_percentage': float(np.count_nonzero(lesions) / leaf_pixels * 100),
+            'disease_info': disease_info,
+            'black_mask': black_mask
+        }
@@ -0,0 +1,388 @@
+"""
+Server Metrics
+Lightweight counters, gauges and histograms rendered in the Prometheus
+text exposition format for the /metrics endpoint.
+Recording is a lock-protected integer/float update, cheap enough for the hot path.
+Pre-forked workers share their registries through snapshot files, so any
+worker answering /metrics reports the whole server (MultiprocessMetrics).
+"""
+
+import os
+import sys
+import json
+import time
+import bisect
+import threading
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+# Latency buckets in seconds, spanning a fast static hit to a slow bulk request
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+METRICS_FLUSH_INTERVAL = 5.0    # Seconds between a pre-fork worker's metric snapshots
+
+# Fallback process start time where /proc is unavailable
+_IMPORTED_AT = time.time()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key, extra=None):
+    items = list(key) + (list(extra) if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in items) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, bool):
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing value, optionally split by labels"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self.lock:
+            return self.values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        return [(self.name, key, value) for key, value in items]
+
+
+class Gauge(Counter):
+    """
+    Value that can go up and down, or be computed on scrape by a callback
+    The callback returns a number, or a list of (labels dict, number) pairs
+    """
+
+    type_name = 'gauge'
+
+    def __init__(self, name, help_text, callback=None):
+        super().__init__(name, help_text)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def track(self, **labels):
+        """Context manager that increments on entry and decrements on exit"""
+        return _GaugeTracker(self, labels)
+
+    def samples(self):
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception:
+                return []
+            if isinstance(value, list):
+                return [(self.name, _label_key(labels), v) for labels, v in value]
+            return [(self.name, (), value)]
+        return super().samples()
+
+
+class _GaugeTracker:
+    def __init__(self, gauge, labels):
+        self.gauge = gauge
+        self.labels = labels
+
+    def __enter__(self):
+        self.gauge.inc(**self.labels)
+        return self
+
+    def __exit__(self, *exc):
+        self.gauge.dec(**self.labels)
+        return False
+
+
+class Histogram:
+    """Cumulative bucketed distribution with sum and count"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                # [per-bucket counts (+Inf last), sum, count]
+                entry = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self.values[key] = entry
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels):
+        """Context manager that observes the elapsed wall time in seconds"""
+        return _HistogramTimer(self, labels)
+
+    def snapshot(self, **labels):
+        """(bucket counts, sum, count) for one label set"""
+        with self.lock:
+            entry = self.values.get(_label_key(labels))
+            if entry is None:
+                return [0] * (len(self.buckets) + 1), 0.0, 0
+            return list(entry[0]), entry[1], entry[2]
+
+    def quantile(self, q, **labels):
+        """Approximate quantile (upper bucket bound) for one label set"""
+        counts, _, total = self.snapshot(**labels)
+        if total == 0:
+            return None
+        target = q * total
+        running = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            running += count
+            if running >= target:
+                return bound
+        return float('inf')
+
+    def samples(self):
+        with self.lock:
+            items = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in self.values.items()]
+
+        samples = []
+        for key, counts, total_sum, total_count in items:
+            running = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                running += count
+                samples.append((f"{self.name}_bucket", key, running, (('le', _format_value(float(bound))),)))
+            samples.append((f"{self.name}_sum", key, total_sum))
+            samples.append((f"{self.name}_count", key, total_count))
+        return samples
+
+
+class _HistogramTimer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together on /metrics"""
+
+    def __init__(self, namespace='ksm'):
+        self.namespace = namespace
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text):
+        return self._register(Counter(f"{self.namespace}_{name}", help_text))
+
+    def gauge(self, name, help_text, callback=None):
+        return self._register(Gauge(f"{self.namespace}_{name}", help_text, callback))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(f"{self.namespace}_{name}", help_text, buckets))
+
+    def render(self):
+        """Render all metrics in Prometheus text format (version 0.0.4)"""
+        return _render([
+            (metric['name'], metric['help'], metric['type'], metric['samples']) for metric in self.snapshot()
+        ])
+
+    def snapshot(self):
+        """Every metric's name, help, type and (name, labels, value, extra labels) samples"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return [{
+            'name': metric.name,
+            'help': metric.help,
+            'type': metric.type_name,
+            'samples': [(s[0], s[1], s[2], s[3] if len(s) > 3 else ()) for s in metric.samples()]
+        } for metric in metrics]
+
+
+def _render(metrics):
+    """Prometheus text for [(name, help, type, samples)]"""
+    lines = []
+    for metric_name, help_text, type_name, samples in metrics:
+        lines.append(f"# HELP {metric_name} {help_text}")
+        lines.append(f"# TYPE {metric_name} {type_name}")
+        for name, key, value, extra in samples:
+            lines.append(f"{name}{_format_labels(key, extra)} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _pairs(items):
+    """JSON lists of label pairs back to the tuple form used as sample keys"""
+    return tuple(tuple(item) for item in items)
+
+
+class MultiprocessMetrics:
+    """
+    One pre-fork worker's view of the metrics of all workers
+    Each worker writes its registry to directory every METRICS_FLUSH_INTERVAL (and
+    before answering a scrape). Counters and histograms are summed over every file,
+    including those of workers that have exited, so totals never go backwards when
+    a worker restarts. Gauges are reported per live worker with a worker label.
+    """
+
+    def __init__(self, directory, registry, worker):
+        self.directory = directory
+        self.registry = registry
+        self.worker = str(worker)
+        self.path = os.path.join(directory, f"worker-{os.getpid()}.json")
+
+    def flush(self):
+        """Write this worker's snapshot (atomically, so readers never see half a file)"""
+        data = {'pid': os.getpid(), 'worker': self.worker, 'metrics': self.registry.snapshot()}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def start(self, interval=METRICS_FLUSH_INTERVAL):
+        """Flush in a background thread for as long as the process lives"""
+        def loop():
+            while True:
+                try:
+                    self.flush()
+                except OSError as e:
+                    print(f"⚠️ Failed to write worker metrics: {e}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=loop, name="metrics-flush")
+        thread.daemon = True
+        thread.start()
+
+    def render(self):
+        """Prometheus text for all workers"""
+        self.flush()
+        snapshots = []
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename), encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return _render(merge_snapshots(snapshots))
+
+
+def merge_snapshots(snapshots):
+    """Combine worker snapshots: counters and histograms summed, gauges per live worker"""
+    merged = {}
+    for snapshot in snapshots:
+        alive = _pid_alive(snapshot['pid'])
+        worker = (('worker', snapshot['worker']),)
+        for metric in snapshot['metrics']:
+            entry = merged.setdefault(metric['name'], (metric['help'], metric['type'], {}))
+            samples = entry[2]
+            for name, key, value, extra in metric['samples']:
+                key, extra = _pairs(key), _pairs(extra)
+                if metric['type'] == 'gauge':
+                    if alive:
+                        samples[(name, key + worker, extra)] = value
+                else:
+                    sample_key = (name, key, extra)
+                    samples[sample_key] = samples.get(sample_key, 0) + value
+    return [
+        (name, help_text, type_name, [(n, key, value, extra) for (n, key, extra), value in samples.items()])
+        for name, (help_text, type_name, samples) in merged.items()
+    ]
+
+
+def process_rss_bytes():
+    """Resident set size of this process in bytes"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # Fallback is the peak RSS: KB on Linux, bytes on macOS
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def process_pss_bytes():
+    """
+    Proportional set size in bytes: shared pages are divided between the
+    processes mapping them, so pre-forked workers show their true cost
+    """
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return process_rss_bytes()
+
+
+def process_start_time():
+    """Unix time this process started (falls back to when this module was imported)"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Field 22 is the start time in clock ticks after boot; the command
+            # name in field 2 may contain spaces, so split after its closing ')'
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return _IMPORTED_AT
@@ -0,0 +1,207 @@
+"""
+Pre-fork Server
+The parent loads GrapeLeafPipeline once, binds the listening socket and forks
+N workers that accept on it. Model weights and the PatchCore memory bank stay
+in copy-on-write pages shared by all workers. The parent only supervises:
+it restarts workers that die and requeues the jobs they were running.
+Workers share metric snapshots through a temporary directory, so a scrape of
+any worker reports the whole server. Identical-request coalescing
+(single-flight) only spans the requests of one worker.
+"""
+
+import os
+import gc
+import sys
+import time
+import shutil
+import signal
+import tempfile
+import threading
+
+from job_queue import MAX_JOB_ATTEMPTS
+from resource_config import ThreadBudget
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+SUPERVISE_INTERVAL = 0.5    # Seconds between child status polls
+MIN_WORKER_UPTIME = 5.0     # Workers dying faster than this are restarted with backoff
+MAX_RESTART_BACKOFF = 30.0
+SHUTDOWN_TIMEOUT = 10.0
+
+
+def fork_supported():
+    """True on platforms with os.fork (not Windows)"""
+    return hasattr(os, 'fork')
+
+
+class PreforkServer:
+    """Supervisor for pre-forked DiseaseDetectionAPI workers"""
+
+    def __init__(self, api_server, workers, thread_budget=None):
+        self.api_server = api_server
+        self.workers = workers
+        self.thread_budget = thread_budget or ThreadBudget(workers=workers)
+        self.children = {}        # pid -> slot
+        self.started_at = {}      # slot -> start time
+        self.backoff = {}         # slot -> restart delay
+        self.stopping = False
+        self.metrics_dir = None
+
+    def run(self):
+        """Bind, fork the workers and supervise them until signalled"""
+        torch = sys.modules.get('torch')
+        if torch is not None and torch.cuda.is_available() and torch.cuda.is_initialized():
+            # A CUDA context cannot be shared across fork
+            print("⚠️ CUDA is initialized in the parent; pre-fork mode is CPU-only. Running a single process.")
+            self.api_server.start_server()
+            return
+
+        api = self.api_server
+        try:
+            api.open_socket()
+        except Exception as e:
+            print(f"❌ Failed to start server: {e}")
+            api.cleanup()
+            return
+
+        api.print_banner()
+        api.recover_jobs()
+        self.metrics_dir = tempfile.mkdtemp(prefix='ksm-metrics-')
+        
+        # No warmup here: it starts torch/OpenMP pools and helper threads, and
+        # threads and their locks do not survive fork. Each worker warms up itself.
+        if threading.active_count() > 1:
+            print(f"⚠️ {threading.active_count() - 1} thread(s) running before fork; workers may inherit held locks")
+        print(f"🧬 Pre-fork mode: {self.workers} workers x {self.thread_budget.threads_per_worker} threads")
+
+        # Move everything allocated so far (models, memory bank) out of the
+        # collector's reach, so GC passes in workers don't touch shared pages
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        for slot in range(self.workers):
+            self.spawn(slot)
+
+        try:
+            self.supervise()
+        finally:
+            self.shutdown()
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
+
+    def spawn(self, slot):
+        """Fork one worker for the given slot"""
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(slot)
+
+        self.children[pid] = slot
+        self.started_at[slot] = time.time()
+        print(f"👷 Worker {slot} started (pid {pid})")
+
+    def _run_worker(self, slot):
+        """Child process body; never returns"""
+        exit_code = 0
+        try:
+            # Ctrl-C reaches the whole process group; let the parent coordinate
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            # Thread pools are not inherited reliably across fork; re-apply the budget
+            self.thread_budget.apply_runtime()
+            self.api_server.enable_worker_metrics(self.metrics_dir, slot)
+            
+            # Full warmup after the fork, so thread pools and allocator growth belong
+            # to this worker; /readyz answers 503 until it finishes
+            self.api_server.ready = False
+            self.api_server.serve_forever(recover_jobs=False)
+        except BaseException as e:
+            print(f"❌ Worker {slot} crashed: {e}")
+            exit_code = 1
+        finally:
+            sys.stdout.flush()
+            os._exit(exit_code)
+
+    def supervise(self):
+        """Reap dead workers and restart them until asked to stop"""
+        while not self.stopping:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+
+            if pid == 0:
+                time.sleep(SUPERVISE_INTERVAL)
+                continue
+
+            slot = self.children.pop(pid, None)
+            if slot is None:
+                continue
+
+            self._requeue_jobs(pid)
+            print(f"⚠️ Worker {slot} (pid {pid}) exited with status {status}")
+
+            if self.stopping:
+                break
+
+            # Back off if the worker keeps dying right after start
+            uptime = time.time() - self.started_at.get(slot, 0)
+            if uptime < MIN_WORKER_UPTIME:
+                delay = min(MAX_RESTART_BACKOFF, self.backoff.get(slot, 0.5) * 2)
+                self.backoff[slot] = delay
+                print(f"   Restarting in {delay:.1f}s")
+                time.sleep(delay)
+            else:
+                self.backoff[slot] = 0.5
+
+            if not self.stopping:
+                self.spawn(slot)
+
+    def _requeue_jobs(self, pid):
+        try:
+            requeued, failed = self.api_server.job_queue.requeue_worker(pid)
+            if requeued:
+                print(f"♻️ Requeued {requeued} job(s) from pid {pid}")
+            if failed:
+                print(f"⚠️ Failed {failed} job(s) from pid {pid} that were interrupted {MAX_JOB_ATTEMPTS} times")
+        except Exception as e:
+            print(f"⚠️ Failed to requeue jobs of pid {pid}: {e}")
+
+    def shutdown(self):
+        """Terminate all workers and release the parent's resources"""
+        print("\n⏹️ Shutting down workers...")
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.time() + SHUTDOWN_TIMEOUT
+        while self.children and time.time() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                time.sleep(0.1)
+                continue
+            self.children.pop(pid, None)
+            self._requeue_jobs(pid)
+
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self._requeue_jobs(pid)
+        self.children.clear()
+
+        if self.metrics_dir:
+            shutil.rmtree(self.metrics_dir, ignore_errors=True)
+        self.api_server.cleanup()
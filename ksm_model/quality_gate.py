@@ -0,0 +1,176 @@
+"""
+Image Quality Gate
+Millisecond pre-check in front of the leaf extractor. A downsampled frame is
+tested for exposure (luma histogram) and vegetation (share of green pixels),
+and a larger one for blur, so blurry, dark, blown-out or non-leaf photos are
+rejected with a reason before YOLO, SAM and PatchCore run.
+
+Blur is the variance of the Laplacian per tile of a SHARPNESS_FRAME_SIZE frame,
+taken at a high percentile over the tiles: a sharp leaf in front of a soft
+background passes, and heavy downscaling no longer hides real blur.
+"""
+
+import cv2
+import numpy as np
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+GATE_FRAME_SIZE = 256           # Longest side of the frame the exposure and vegetation checks run on
+SHARPNESS_FRAME_SIZE = 1024     # Longest side of the frame the blur check runs on
+SHARPNESS_GRID = 8              # Blur is measured on a grid of this many tiles per side...
+SHARPNESS_PERCENTILE = 90       # ...and the sharpest tiles decide (the leaf, not the background)
+
+DEFAULT_GATE_THRESHOLDS = {
+    'min_sharpness': 25.0,      # Laplacian variance of the sharp tiles at SHARPNESS_FRAME_SIZE
+    'min_brightness': 35.0,     # Mean luma (0-255)
+    'max_brightness': 225.0,
+    'max_clipped': 0.5,         # Share of pixels crushed to black or blown to white
+    'min_green_ratio': 0.05     # Share of green/yellow-green vegetation pixels
+}
+
+# Histogram ends counted as clipped
+DARK_CLIP = 8
+BRIGHT_CLIP = 247
+
+# OpenCV HSV range for leaf tissue, yellowing included (hue 0-180)
+GREEN_HUE = (25, 95)
+GREEN_MIN_SATURATION = 40
+GREEN_MIN_VALUE = 40
+
+
+class ImageRejected(Exception):
+    """The image failed the quality gate; carries a machine-readable reason"""
+
+    def __init__(self, verdict):
+        super().__init__(verdict['message'])
+        self.verdict = verdict
+
+    @property
+    def reason(self):
+        return self.verdict['reason']
+
+
+def parse_gate_thresholds(spec):
+    """
+    --quality-gate value -> thresholds dict, or None when the gate is off
+    'on' keeps the defaults; 'min_sharpness=30,min_green_ratio=0.02' overrides some
+    """
+    spec = str(spec).strip()
+    if spec.lower() == 'off':
+        return None
+    thresholds = dict(DEFAULT_GATE_THRESHOLDS)
+    if spec.lower() == 'on':
+        return thresholds
+    for pair in filter(None, (p.strip() for p in spec.split(','))):
+        name, _, value = pair.partition('=')
+        name = name.strip()
+        if name not in thresholds:
+            raise ValueError(f"Unknown quality gate threshold '{name}' (choose from {', '.join(thresholds)})")
+        thresholds[name] = float(value)
+    return thresholds
+
+
+def fit_frame(img, size):
+    """img scaled down so its longest side is at most size"""
+    scale = size / float(max(img.shape[:2]))
+    if scale < 1.0:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return img
+
+
+def load_gate_frame(image_path):
+    """
+    Decode a BGR frame of at most SHARPNESS_FRAME_SIZE cheaply (JPEG DCT scaling),
+    or None if unreadable
+    """
+    img = None
+    for flag in (cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_COLOR_2):
+        img = cv2.imread(image_path, flag)
+        if img is not None and max(img.shape[:2]) >= SHARPNESS_FRAME_SIZE:
+            break
+        img = None
+    if img is None:
+        # Small source or a format without reduced decoding
+        img = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    return fit_frame(img, SHARPNESS_FRAME_SIZE)
+
+
+def measure_sharpness(gray):
+    """Laplacian variance of the sharpest tiles (SHARPNESS_PERCENTILE over a SHARPNESS_GRID grid)"""
+    laplacian = cv2.Laplacian(gray, cv2.CV_32F)
+    height, width = laplacian.shape
+    rows = np.linspace(0, height, SHARPNESS_GRID + 1, dtype=int)
+    cols = np.linspace(0, width, SHARPNESS_GRID + 1, dtype=int)
+    variances = [
+        float(laplacian[y1:y2, x1:x2].var())
+        for y1, y2 in zip(rows, rows[1:]) for x1, x2 in zip(cols, cols[1:])
+        if y2 > y1 and x2 > x1
+    ]
+    return float(np.percentile(variances, SHARPNESS_PERCENTILE))
+
+
+def measure_quality(frame):
+    """Blur, exposure and vegetation measurements of a BGR frame (blur at its size, the rest at GATE_FRAME_SIZE)"""
+    sharpness = measure_sharpness(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    frame = fit_frame(frame, GATE_FRAME_SIZE)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel() / gray.size
+
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    green = cv2.inRange(
+        hsv,
+        (GREEN_HUE[0], GREEN_MIN_SATURATION, GREEN_MIN_VALUE),
+        (GREEN_HUE[1], 255, 255)
+    )
+
+    return {
+        'sharpness': sharpness,
+        'brightness': float(cv2.mean(gray)[0]),
+        'dark_clipped': float(hist[:DARK_CLIP + 1].sum()),
+        'bright_clipped': float(hist[BRIGHT_CLIP:].sum()),
+        'green_ratio': cv2.countNonZero(green) / float(green.size)
+    }
+
+
+def judge_quality(measurements, thresholds):
+    """(reason, message) for the first failed check, or (None, None)"""
+    m, t = measurements, thresholds
+    if m['brightness'] < t['min_brightness'] or m['dark_clipped'] > t['max_clipped']:
+        return 'underexposed', "Image is too dark to analyse; retake it in better light"
+    if m['brightness'] > t['max_brightness'] or m['bright_clipped'] > t['max_clipped']:
+        return 'overexposed', "Image is overexposed; avoid direct sunlight or flash glare"
+    if m['sharpness'] < t['min_sharpness']:
+        return 'blurry', "Image is too blurry; hold the camera steady and focus on the leaf"
+    if m['green_ratio'] < t['min_green_ratio']:
+        return 'no_vegetation', "Image does not appear to contain leaves"
+    return None, None
+
+
+class QualityGate:
+    """Checks one image file against the thresholds"""
+
+    def __init__(self, thresholds=None):
+        self.thresholds = {**DEFAULT_GATE_THRESHOLDS, **(thresholds or {})}
+
+    def check(self, image_path):
+        """Return a verdict dict: passed, reason, message and the measurements"""
+        frame = load_gate_frame(image_path)
+        if frame is None:
+            return {
+                'passed': False,
+                'reason': 'unreadable',
+                'message': "Image could not be decoded",
+                'measurements': {}
+            }
+
+        measurements = measure_quality(frame)
+        reason, message = judge_quality(measurements, self.thresholds)
+        return {
+            'passed': reason is None,
+            'reason': reason,
+            'message': message,
+            'measurements': {name: round(value, 4) for name, value in measurements.items()}
+        }
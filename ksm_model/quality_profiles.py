@@ -0,0 +1,114 @@
+"""
+Quality Profiles
+Named speed/quality trade-offs selectable per request (?profile=fast) or as the
+server default. A profile bundles the pipeline inference settings (SAM variant,
+leaf detection resolution, thresholds and tiling, heatmap on/off and resolution,
+k-NN backend, disease backend) with default artifact options.
+"""
+
+from artifact_encoder import DEFAULT_ARTIFACT_OPTIONS
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+QUALITY_PROFILES = {
+    # Interactive mobile requests: small detection input, no heatmap, leaf crops only
+    'fast': {
+        'inference': {
+            'sam_model': 'mobile_sam.pt',
+            'imgsz': 480,
+            'conf': 0.35,
+            'iou': 0.4,
+            'heatmap': False,
+            'heatmap_size': 14,
+            'knn_backend': 'torch',
+            'disease_backend': 'rules'     # Lookup-table lesion rules instead of disease YOLO
+        },
+        'artifacts': {'format': 'webp', 'quality': 70, 'max_dim': 512, 'artifacts': 'leaf', 'anomaly_map': 'off'}
+    },
+    # Previous fixed behaviour
+    'balanced': {
+        'inference': {
+            'sam_model': 'mobile_sam.pt',
+            'imgsz': 640,
+            'conf': 0.25,
+            'iou': 0.4,
+            'heatmap': True,
+            'heatmap_size': 28,
+            'knn_backend': None,    # torch with a snapshot, sklearn with a checkpoint
+            'tiling': 'auto'        # Tiled leaf YOLO for large frames with small leaves
+        },
+        'artifacts': dict(DEFAULT_ARTIFACT_OPTIONS)
+    },
+    # Offline re-scoring: SAM 2.1-L, higher resolution, finer heatmaps
+    'accurate': {
+        'inference': {
+            'sam_model': 'sam2.1_l.pt',
+            'imgsz': 1024,
+            'conf': 0.2,
+            'iou': 0.5,
+            'heatmap': True,
+            'heatmap_size': 56,
+            'knn_backend': 'sklearn',
+            'tiling': 'auto',
+            'tile_empty_frames': True   # Offline: worth tiling photos where the first pass found nothing
+        },
+        'artifacts': {'format': 'jpeg', 'quality': 95, 'max_dim': None, 'artifacts': 'all', 'anomaly_map': 'off'}
+    }
+}
+
+DEFAULT_PROFILE = 'balanced'
+RESIDENT_PROFILES = ('fast', 'balanced')   # Both use MobileSAM, so fast costs no extra memory
+
+
+def parse_profile_list(value):
+    """'fast,balanced' -> ['fast', 'balanced']; raises ValueError on unknown names"""
+    names = []
+    for name in str(value).split(','):
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in QUALITY_PROFILES:
+            raise ValueError(f"Unknown profile '{name}' (choose from {', '.join(QUALITY_PROFILES)})")
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def resolve_profile(params, default, resident):
+    """
+    Pick the profile named in query parameters (parse_qs format) or the default
+    Raises ValueError with a client-facing message on unknown or unloaded profiles
+    """
+    value = params.get('profile')
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if not value:
+        return default
+
+    name = str(value).strip().lower()
+    if name not in QUALITY_PROFILES:
+        raise ValueError(f"Unknown profile '{name}' (choose from {', '.join(QUALITY_PROFILES)})")
+    if name not in resident:
+        raise ValueError(f"Profile '{name}' is not loaded on this server (available: {', '.join(resident)})")
+    return name
+
+
+def required_sam_models(names):
+    """SAM checkpoints needed to keep the given profiles resident, in first-use order"""
+    models = []
+    for name in names:
+        sam_model = QUALITY_PROFILES[name]['inference']['sam_model']
+        if sam_model not in models:
+            models.append(sam_model)
+    return models
+
+
+def required_knn_backends(names):
+    """k-NN backends the given profiles query (None = the model's default)"""
+    backends = []
+    for name in names:
+        backend = QUALITY_PROFILES[name]['inference']['knn_backend']
+        if backend not in backends:
+            backends.append(backend)
+    return backends
@@ -0,0 +1,156 @@
+"""
+Model Replica Pool
+N independent GrapeLeafPipeline instances (LeafExtractor, PatchCoreInference,
+DiseaseSegmenter) that requests check out exclusively, so concurrent requests
+never share mutable model state (forward hooks, feature buffers, predictors).
+
+Checkouts wait in priority lanes: interactive requests are served before bulk
+work, but a waiting bulk checkout gets every INTERACTIVE_SHARE+1-th replica and
+jumps the queue once it has waited BULK_AGING_SECONDS, so it is never starved.
+"""
+
+import sys
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+LANES = ('interactive', 'bulk')
+INTERACTIVE_SHARE = 4        # Interactive checkouts granted in a row while bulk work waits
+BULK_AGING_SECONDS = 5.0     # A bulk checkout waiting this long is served next
+MIN_RECHECK_SECONDS = 0.05   # Shortest wait between aging re-checks (aging_seconds may be 0)
+
+
+def default_devices():
+    """One entry per visible GPU, or ['cpu'] when CUDA is unavailable"""
+    torch = sys.modules.get('torch')
+    if torch is not None and torch.cuda.is_available():
+        return [f"cuda:{i}" for i in range(torch.cuda.device_count())]
+    return ['cpu']
+
+
+class _Waiter:
+    """A checkout waiting in a lane"""
+
+    def __init__(self, lane):
+        self.lane = lane
+        self.since = time.perf_counter()
+
+
+class ReplicaPool:
+    """Fixed-size pool of pipeline replicas with blocking, lane-prioritised checkout"""
+
+    def __init__(self, factory, size=1, devices=None,
+                 interactive_share=INTERACTIVE_SHARE, aging_seconds=BULK_AGING_SECONDS):
+        """
+        factory(index, device) builds one replica; replicas are assigned to
+        devices round-robin, e.g. 4 replicas over ['cuda:0', 'cuda:1']
+        """
+        self.size = max(1, size)
+        self.devices = devices or default_devices()
+        self.replicas = []
+        self.available = []
+        self.busy = 0
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+        # FIFO of waiting checkouts per lane
+        self.waiters = {lane: deque() for lane in LANES}
+        self.interactive_share = interactive_share
+        self.aging_seconds = aging_seconds
+        self.interactive_streak = 0
+
+        # Optional callable(seconds, lane=...) receiving the time spent waiting for a replica
+        self.wait_observer = None
+
+        for index in range(self.size):
+            device = self.devices[index % len(self.devices)]
+            print(f"🧩 Loading replica {index + 1}/{self.size} on {device}")
+            replica = factory(index, device)
+            self.replicas.append(replica)
+            self.available.append(replica)
+
+    @property
+    def primary(self):
+        """First replica, for read-only access to shared model properties"""
+        return self.replicas[0]
+
+    def _next_waiter(self):
+        """Waiter to serve next (lock held): interactive first, bulk by share or age"""
+        interactive = self.waiters['interactive']
+        bulk = self.waiters['bulk']
+        if not bulk:
+            return interactive[0] if interactive else None
+        if not interactive:
+            return bulk[0]
+        if self.interactive_streak >= self.interactive_share:
+            return bulk[0]
+        if time.perf_counter() - bulk[0].since >= self.aging_seconds:
+            return bulk[0]
+        return interactive[0]
+
+    @contextmanager
+    def checkout(self, timeout=None, lane='interactive'):
+        """Borrow a replica for the duration of the with-block"""
+        if lane not in self.waiters:
+            raise ValueError(f"Unknown lane '{lane}'")
+        waiter = _Waiter(lane)
+        expires = None if timeout is None else waiter.since + timeout
+
+        with self.changed:
+            self.waiters[lane].append(waiter)
+            try:
+                while not (self.available and self._next_waiter() is waiter):
+                    remaining = None if expires is None else expires - time.perf_counter()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError("No model replica became available in time")
+                    # Aging is time-based, so re-check periodically even without a release
+                    recheck = max(self.aging_seconds, MIN_RECHECK_SECONDS)
+                    self.changed.wait(min(remaining, recheck) if remaining is not None else recheck)
+            except BaseException:
+                # Timed out or interrupted: let the next waiter in line check again
+                self.changed.notify_all()
+                raise
+            finally:
+                # A waiter left at the head of its lane would stall that lane for good
+                self.waiters[lane].remove(waiter)
+
+            replica = self.available.pop()
+            self.busy += 1
+            # Count interactive grants that bulk work was waiting behind
+            if lane == 'interactive' and self.waiters['bulk']:
+                self.interactive_streak += 1
+            else:
+                self.interactive_streak = 0
+            if self.available:
+                self.changed.notify_all()
+
+        if self.wait_observer is not None:
+            self.wait_observer(time.perf_counter() - waiter.since, lane=lane)
+
+        try:
+            yield replica
+        finally:
+            with self.changed:
+                self.busy -= 1
+                self.available.append(replica)
+                self.changed.notify_all()
+
+    def busy_count(self):
+        """Replicas currently checked out"""
+        with self.lock:
+            return self.busy
+
+    def waiting_counts(self):
+        """Checkouts waiting per lane, as labelled gauge samples"""
+        with self.lock:
+            return [({'lane': lane}, len(waiters)) for lane, waiters in self.waiters.items()]
+
+    def __iter__(self):
+        return iter(self.replicas)
+
+    def __len__(self):
+        return len(self.replicas)
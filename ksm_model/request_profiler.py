@@ -0,0 +1,174 @@
+"""
+Request Profiler
+Captures a cProfile profile and a torch profiler Chrome trace for one
+/api/process request, on demand (?debug_profile=1 with the admin token) or for
+a sampled fraction of normal traffic. Files are written to the artifact store
+under unguessable names; admin captures return their URLs in the response.
+"""
+
+import os
+import io
+import hmac
+import time
+import pstats
+import random
+import marshal
+import secrets
+import cProfile
+import tempfile
+import threading
+from collections import deque
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+PROFILE_PARAM = 'debug_profile'
+ADMIN_TOKEN_HEADER = 'x-admin-token'
+ADMIN_TOKEN_ENV = 'KSM_ADMIN_TOKEN'     # Unset = on-demand profiling disabled
+
+TOP_FUNCTIONS = 15          # Functions by cumulative time listed in the response
+TORCH_TRACE_SCOPE = ('The torch profiler is process-wide: the trace also contains ops of requests '
+                     'that ran concurrently with this one')
+RECENT_CAPTURES = 50        # Sampled captures remembered for /api/debug/profiles
+
+
+def admin_token():
+    """Shared secret for admin-only switches, or None when not configured"""
+    return os.environ.get(ADMIN_TOKEN_ENV) or None
+
+
+def is_admin(headers):
+    """True if the request carries the configured admin token"""
+    token = admin_token()
+    supplied = (headers or {}).get(ADMIN_TOKEN_HEADER)
+    # compare_digest only accepts ASCII str, so compare the UTF-8 bytes
+    return token is not None and supplied is not None and hmac.compare_digest(supplied.encode(), token.encode())
+
+
+def top_functions(profiler, limit=TOP_FUNCTIONS):
+    """[{function, calls, total_s, cumulative_s}] sorted by cumulative time"""
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, name), (_, calls, total, cumulative, _) in stats.stats.items():
+        rows.append({
+            'function': f"{os.path.basename(filename)}:{line}({name})",
+            'calls': calls,
+            'total_s': round(total, 4),
+            'cumulative_s': round(cumulative, 4)
+        })
+    rows.sort(key=lambda row: row['cumulative_s'], reverse=True)
+    return rows[:limit]
+
+
+class _Capture:
+    """Profilers running for one request"""
+
+    def __init__(self, trigger, torch_profiler):
+        self.trigger = trigger
+        self.torch_profiler = torch_profiler
+        self.cprofile = cProfile.Profile()
+        self.started = time.perf_counter()
+
+
+class RequestProfiler:
+    """Starts, stops and stores per-request profiles"""
+
+    def __init__(self, store, sample_rate=0.0):
+        self.store = store
+        self.sample_rate = sample_rate
+        # The torch profiler is process-global and Python 3.12 allows one cProfile at
+        # a time, so requests are profiled one after another
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=RECENT_CAPTURES)
+
+    def trigger(self, headers, params):
+        """
+        'admin', 'sampled' or None for a request
+        Raises PermissionError when ?debug_profile= is sent without a valid admin token
+        """
+        requested = params.get(PROFILE_PARAM, [''])[0].lower() in ('1', 'true', 'yes')
+        if requested:
+            if not is_admin(headers):
+                raise PermissionError(f"{PROFILE_PARAM} requires a valid X-Admin-Token")
+            return 'admin'
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sampled'
+        return None
+
+    def start(self, trigger):
+        """
+        Begin profiling the calling thread and torch ops
+        Admin captures wait for a running capture to finish; sampled ones are skipped (None)
+        """
+        if not self.lock.acquire(blocking=(trigger == 'admin')):
+            return None
+        try:
+            capture = _Capture(trigger, self._start_torch())
+            capture.cprofile.enable()
+        except Exception:
+            self.lock.release()
+            raise
+        return capture
+
+    def _start_torch(self):
+        """A running torch profiler, or None when torch is unavailable"""
+        try:
+            import torch
+            from torch.profiler import profile, ProfilerActivity
+        except ImportError:
+            return None
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        profiler = profile(activities=activities, record_shapes=True)
+        profiler.__enter__()
+        return profiler
+
+    def stop(self, capture, base_url):
+        """
+        Stop profiling and store the files
+        Returns the capture description, including the seconds spent exporting them
+        """
+        try:
+            capture.cprofile.disable()
+            seconds = time.perf_counter() - capture.started
+            export_start = time.perf_counter()
+            key = secrets.token_hex(16)
+
+            # Same format as cProfile's dump_stats: load with pstats or snakeviz
+            stats = pstats.Stats(capture.cprofile, stream=io.StringIO())
+            files = {'cprofile': self._put('cprofile', key, '.prof', marshal.dumps(stats.stats), base_url)}
+
+            if capture.torch_profiler is not None:
+                capture.torch_profiler.__exit__(None, None, None)
+                # The torch profiler only exports to a path
+                with tempfile.TemporaryDirectory() as tmp:
+                    trace_path = os.path.join(tmp, 'trace.json')
+                    capture.torch_profiler.export_chrome_trace(trace_path)
+                    with open(trace_path, 'rb') as f:
+                        files['torch_trace'] = self._put('trace', key, '.json', f.read(), base_url)
+        finally:
+            self.lock.release()
+
+        description = {
+            'trigger': capture.trigger,
+            'seconds': round(seconds, 4),
+            'files': files,
+            'top': top_functions(capture.cprofile),
+            'export_seconds': round(time.perf_counter() - export_start, 4),
+            'timestamp': time.time()
+        }
+        if 'torch_trace' in files:
+            description['torch_trace_scope'] = TORCH_TRACE_SCOPE
+        if capture.trigger == 'sampled':
+            self.recent.append({name: description[name] for name in ('seconds', 'files', 'timestamp')})
+        return description
+
+    def _put(self, kind, key, ext, data, base_url):
+        name = self.store.name_for(f"profile-{kind}", key, ext)
+        self.store.put(name, data)
+        return f"{base_url}/static/{name}"
+
+    def recent_captures(self):
+        """Most recent sampled captures, newest first"""
+        return list(reversed(self.recent))
@@ -0,0 +1,140 @@
+"""
+Resource Configuration
+Single place that decides and enforces CPU thread budgets for every layer
+that would otherwise assume it owns the machine: torch intra/inter-op pools,
+OpenCV, BLAS/OpenMP (numpy, sklearn) and sklearn/joblib k-NN queries.
+Budgets are derived from the worker and replica counts.
+"""
+
+import os
+import sys
+import json
+import importlib.util
+
+import cv2
+
+# Environment variables read by BLAS/OpenMP runtimes when they initialise
+THREAD_ENV_VARS = (
+    'OMP_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'BLIS_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+    'NUMEXPR_NUM_THREADS'
+)
+
+
+def available_cores():
+    """CPU cores this process may run on (respects affinity/cgroup pinning)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+def threadpoolctl_available():
+    """True if threadpoolctl can limit BLAS/OpenMP pools that are already running"""
+    return importlib.util.find_spec('threadpoolctl') is not None
+
+
+def load_config_file(path):
+    """Load a JSON config file whose keys mirror the CLI flags (dashes or underscores)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"Config file {path} must contain a JSON object")
+    return {key.replace('-', '_'): value for key, value in config.items()}
+
+
+class ThreadBudget:
+    """Thread counts for one worker process and each replica inside it"""
+
+    def __init__(self, workers=1, replicas=1, threads_per_worker=None, threads_per_replica=None,
+                 torch_threads=None, torch_interop_threads=None, opencv_threads=None,
+                 blas_threads=None, knn_jobs=None, cores=None):
+        self.cores = cores or available_cores()
+        self.workers = max(1, workers)
+        self.replicas = max(1, replicas)
+
+        self.threads_per_worker = threads_per_worker or max(1, self.cores // self.workers)
+        self.threads_per_replica = threads_per_replica or max(1, self.threads_per_worker // self.replicas)
+
+        # Every running replica gets its own torch/BLAS team of this size,
+        # so replicas x team size stays within the worker's share of cores
+        self.torch_threads = torch_threads or self.threads_per_replica
+        self.torch_interop_threads = torch_interop_threads or 1
+        self.opencv_threads = opencv_threads or self.threads_per_replica
+        self.blas_threads = blas_threads or self.threads_per_replica
+
+        # The PatchCore memory bank is small; a joblib pool per query costs more than it saves
+        self.knn_jobs = knn_jobs or 1
+
+        # Whether the BLAS/OpenMP limit reached the loaded runtimes (None = not applied yet)
+        self.blas_limited = None
+
+    def as_dict(self):
+        return {
+            'cores': self.cores,
+            'workers': self.workers,
+            'replicas_per_worker': self.replicas,
+            'threads_per_worker': self.threads_per_worker,
+            'threads_per_replica': self.threads_per_replica,
+            'torch_threads': self.torch_threads,
+            'torch_interop_threads': self.torch_interop_threads,
+            'opencv_threads': self.opencv_threads,
+            'blas_threads': self.blas_threads,
+            'knn_jobs': self.knn_jobs
+        }
+
+    def oversubscription(self):
+        """Worst-case busy threads per core when every replica in every worker runs"""
+        busy = self.workers * self.replicas * max(self.torch_threads, self.opencv_threads, self.blas_threads)
+        return busy / float(self.cores)
+
+    def apply_environment(self):
+        """
+        Export BLAS/OpenMP limits; only effective for libraries loaded afterwards,
+        so call this before importing torch/numpy where possible
+        """
+        for name in THREAD_ENV_VARS:
+            os.environ[name] = str(self.blas_threads)
+        # numpy initialises its BLAS on import; after that only threadpoolctl can change it
+        if 'numpy' not in sys.modules:
+            self.blas_limited = True
+        elif not threadpoolctl_available():
+            self.blas_limited = False
+
+    def apply_runtime(self):
+        """Enforce the budget on libraries that are already loaded"""
+        torch = sys.modules.get('torch')
+        if torch is not None:
+            torch.set_num_threads(self.torch_threads)
+            try:
+                torch.set_num_interop_threads(self.torch_interop_threads)
+            except RuntimeError:
+                # Only settable before the inter-op pool starts; keep the existing size
+                pass
+
+        # ultralytics calls cv2.setNumThreads(0) on import, so this must run after it
+        cv2.setNumThreads(self.opencv_threads)
+
+        try:
+            from threadpoolctl import threadpool_limits
+            self._blas_limiter = threadpool_limits(limits=self.blas_threads)
+            self.blas_limited = True
+        except ImportError:
+            if 'numpy' in sys.modules and self.blas_limited is None:
+                self.blas_limited = False
+                print(f"⚠️ BLAS/OpenMP thread limit not applied: numpy was loaded before "
+                      f"{THREAD_ENV_VARS[0]} was set and threadpoolctl is not installed")
+
+    def report(self):
+        """Print the effective budget at startup"""
+        print("🧮 Thread budget:")
+        for key, value in self.as_dict().items():
+            print(f"   {key:<24}{value}")
+        if self.blas_limited is False:
+            print(f"⚠️ blas_threads={self.blas_threads} has no effect: numpy was loaded before the "
+                  f"environment was set and threadpoolctl is not installed (pip install threadpoolctl)")
+        ratio = self.oversubscription()
+        if ratio > 1.0:
+            print(f"⚠️ Worst case {ratio:.1f} busy threads per core; consider fewer replicas or threads")
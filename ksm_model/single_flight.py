@@ -0,0 +1,86 @@
+"""
+Single-Flight Request Coalescing
+Concurrent callers asking for the same key share one execution: the first
+caller (the leader) runs the work, callers arriving while it runs wait for it
+and receive the same result or exception. A key is released as soon as its
+work finishes, so only in-flight work is shared; nothing is cached.
+"""
+
+import copy
+import hashlib
+import threading
+
+# Bytes read at a time when hashing a downloaded image
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    """SHA-1 of a file's contents, used to coalesce the same image under different URLs"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _Call:
+    """One in-flight execution and the callers attached to it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """De-duplicates concurrent work by key"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, work, timeout=None, retry=None):
+        """
+        Run work() once for all concurrent callers with the same key
+        Returns (result, shared); shared is True for callers that attached to another
+        caller's execution. When results were shared every caller gets its own copy.
+        timeout bounds how long an attached caller waits (TimeoutError).
+        retry(error) returning True makes an attached caller run the work itself
+        instead of re-raising the leader's error (e.g. the leader's client went away).
+        """
+        while True:
+            with self.lock:
+                call = self.calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self.calls[key] = _Call()
+                else:
+                    call.followers += 1
+
+            if leader:
+                try:
+                    call.result = work()
+                except BaseException as e:
+                    call.error = e
+                    raise
+                finally:
+                    # No caller can attach after this, so call.followers is final
+                    with self.lock:
+                        del self.calls[key]
+                    call.done.set()
+                # Followers copy the stored result; the leader's copy is free to mutate
+                return (copy.deepcopy(call.result) if call.followers else call.result), False
+
+            if not call.done.wait(timeout):
+                raise TimeoutError("Timed out waiting for an identical request in flight")
+            if call.error is not None:
+                if retry is not None and retry(call.error):
+                    continue
+                raise call.error
+            return copy.deepcopy(call.result), True
+
+    def in_flight(self):
+        """Keys currently being computed"""
+        with self.lock:
+            return len(self.calls)
@@ -0,0 +1,76 @@
+"""
+Static File Ranges
+Range and conditional request (If-None-Match / If-Modified-Since) handling for
+/static/. Single byte ranges are answered with 206; requests with several
+ranges get the whole file, or 416 when none of them can be satisfied.
+"""
+
+from email.utils import parsedate_to_datetime
+
+
+def parse_byte_range(range_header, file_size):
+    """
+    Parse a single-range "bytes=start-end" header
+    Returns (start, end) inclusive, None if the header should be ignored,
+    or raises ValueError if the range cannot be satisfied
+    """
+    if not range_header or not range_header.startswith('bytes='):
+        return None
+    
+    spec = range_header[len('bytes='):].strip()
+    if ',' in spec:
+        # Multipart ranges are not supported; serve the full file instead,
+        # unless none of the ranges could be satisfied
+        for part in spec.split(','):
+            try:
+                parse_byte_range('bytes=' + part.strip(), file_size)
+                return None
+            except ValueError:
+                continue
+        raise ValueError("Range not satisfiable")
+    
+    start_text, sep, end_text = spec.partition('-')
+    if not sep:
+        return None
+    
+    try:
+        if start_text == '':
+            # Suffix range: last N bytes
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError("Empty suffix range")
+            start = max(0, file_size - length)
+            end = file_size - 1
+        else:
+            start = int(start_text)
+            end = int(end_text) if end_text else file_size - 1
+            end = min(end, file_size - 1)
+    except ValueError:
+        raise ValueError("Malformed Range header")
+    
+    if start >= file_size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def is_not_modified(headers, etag, mtime):
+    """
+    Evaluate If-None-Match / If-Modified-Since (lower-cased header names) against
+    the current file; If-Modified-Since is ignored when If-None-Match is present
+    """
+    if_none_match = headers.get('if-none-match')
+    if if_none_match is not None:
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        # Weak comparison: W/"x" matches "x"
+        candidates = [tag[2:] if tag.startswith('W/') else tag for tag in candidates]
+        return '*' in candidates or etag in candidates
+    
+    if_modified_since = headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError, IndexError):
+            return False
+        return int(mtime) <= int(since)
+    
+    return False
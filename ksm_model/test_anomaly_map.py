@@ -0,0 +1,59 @@
+"""
+Unit tests for anomaly_map (recipe packing, client encodings and rendering)
+"""
+import base64
+import json
+
+import numpy as np
+
+from anomaly_map import (
+    anomaly_map_png, describe_anomaly_map, normalize_anomaly_map, pack_anomaly_map,
+    render_heatmap, render_overlay, unpack_anomaly_map
+)
+
+
+def grid():
+    return np.linspace(0.5, 2.5, 28 * 28, dtype=np.float32).reshape(28, 28)
+
+
+def test_pack_round_trip():
+    anomaly_map = grid()
+    packed = json.loads(json.dumps(pack_anomaly_map(anomaly_map)))
+    np.testing.assert_array_equal(unpack_anomaly_map(packed), anomaly_map)
+
+
+def test_normalize_spans_uint8():
+    normalized = normalize_anomaly_map(grid())
+    assert normalized.dtype == np.uint8
+    assert normalized.min() == 0 and normalized.max() >= 254
+    assert not normalize_anomaly_map(np.ones((4, 4), np.float32)).any()
+
+
+def test_describe_uint8_maps_back_to_distances():
+    anomaly_map = grid()
+    block = describe_anomaly_map(anomaly_map, 'uint8', (280, 140))
+    assert block['shape'] == [28, 28]
+    assert block['scale'] == [10.0, 5.0]
+    values = np.frombuffer(base64.b64decode(block['data']), dtype=np.uint8).reshape(block['shape'])
+    distances = block['min'] + values / 255.0 * (block['max'] - block['min'])
+    np.testing.assert_allclose(distances, anomaly_map, atol=(block['max'] - block['min']) / 255.0)
+
+
+def test_describe_float16_carries_distances():
+    anomaly_map = grid()
+    block = describe_anomaly_map(anomaly_map, 'float16', (28, 28))
+    values = np.frombuffer(base64.b64decode(block['data']), dtype='<f2').reshape(block['shape'])
+    np.testing.assert_allclose(values, anomaly_map, rtol=1e-3)
+
+
+def test_describe_png_has_no_inline_data():
+    block = describe_anomaly_map(grid(), 'png', (28, 28))
+    assert 'data' not in block
+    assert anomaly_map_png(grid()).shape == (28, 28)
+
+
+def test_render_sizes():
+    heatmap = render_heatmap(grid(), (120, 80))
+    assert heatmap.shape == (120, 80, 3)
+    leaf = np.full((60, 40, 3), 100, np.uint8)
+    assert render_overlay(leaf, grid()).shape == leaf.shape
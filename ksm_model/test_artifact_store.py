@@ -0,0 +1,83 @@
+"""
+Unit tests for artifact_store (LRU eviction, recipes and pinned recipe sources)
+"""
+import sqlite3
+
+from artifact_store import ArtifactStore
+
+
+def test_lru_eviction_keeps_store_under_cap(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_bytes=250, ttl=None)
+    for name in ('aa/a.jpg', 'aa/b.jpg', 'aa/c.jpg'):
+        store.put(name, b'x' * 100)
+    assert not store.contains('aa/a.jpg')
+    assert store.contains('aa/b.jpg') and store.contains('aa/c.jpg')
+    assert store.total_bytes() == 200
+
+
+def test_recipe_source_is_not_evicted(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_bytes=250, ttl=None)
+    store.put('aa/leaf-1.jpg', b'x' * 100)
+    store.put_recipe('aa/overlay-1.jpg', {'kind': 'overlay'}, source='aa/leaf-1.jpg')
+    store.put('aa/b.jpg', b'x' * 100)
+    store.put('aa/c.jpg', b'x' * 100)
+    assert store.contains('aa/leaf-1.jpg')
+    assert not store.contains('aa/b.jpg')
+
+
+def test_recipes_share_data(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    packed = {'shape': [2, 2], 'data': 'AAAA'}
+    store.put_recipe('aa/heatmap-1.jpg', {'kind': 'heatmap'}, data_key='map-1', data=packed)
+    store.put_recipe('aa/overlay-1.jpg', {'kind': 'overlay'}, data_key='map-1', data=packed)
+    assert store.recipe('aa/heatmap-1.jpg') == {'kind': 'heatmap', 'data': packed}
+    assert store.recipe('aa/overlay-1.jpg')['data'] == packed
+    assert store._connection().execute("SELECT COUNT(*) FROM recipe_data").fetchone()[0] == 1
+    assert store.recipe('aa/missing.jpg') is None
+
+
+def test_ttl_sweep_of_many_expired_artifacts(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_bytes=10, ttl=60)
+    store.put('aa/fresh.jpg', b'x' * 10)
+    # More expired names than SQLite accepts as bound variables in one statement
+    conn = store._connection()
+    conn.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    conn.executemany(
+        "INSERT INTO artifacts (name, size, created_at, last_access) VALUES (?, 1, 0, 0)",
+        ((f"aa/{i}.jpg",) for i in range(2000))
+    )
+    assert store.evict(force_sweep=True) == 2000
+    assert store.total_bytes() == 10
+
+
+def test_private_files_have_no_path(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    for name in ('.artifact_index.sqlite3', '.artifact_index.sqlite3-wal', 'aa/.hidden.jpg',
+                 'aa/leaf-1.jpg.123.456.tmp', '../outside.jpg', 'aa/../../outside.jpg'):
+        assert store.path(name) is None, name
+    assert store.path('aa/leaf-1.jpg') == str(tmp_path / 'aa' / 'leaf-1.jpg')
+
+
+def test_pinned_sources_do_not_exceed_cap(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_bytes=250, ttl=None)
+    for i in range(4):
+        # As in the server, the recipe is registered before the leaf is written
+        store.put_recipe(f"aa/overlay-{i}.jpg", {'kind': 'overlay'}, source=f"aa/leaf-{i}.jpg")
+        store.put(f"aa/leaf-{i}.jpg", b'x' * 100)
+    assert store.total_bytes() <= 250
+    # The oldest recipes went with their sources; the newest are intact
+    assert store.recipe('aa/overlay-0.jpg') is None and not store.contains('aa/leaf-0.jpg')
+    assert store.recipe('aa/overlay-3.jpg') is not None and store.contains('aa/leaf-3.jpg')
+
+
+def test_byte_total_follows_writes_and_evictions(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_bytes=1000, ttl=None)
+    store.put('aa/a.jpg', b'x' * 100)
+    store.put('aa/b.jpg', b'x' * 300)
+    store.put('aa/a.jpg', b'x' * 50)
+    assert store.total_bytes() == 350
+    store.put('aa/c.jpg', b'x' * 900)
+    assert store.total_bytes() == 950
+    store.close()
+    # The total survives a reopen, and an index from before it existed is counted once
+    assert ArtifactStore(str(tmp_path)).total_bytes() == 950
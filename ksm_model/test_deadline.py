@@ -0,0 +1,67 @@
+"""
+Unit tests for deadline (budget parsing, expiry, disconnects and shed-work summaries)
+"""
+import time
+
+import pytest
+
+from deadline import MAX_DEADLINE_MS, Deadline, DeadlineExceeded, parse_deadline_ms
+
+
+def test_parse_deadline_ms():
+    assert parse_deadline_ms({}, {}) is None
+    assert parse_deadline_ms({}, {}, default_ms=500) == 500
+    assert parse_deadline_ms({}, {'deadline_ms': ['800']}) == 800
+    assert parse_deadline_ms({'x-deadline-ms': '250.7'}, {'deadline_ms': ['800']}) == 250
+
+
+@pytest.mark.parametrize('value', ['abc', '0', '-5', str(MAX_DEADLINE_MS + 1)])
+def test_parse_deadline_ms_rejects(value):
+    with pytest.raises(ValueError):
+        parse_deadline_ms({}, {'deadline_ms': [value]})
+
+
+def test_unbounded_deadline_never_expires():
+    deadline = Deadline()
+    assert not deadline.expired()
+    assert deadline.can_afford(3600)
+    deadline.check('stage')
+
+
+def test_expired_deadline_raises():
+    deadline = Deadline(budget_ms=1)
+    time.sleep(0.01)
+    assert deadline.remaining() == 0.0
+    assert not deadline.can_afford(0.001)
+    with pytest.raises(DeadlineExceeded) as raised:
+        deadline.check('segmentation')
+    assert not raised.value.cancelled
+    assert 'segmentation' in str(raised.value)
+
+
+def test_client_disconnect_cancels():
+    gone = []
+    deadline = Deadline(budget_ms=10000, disconnect_probe=lambda: bool(gone))
+    deadline.check('download')
+    gone.append(True)
+    with pytest.raises(DeadlineExceeded) as raised:
+        deadline.check('download')
+    assert raised.value.cancelled
+    # Once seen, the disconnect sticks without probing again
+    gone.clear()
+    assert deadline.client_gone()
+
+
+def test_summary_reports_work_shed_since():
+    deadline = Deadline(budget_ms=1000)
+    summary = deadline.summary()
+    assert summary['budget_ms'] == 1000
+    assert not summary['degraded'] and summary['skipped'] == {}
+    deadline.skip('heatmap')
+    before = dict(deadline.skipped)
+    deadline.skip('heatmap', 2)
+    deadline.skip('leaf')
+    assert deadline.summary()['skipped'] == {'heatmap': 3, 'leaf': 1}
+    summary = deadline.summary(since=before)
+    assert summary['degraded']
+    assert summary['skipped'] == {'heatmap': 2, 'leaf': 1}
@@ -0,0 +1,133 @@
+"""
+Unit tests for job_queue (claim order, recovery, dead workers, attempts cap and purge)
+"""
+import os
+import time
+
+from job_queue import (
+    MAX_JOB_ATTEMPTS, STATUS_COMPLETED, STATUS_FAILED, STATUS_QUEUED, STATUS_RUNNING, JobQueue
+)
+
+
+def make_queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.sqlite3'))
+
+
+def test_claim_takes_oldest_first(tmp_path):
+    queue = make_queue(tmp_path)
+    first = queue.submit({'url': 'a'})
+    second = queue.submit({'url': 'b'})
+    assert queue.depth() == 2
+
+    job = queue.claim(timeout=0)
+    assert job['id'] == first['id']
+    assert job['status'] == STATUS_RUNNING
+    assert job['attempts'] == 1
+    assert job['worker_pid'] == os.getpid()
+    assert queue.claim(timeout=0)['id'] == second['id']
+    assert queue.claim(timeout=0.05) is None
+
+
+def test_complete_and_fail(tmp_path):
+    queue = make_queue(tmp_path)
+    done = queue.submit({'url': 'a'})
+    broken = queue.submit({'url': 'b'})
+    queue.claim(timeout=0)
+    queue.claim(timeout=0)
+    queue.complete(done['id'], {'leafs': []})
+    queue.fail(broken['id'], ValueError('no leaves'))
+    assert queue.get(done['id'])['result'] == {'leafs': []}
+    assert queue.get(done['id'])['status'] == STATUS_COMPLETED
+    assert queue.get(broken['id'])['error'] == 'no leaves'
+    assert queue.get('unknown') is None
+
+
+def test_recover_requeues_running_jobs(tmp_path):
+    queue = make_queue(tmp_path)
+    job = queue.submit({'url': 'a'})
+    queue.claim(timeout=0)
+    assert queue.recover() == (1, 0)
+    assert queue.get(job['id'])['status'] == STATUS_QUEUED
+    assert queue.claim(timeout=0)['attempts'] == 2
+
+
+def test_requeue_worker_only_touches_that_worker(tmp_path):
+    queue = make_queue(tmp_path)
+    job = queue.submit({'url': 'a'})
+    queue.claim(timeout=0)
+    assert queue.requeue_worker(os.getpid() + 1) == (0, 0)
+    assert queue.requeue_worker(os.getpid()) == (1, 0)
+    assert queue.get(job['id'])['worker_pid'] is None
+
+
+def test_job_that_keeps_killing_workers_fails(tmp_path):
+    queue = make_queue(tmp_path)
+    job = queue.submit({'url': 'a'})
+    for _ in range(MAX_JOB_ATTEMPTS - 1):
+        queue.claim(timeout=0)
+        assert queue.requeue_worker(os.getpid()) == (1, 0)
+    queue.claim(timeout=0)
+    assert queue.requeue_worker(os.getpid()) == (0, 1)
+
+    failed = queue.get(job['id'])
+    assert failed['status'] == STATUS_FAILED
+    assert 'interrupted' in failed['error']
+    assert queue.claim(timeout=0) is None
+    assert queue.recover() == (0, 0)
+
+
+def test_purge_removes_old_finished_jobs(tmp_path):
+    queue = make_queue(tmp_path)
+    old = queue.submit({'url': 'a'})
+    waiting = queue.submit({'url': 'b'})
+    queue.claim(timeout=0)
+    queue.complete(old['id'], {})
+    time.sleep(0.01)
+    assert queue.purge(max_age=60) == 0
+    assert queue.purge(max_age=0) == 1
+    assert queue.get(old['id']) is None
+    assert queue.get(waiting['id'])['status'] == STATUS_QUEUED
+
+
+def test_finished_job_schedules_its_callback(tmp_path):
+    queue = make_queue(tmp_path)
+    silent = queue.submit({'url': 'a'})
+    hooked = queue.submit({'url': 'b'}, callback_url='http://backend/hook')
+    queue.claim(timeout=0)
+    queue.claim(timeout=0)
+    assert queue.claim_callback() is None
+    queue.complete(silent['id'], {})
+    queue.fail(hooked['id'], 'boom')
+    assert queue.get(silent['id'])['callback_status'] is None
+
+    job = queue.claim_callback()
+    assert job['id'] == hooked['id']
+    assert job['callback_attempts'] == 1
+    # Claimed deliveries are leased, not handed out twice
+    assert queue.claim_callback() is None
+    queue.finish_callback(job['id'], 'delivered (200)')
+    assert queue.get(job['id'])['callback_status'] == 'delivered (200)'
+
+
+def test_failed_callbacks_retry_then_give_up(tmp_path, monkeypatch):
+    import job_queue
+    monkeypatch.setattr(job_queue, 'CALLBACK_BACKOFF', 0.0)
+    queue = make_queue(tmp_path)
+    job = queue.submit({'url': 'a'}, callback_url='http://backend/hook')
+    queue.claim(timeout=0)
+    queue.complete(job['id'], {})
+    for attempt in range(1, job_queue.CALLBACK_ATTEMPTS + 1):
+        claimed = queue.claim_callback()
+        assert claimed['callback_attempts'] == attempt
+        queue.finish_callback(claimed['id'])
+    assert queue.get(job['id'])['callback_status'] == job_queue.CALLBACK_FAILED
+    assert queue.claim_callback() is None
+
+
+def test_callback_survives_a_restart(tmp_path):
+    queue = make_queue(tmp_path)
+    job = queue.submit({'url': 'a'}, callback_url='http://backend/hook')
+    queue.claim(timeout=0)
+    queue.complete(job['id'], {})
+    queue.close()
+    assert make_queue(tmp_path).claim_callback()['id'] == job['id']
@@ -0,0 +1,76 @@
+"""
+Unit tests for leaf_tiling (tile layout, when to tile, cross-tile box merging)
+"""
+import numpy as np
+
+from leaf_tiling import TILE_SIZE, tile_starts, tile_grid, tiling_reason, merge_boxes
+
+
+def boxes(*rows):
+    return np.array(rows, dtype=np.float32).reshape(-1, 4)
+
+
+def test_tile_starts_cover_length():
+    starts = tile_starts(3000, 1280, overlap=0.2)
+    assert starts[0] == 0
+    assert starts[-1] == 3000 - 1280
+    # Neighbouring tiles overlap, so no gap is left between them
+    assert all(b - a <= 1280 for a, b in zip(starts, starts[1:]))
+
+
+def test_single_tile_when_frame_fits():
+    assert tile_starts(1280, 1280) == [0]
+    assert tile_grid(720, 1280) == [(0, 0, 1280, 720)]
+    assert tile_grid(960, 1280) == [(0, 0, 1280, 960)]
+
+
+def test_tile_grid_large_frame():
+    tiles = tile_grid(3024, 4032)
+    assert len(tiles) == 12
+    assert max(x2 for _, _, x2, _ in tiles) == 4032
+    assert max(y2 for _, _, _, y2 in tiles) == 3024
+
+
+def test_no_tiling_for_single_tile_frames():
+    small = boxes((0, 0, 20, 20))
+    # Exactly twice the detection size, and one tile: nothing to gain
+    assert tiling_reason((720, 1280, 3), small, 640, 'on') is None
+    assert tiling_reason((960, 1280, 3), small, 640, 'auto') is None
+    # Large enough for the downscale test, but still one tile
+    assert tiling_reason((900, 1200, 3), small, 480, 'on') is None
+
+
+def test_off_mode_never_tiles():
+    assert tiling_reason((3024, 4032, 3), boxes(), 640, 'off') is None
+
+
+def test_forced_and_small_leaves():
+    shape = (3024, 4032, 3)
+    big = boxes((0, 0, 1000, 1000))
+    small = boxes((0, 0, 100, 100), (200, 200, 300, 300))
+    assert tiling_reason(shape, big, 640, 'on') == 'forced'
+    assert tiling_reason(shape, big, 640, 'auto') is None
+    assert tiling_reason(shape, small, 640, 'auto') == 'small_leaves'
+
+
+def test_empty_frames_only_tiled_on_request():
+    shape = (3024, 4032, 3)
+    assert tiling_reason(shape, boxes(), 640, 'auto') is None
+    assert tiling_reason(shape, boxes(), 640, 'auto', TILE_SIZE, empty_frames=True) == 'no_leaves'
+
+
+def test_merge_boxes_drops_overlap_and_contained():
+    xyxy = boxes(
+        (0, 0, 100, 100),       # kept
+        (5, 5, 105, 105),       # IoU with the first above the threshold
+        (10, 10, 60, 90),       # inside the first: the same leaf cut by a tile border
+        (300, 300, 400, 400)    # separate leaf
+    )
+    assert merge_boxes(xyxy, [0.9, 0.8, 0.7, 0.6], iou_threshold=0.5) == [0, 3]
+
+
+def test_merge_boxes_keeps_larger_box_under_confident_part():
+    # A confident partial view does not swallow the whole leaf: containment is
+    # measured on the box being dropped, and the whole leaf is mostly outside the part
+    xyxy = boxes((0, 0, 100, 100), (10, 10, 60, 90))
+    assert merge_boxes(xyxy, [0.7, 0.9], iou_threshold=0.5) == [1, 0]
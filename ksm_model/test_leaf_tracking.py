@@ -0,0 +1,136 @@
+"""
+Unit tests for leaf_tracking (frame sampling, box association, best-view selection)
+"""
+import cv2
+import numpy as np
+import pytest
+
+from leaf_tracking import (
+    LeafTracker, box_iou, fit_mask, view_quality, iter_frames, iter_video_frames, iter_burst_frames
+)
+
+
+def ellipse_mask(image, box):
+    """Stand-in for SAM: an ellipse filling the box"""
+    x1, y1, x2, y2 = box
+    mask = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+    cv2.ellipse(mask, ((x2 - x1) // 2, (y2 - y1) // 2), ((x2 - x1) // 2, (y2 - y1) // 2), 0, 0, 360, 1, -1)
+    return mask > 0
+
+
+def leaf_frame(center, blur=False, size=(360, 640)):
+    """Dark frame with one textured green leaf"""
+    frame = np.full(size + (3,), 40, dtype=np.uint8)
+    cv2.ellipse(frame, center, (40, 25), 0, 0, 360, (30, 180, 60), -1)
+    for dx in range(-30, 31, 6):
+        cv2.line(frame, (center[0] + dx, center[1] - 20), (center[0] + dx, center[1] + 20), (20, 120, 40), 1)
+    return cv2.GaussianBlur(frame, (21, 21), 0) if blur else frame
+
+
+def leaf_box(center):
+    return (center[0] - 40, center[1] - 25, center[0] + 40, center[1] + 25)
+
+
+def test_box_iou():
+    assert box_iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert box_iou((0, 0, 10, 10), (20, 20, 30, 30)) == 0.0
+    assert abs(box_iou((0, 0, 10, 10), (5, 0, 15, 10)) - 1 / 3) < 1e-9
+
+
+def test_fit_mask_scales_to_box():
+    template = np.ones((10, 20), dtype=bool)
+    mask = fit_mask(template, (5, 5, 45, 25))
+    assert mask.shape == (20, 40)
+    assert mask.all()
+
+
+def test_blurred_and_edge_views_score_lower():
+    center = (200, 150)
+    box = leaf_box(center)
+    mask = ellipse_mask(None, box)
+    sharp = view_quality(leaf_frame(center), box, mask, 0.9)
+    blurred = view_quality(leaf_frame(center, blur=True), box, mask, 0.9)
+    assert sharp > blurred
+
+    edge_center = (40, 150)
+    edge_box = leaf_box(edge_center)
+    at_edge = view_quality(leaf_frame(edge_center), edge_box, ellipse_mask(None, edge_box), 0.9)
+    assert at_edge < sharp
+
+
+def test_tracker_follows_moving_leaf_and_segments_once():
+    tracker = LeafTracker()
+    calls = []
+
+    def segment(image, box):
+        calls.append(box)
+        return ellipse_mask(image, box)
+
+    for i in range(6):
+        center = (100 + 15 * i, 150)
+        tracker.update(i, leaf_frame(center, blur=(i != 3)), np.array([leaf_box(center)], float), [0.9],
+                       segment, seconds=i / 5)
+    tracks = tracker.finish()
+
+    assert len(tracks) == 1
+    track = tracks[0]
+    assert (track.first_frame, track.last_frame, track.hits) == (0, 5, 6)
+    # SAM ran once, when the track was confirmed on its second detection
+    assert len(calls) == 1
+    assert track.best['frame_index'] == 3
+    assert tracker.frames_sampled == 6
+    assert tracker.report(0.6)['realtime_factor'] == 1.0 / 0.6
+
+
+def test_single_detection_is_dropped():
+    tracker = LeafTracker()
+    center = (200, 150)
+    tracker.update(0, leaf_frame(center), np.array([leaf_box(center)], float), [0.9], ellipse_mask)
+    for i in range(1, 6):
+        tracker.update(i, leaf_frame(center), np.zeros((0, 4)), [], ellipse_mask)
+    assert tracker.finish() == []
+    assert tracker.dropped == 1
+    assert tracker.segmentations == 0
+
+
+def test_separate_leaves_get_separate_tracks():
+    tracker = LeafTracker()
+    for i in range(3):
+        frame = leaf_frame((150, 100))
+        tracker.update(i, frame, np.array([leaf_box((150, 100)), leaf_box((450, 250))], float), [0.9, 0.8],
+                       ellipse_mask)
+    assert [track.track_id for track in tracker.finish()] == [1, 2]
+
+
+def test_best_view_mask_covers_context():
+    tracker = LeafTracker()
+    center = (300, 150)
+    for i in range(2):
+        tracker.update(i, leaf_frame(center), np.array([leaf_box(center)], float), [0.9], ellipse_mask)
+    track = tracker.finish()[0]
+    mask = tracker.best_view_mask(track, ellipse_mask)
+    assert mask.shape == track.best['context'].shape[:2]
+    assert mask.any() and not mask.all()
+
+
+def test_burst_frames_keep_order():
+    assert [index for index, _, _ in iter_burst_frames(['a', 'b', 'c'])] == [0, 1, 2]
+    assert [frame for _, _, frame in iter_frames(['a', 'b'])] == ['a', 'b']
+
+
+def test_video_frames_are_sampled(tmp_path):
+    path = str(tmp_path / 'clip.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (64, 48))
+    for _ in range(30):
+        writer.write(np.zeros((48, 64, 3), dtype=np.uint8))
+    writer.release()
+
+    indices = [index for index, _, _ in iter_video_frames(path, sample_fps=5)]
+    assert indices == [0, 6, 12, 18, 24]
+
+
+def test_unreadable_video_raises(tmp_path):
+    path = tmp_path / 'broken.mp4'
+    path.write_bytes(b'not a video')
+    with pytest.raises(ValueError):
+        list(iter_video_frames(str(path)))
@@ -0,0 +1,45 @@
+"""
+Unit tests for lesion_rules (lookup-table labelling and one disease per lesion)
+"""
+import cv2
+import numpy as np
+
+from disease_characteristics import DISEASE_CHARACTERISTICS
+from lesion_rules import LesionRuleEngine, _range_lut
+
+HEALTHY_HSV = (60, 150, 120)
+SPOT_HSV = (15, 160, 100)       # Inside the Leaf Blight, Anthracnose and both Bacterial Spot ranges
+
+
+def leaf_with_spots(centers, radius=10):
+    hsv = np.zeros((256, 256, 3), np.uint8)
+    hsv[:] = HEALTHY_HSV
+    for center in centers:
+        cv2.circle(hsv, center, radius, SPOT_HSV, -1)
+    return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+
+
+def test_range_lut_ors_flags():
+    lut = _range_lut([(0, 10, 1), (5, 20, 2)])
+    assert lut[0] == 1 and lut[7] == 3 and lut[20] == 2 and lut[21] == 0
+
+
+def test_healthy_leaf_has_no_lesions():
+    assert LesionRuleEngine().classify(leaf_with_spots([])) is None
+
+
+def test_each_spot_counts_toward_one_disease():
+    result = LesionRuleEngine().classify(leaf_with_spots([(60, 60), (180, 80), (120, 190)]))
+    assert len(result['disease_info']) == 1
+    info = result['disease_info'][0]
+    assert info['lesions'] == 3
+    assert info['percentage'] == result['total_disease_percentage']
+    assert sum(d['pixels'] for d in result['disease_info']) == result['total_disease_pixels']
+
+
+def test_ties_go_to_the_disease_listed_first():
+    spec = DISEASE_CHARACTERISTICS['Anthracnose']
+    characteristics = {'First': spec, 'Second': spec}
+    result = LesionRuleEngine(characteristics).classify(leaf_with_spots([(60, 60), (180, 180)]))
+    assert [d['name'] for d in result['disease_info']] == ['First']
+    assert result['disease_info'][0]['lesions'] == 2
@@ -0,0 +1,49 @@
+"""Tests for merging pre-fork worker metrics"""
+
+import os
+import json
+
+from metrics import MetricsRegistry, MultiprocessMetrics
+
+
+def worker_registry(requests, rss):
+    registry = MetricsRegistry()
+    registry.counter('requests_total', 'Requests').inc(requests, endpoint='process')
+    registry.histogram('latency_seconds', 'Latency', (0.1, 1.0)).observe(0.5)
+    registry.gauge('rss_bytes', 'RSS', lambda: rss)
+    return registry
+
+
+def write_snapshot(directory, registry, worker, pid):
+    """Snapshot of a worker other than the test process"""
+    data = {'pid': pid, 'worker': str(worker), 'metrics': registry.snapshot()}
+    with open(os.path.join(directory, f"worker-{pid}.json"), 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+
+def test_counters_and_histograms_are_summed(tmp_path):
+    write_snapshot(str(tmp_path), worker_registry(3, 200), 1, os.getppid())
+    text = MultiprocessMetrics(str(tmp_path), worker_registry(2, 100), 0).render()
+
+    assert 'ksm_requests_total{endpoint="process"} 5' in text
+    assert 'ksm_latency_seconds_count 2' in text
+    assert 'ksm_latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'ksm_rss_bytes{worker="0"} 100' in text
+    assert 'ksm_rss_bytes{worker="1"} 200' in text
+    assert text.count('# TYPE ksm_requests_total counter') == 1
+
+
+def test_dead_workers_keep_counters_but_drop_gauges(tmp_path):
+    write_snapshot(str(tmp_path), worker_registry(4, 300), 3, 999999999)
+    text = MultiprocessMetrics(str(tmp_path), worker_registry(1, 100), 0).render()
+
+    assert 'ksm_requests_total{endpoint="process"} 5' in text
+    assert 'ksm_rss_bytes{worker="0"} 100' in text
+    assert 'worker="3"' not in text
+
+
+def test_unreadable_snapshots_are_skipped(tmp_path):
+    (tmp_path / 'worker-1.json').write_text('{"pid": 1, "wor', encoding='utf-8')
+    text = MultiprocessMetrics(str(tmp_path), worker_registry(1, 100), 0).render()
+
+    assert 'ksm_requests_total{endpoint="process"} 1' in text
@@ -0,0 +1,79 @@
+"""
+Unit tests for quality_gate (threshold parsing, blur, exposure and vegetation verdicts)
+"""
+import cv2
+import numpy as np
+import pytest
+
+from quality_gate import DEFAULT_GATE_THRESHOLDS, QualityGate, parse_gate_thresholds
+
+
+def leaf_photo(size=(1500, 2000), seed=0):
+    """Green, textured, leaf-like BGR photo"""
+    height, width = size
+    rng = np.random.default_rng(seed)
+    texture = cv2.resize((rng.standard_normal((height // 4, width // 4)) * 40).astype(np.float32), (width, height))
+    img = np.clip(np.array([40, 120, 60], np.float32) + texture[..., None], 0, 255).astype(np.uint8)
+    for x in range(0, width, 60):
+        cv2.line(img, (x, 0), (x + 300, height), (20, 90, 40), 3)
+    return img
+
+
+def check(tmp_path, img, thresholds=None):
+    path = str(tmp_path / 'photo.png')
+    cv2.imwrite(path, img)
+    return QualityGate(thresholds).check(path)
+
+
+def test_parse_gate_thresholds():
+    assert parse_gate_thresholds('off') is None
+    assert parse_gate_thresholds(' ON ') == DEFAULT_GATE_THRESHOLDS
+    thresholds = parse_gate_thresholds('min_sharpness=10, min_green_ratio=0.02')
+    assert thresholds['min_sharpness'] == 10.0
+    assert thresholds['min_green_ratio'] == 0.02
+    assert thresholds['max_brightness'] == DEFAULT_GATE_THRESHOLDS['max_brightness']
+
+
+def test_parse_gate_thresholds_rejects_unknown_name():
+    with pytest.raises(ValueError):
+        parse_gate_thresholds('min_focus=3')
+
+
+def test_sharp_leaf_passes(tmp_path):
+    verdict = check(tmp_path, leaf_photo())
+    assert verdict['passed'], verdict
+    assert verdict['reason'] is None
+
+
+def test_blurred_leaf_is_blurry(tmp_path):
+    verdict = check(tmp_path, cv2.GaussianBlur(leaf_photo(), (0, 0), 8))
+    assert verdict['reason'] == 'blurry'
+
+
+def test_sharp_leaf_on_soft_background_passes(tmp_path):
+    img = leaf_photo()
+    background = cv2.GaussianBlur(img, (0, 0), 15)
+    mask = np.zeros(img.shape[:2], np.uint8)
+    cv2.ellipse(mask, (1000, 750), (400, 300), 0, 0, 360, 1, -1)
+    verdict = check(tmp_path, np.where(mask[..., None] > 0, img, background))
+    assert verdict['passed'], verdict
+
+
+def test_exposure(tmp_path):
+    assert check(tmp_path, np.full((600, 800, 3), 10, np.uint8))['reason'] == 'underexposed'
+    assert check(tmp_path, np.full((600, 800, 3), 250, np.uint8))['reason'] == 'overexposed'
+
+
+def test_no_vegetation(tmp_path):
+    gray = cv2.cvtColor(leaf_photo(), cv2.COLOR_BGR2GRAY)
+    verdict = check(tmp_path, cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))
+    assert verdict['reason'] == 'no_vegetation'
+    assert check(tmp_path, cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR), {'min_green_ratio': 0.0})['passed']
+
+
+def test_unreadable(tmp_path):
+    path = tmp_path / 'photo.jpg'
+    path.write_bytes(b'not an image')
+    verdict = QualityGate().check(str(path))
+    assert not verdict['passed']
+    assert verdict['reason'] == 'unreadable'
@@ -0,0 +1,106 @@
+"""
+Unit tests for replica_pool (lane priority, bulk aging, timeouts, waiter cleanup)
+"""
+import time
+import threading
+
+import pytest
+
+from replica_pool import ReplicaPool
+
+
+def make_pool(size=1, **kwargs):
+    return ReplicaPool(lambda index, device: f"replica-{index}", size=size, devices=['cpu'], **kwargs)
+
+
+def wait_for_waiters(pool, count):
+    """Block until count checkouts are queued"""
+    deadline = time.time() + 2
+    while sum(len(waiters) for waiters in pool.waiters.values()) < count:
+        assert time.time() < deadline, "waiters never queued"
+        time.sleep(0.005)
+
+
+def queue_checkout(pool, lane, order):
+    def run():
+        with pool.checkout(timeout=2, lane=lane):
+            order.append(lane)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def serve_bulk_then_interactive(pool):
+    """Queue a bulk then an interactive checkout behind a held replica; returns grant order"""
+    order = []
+    with pool.checkout():
+        threads = [queue_checkout(pool, 'bulk', order)]
+        wait_for_waiters(pool, 1)
+        threads.append(queue_checkout(pool, 'interactive', order))
+        wait_for_waiters(pool, 2)
+    for thread in threads:
+        thread.join()
+    return order
+
+
+def test_checkout_returns_replica():
+    pool = make_pool(size=2)
+    with pool.checkout() as first, pool.checkout() as second:
+        assert {first, second} == {'replica-0', 'replica-1'}
+        assert pool.busy_count() == 2
+    assert pool.busy_count() == 0
+
+
+def test_unknown_lane():
+    with pytest.raises(ValueError):
+        with make_pool().checkout(lane='urgent'):
+            pass
+
+
+def test_interactive_served_before_bulk():
+    assert serve_bulk_then_interactive(make_pool(aging_seconds=60)) == ['interactive', 'bulk']
+
+
+def test_aged_bulk_served_first():
+    assert serve_bulk_then_interactive(make_pool(aging_seconds=0)) == ['bulk', 'interactive']
+
+
+def test_timeout_removes_waiter():
+    pool = make_pool()
+    with pool.checkout():
+        with pytest.raises(TimeoutError):
+            with pool.checkout(timeout=0.05, lane='bulk'):
+                pass
+    assert all(not waiters for waiters in pool.waiters.values())
+
+
+def test_zero_aging_does_not_spin():
+    pool = make_pool(aging_seconds=0)
+    waits = []
+    wait = pool.changed.wait
+    pool.changed.wait = lambda timeout=None: waits.append(timeout) or wait(timeout)
+    with pool.checkout():
+        with pytest.raises(TimeoutError):
+            with pool.checkout(timeout=0.3, lane='bulk'):
+                pass
+    assert waits and min(waits) > 0
+    assert len(waits) < 20
+
+
+def test_interrupted_wait_removes_waiter():
+    pool = make_pool()
+    wait = pool.changed.wait
+
+    def interrupted(timeout=None):
+        raise KeyboardInterrupt
+
+    with pool.checkout():
+        pool.changed.wait = interrupted
+        with pytest.raises(KeyboardInterrupt):
+            with pool.checkout(lane='bulk'):
+                pass
+        pool.changed.wait = wait
+    assert all(not waiters for waiters in pool.waiters.values())
+    # The lane is not stalled by a stale head
+    with pool.checkout(timeout=0.5, lane='bulk') as replica:
+        assert replica == 'replica-0'
@@ -0,0 +1,37 @@
+"""
+Unit tests for request_profiler (admin token checks and capture triggers)
+"""
+import pytest
+
+from request_profiler import ADMIN_TOKEN_ENV, ADMIN_TOKEN_HEADER, PROFILE_PARAM, RequestProfiler, is_admin
+
+
+def test_is_admin(monkeypatch):
+    monkeypatch.setenv(ADMIN_TOKEN_ENV, 'secret')
+    assert is_admin({ADMIN_TOKEN_HEADER: 'secret'})
+    assert not is_admin({ADMIN_TOKEN_HEADER: 'wrong'})
+    assert not is_admin({})
+    assert not is_admin(None)
+
+
+def test_is_admin_without_configured_token(monkeypatch):
+    monkeypatch.delenv(ADMIN_TOKEN_ENV, raising=False)
+    assert not is_admin({ADMIN_TOKEN_HEADER: 'secret'})
+
+
+def test_is_admin_non_ascii(monkeypatch):
+    monkeypatch.setenv(ADMIN_TOKEN_ENV, 'sécret')
+    assert is_admin({ADMIN_TOKEN_HEADER: 'sécret'})
+    assert not is_admin({ADMIN_TOKEN_HEADER: 'sêcret'})
+    monkeypatch.setenv(ADMIN_TOKEN_ENV, 'secret')
+    assert not is_admin({ADMIN_TOKEN_HEADER: 'sécret'})
+
+
+def test_trigger(monkeypatch):
+    monkeypatch.setenv(ADMIN_TOKEN_ENV, 'secret')
+    profiler = RequestProfiler(store=None)
+    assert profiler.trigger({}, {}) is None
+    assert profiler.trigger({ADMIN_TOKEN_HEADER: 'secret'}, {PROFILE_PARAM: ['1']}) == 'admin'
+    with pytest.raises(PermissionError):
+        profiler.trigger({ADMIN_TOKEN_HEADER: 'wrong'}, {PROFILE_PARAM: ['1']})
+    assert RequestProfiler(store=None, sample_rate=1.0).trigger({}, {}) == 'sampled'
@@ -0,0 +1,121 @@
+"""
+Unit tests for single_flight (coalescing, result copies, errors, timeouts and retries)
+"""
+import threading
+
+import pytest
+
+from single_flight import SingleFlight, file_digest
+
+
+def start_leader(flight, key, result=None, error=None):
+    """Begin a leader call that blocks until the returned event is set"""
+    release, started = threading.Event(), threading.Event()
+    outcome = {}
+
+    def work():
+        started.set()
+        release.wait(5)
+        if error is not None:
+            raise error
+        return result
+
+    def run():
+        try:
+            outcome['value'] = flight.do(key, work)
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    started.wait(5)
+    return release, thread, outcome
+
+
+def follow(flight, key, **kwargs):
+    """Attach a follower in a thread; returns (thread, outcome)"""
+    outcome = {}
+
+    def run():
+        try:
+            outcome['value'] = flight.do(key, lambda: {'own': True}, **kwargs)
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+
+def wait_for_followers(flight, key, count):
+    for _ in range(500):
+        with flight.lock:
+            if flight.calls[key].followers >= count:
+                return
+        threading.Event().wait(0.01)
+    raise AssertionError("followers did not attach")
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    release, leader, led = start_leader(flight, 'k', result={'leaves': [1]})
+    follower, followed = follow(flight, 'k')
+    wait_for_followers(flight, 'k', 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert led['value'] == ({'leaves': [1]}, False)
+    assert followed['value'] == ({'leaves': [1]}, True)
+    # Every caller gets its own copy
+    assert followed['value'][0] is not led['value'][0]
+    assert flight.in_flight() == 0
+
+
+def test_different_keys_do_not_share():
+    flight = SingleFlight()
+    release, leader, _ = start_leader(flight, 'a', result=1)
+    assert flight.do('b', lambda: 2) == (2, False)
+    release.set()
+    leader.join(5)
+
+
+def test_leader_error_reaches_followers():
+    flight = SingleFlight()
+    release, leader, led = start_leader(flight, 'k', error=RuntimeError('boom'))
+    follower, followed = follow(flight, 'k')
+    wait_for_followers(flight, 'k', 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert isinstance(led['error'], RuntimeError)
+    assert followed['error'] is led['error']
+
+
+def test_retry_runs_the_work_itself():
+    flight = SingleFlight()
+    release, leader, _ = start_leader(flight, 'k', error=RuntimeError('client gone'))
+    follower, followed = follow(flight, 'k', retry=lambda error: True)
+    wait_for_followers(flight, 'k', 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert followed['value'] == ({'own': True}, False)
+
+
+def test_follower_timeout():
+    flight = SingleFlight()
+    release, leader, _ = start_leader(flight, 'k', result=1)
+    with pytest.raises(TimeoutError):
+        flight.do('k', lambda: 2, timeout=0.05)
+    release.set()
+    leader.join(5)
+
+
+def test_file_digest(tmp_path):
+    a, b = tmp_path / 'a.jpg', tmp_path / 'b.jpg'
+    a.write_bytes(b'leaf' * 1000)
+    b.write_bytes(b'leaf' * 1000)
+    assert file_digest(str(a)) == file_digest(str(b))
+    b.write_bytes(b'other')
+    assert file_digest(str(a)) != file_digest(str(b))
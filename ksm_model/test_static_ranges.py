@@ -0,0 +1,81 @@
+"""
+Unit tests for /static/ Range and conditional request handling
+"""
+import pytest
+from email.utils import formatdate
+
+from static_ranges import parse_byte_range, is_not_modified
+
+SIZE = 1000
+ETAG = '"abc-3e8"'
+MTIME = 1700000000.5
+
+
+def test_no_range_header_is_ignored():
+    assert parse_byte_range(None, SIZE) is None
+    assert parse_byte_range('', SIZE) is None
+    assert parse_byte_range('items=0-10', SIZE) is None
+
+
+def test_closed_range():
+    assert parse_byte_range('bytes=0-99', SIZE) == (0, 99)
+    assert parse_byte_range('bytes=500-500', SIZE) == (500, 500)
+
+
+def test_end_is_clamped_to_file_size():
+    assert parse_byte_range('bytes=900-5000', SIZE) == (900, 999)
+
+
+def test_open_ended_range():
+    assert parse_byte_range('bytes=100-', SIZE) == (100, 999)
+    assert parse_byte_range('bytes=999-', SIZE) == (999, 999)
+
+
+def test_suffix_range():
+    assert parse_byte_range('bytes=-100', SIZE) == (900, 999)
+    # A suffix longer than the file covers the whole file
+    assert parse_byte_range('bytes=-5000', SIZE) == (0, 999)
+
+
+@pytest.mark.parametrize('header', ['bytes=1000-', 'bytes=2000-3000', 'bytes=500-100', 'bytes=-0', 'bytes=a-b'])
+def test_unsatisfiable_range(header):
+    with pytest.raises(ValueError):
+        parse_byte_range(header, SIZE)
+
+
+def test_suffix_range_of_empty_file_is_unsatisfiable():
+    with pytest.raises(ValueError):
+        parse_byte_range('bytes=-10', 0)
+
+
+def test_multi_range_serves_full_file():
+    assert parse_byte_range('bytes=0-9,20-29', SIZE) is None
+    # One satisfiable range is enough to answer 200 with the whole file
+    assert parse_byte_range('bytes=5000-,0-9', SIZE) is None
+
+
+def test_multi_range_with_no_satisfiable_range():
+    with pytest.raises(ValueError):
+        parse_byte_range('bytes=1000-1100, 2000-', SIZE)
+
+
+def test_if_none_match():
+    assert is_not_modified({'if-none-match': ETAG}, ETAG, MTIME)
+    assert is_not_modified({'if-none-match': f'"other", W/{ETAG}'}, ETAG, MTIME)
+    assert is_not_modified({'if-none-match': '*'}, ETAG, MTIME)
+    assert not is_not_modified({'if-none-match': '"other"'}, ETAG, MTIME)
+
+
+def test_if_modified_since():
+    assert is_not_modified({'if-modified-since': formatdate(MTIME, usegmt=True)}, ETAG, MTIME)
+    assert is_not_modified({'if-modified-since': formatdate(MTIME + 60, usegmt=True)}, ETAG, MTIME)
+    assert not is_not_modified({'if-modified-since': formatdate(MTIME - 60, usegmt=True)}, ETAG, MTIME)
+    assert not is_not_modified({'if-modified-since': 'not a date'}, ETAG, MTIME)
+    assert not is_not_modified({}, ETAG, MTIME)
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since():
+    current = formatdate(MTIME, usegmt=True)
+    stale = formatdate(MTIME - 60, usegmt=True)
+    assert not is_not_modified({'if-none-match': '"other"', 'if-modified-since': current}, ETAG, MTIME)
+    assert is_not_modified({'if-none-match': ETAG, 'if-modified-since': stale}, ETAG, MTIME)